@@ -1,9 +1,26 @@
+import os
 from django import forms
+from django.conf import settings
 from .models import DataFile, Technician, Report
+from .utils.data_processor import FILE_READERS
+
+
+def validate_data_file(file):
+    """Check an uploaded data file's type and size"""
+    ext = os.path.splitext(file.name)[1].lower()
+    if ext not in FILE_READERS:
+        raise forms.ValidationError(
+            f"Unsupported file type. Allowed types: {', '.join(FILE_READERS)}."
+        )
+    
+    if file.size > settings.MAX_UPLOAD_SIZE:
+        raise forms.ValidationError(
+            f"File is too large. Maximum size is {settings.MAX_UPLOAD_SIZE // (1024 * 1024)} MB."
+        )
 
 
 class FileUploadForm(forms.ModelForm):
-    """Form for uploading Excel files"""
+    """Form for uploading trip data files"""
     class Meta:
         model = DataFile
         fields = ['file']
@@ -11,8 +28,7 @@ class FileUploadForm(forms.ModelForm):
     def clean_file(self):
         file = self.cleaned_data.get('file')
         if file:
-            if not file.name.endswith('.xlsx'):
-                raise forms.ValidationError("Only Excel files (.xlsx) are allowed.")
+            validate_data_file(file)
             
             # Store original filename
             self.instance.original_filename = file.name
@@ -20,6 +36,18 @@ class FileUploadForm(forms.ModelForm):
         return file
 
 
+class AppendFileForm(forms.Form):
+    """Form for appending new rows to an existing data file"""
+    file = forms.FileField()
+    
+    def clean_file(self):
+        file = self.cleaned_data.get('file')
+        if file:
+            validate_data_file(file)
+        
+        return file
+
+
 class TechnicianFilterForm(forms.Form):
     """Form for filtering by technician"""
     technician = forms.ModelChoiceField(
@@ -0,0 +1,91 @@
+import os
+import time
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from dashboard.models import DataFile, Technician
+from dashboard.utils.distance_analyzer import load_fleet_coordinates, parallel_segment_distance_sums
+from dashboard.utils.distance_kernels import segment_distance_sums
+
+
+def make_synthetic_coordinates(rows, technicians, seed=0):
+    """
+    Build coordinate arrays grouped by technician, like those from load_fleet_coordinates
+    
+    Args:
+        rows: Number of trips
+        technicians: Number of distinct technicians
+        seed: Random seed
+    
+    Returns:
+        tuple: Arrays of technician position, latitude and longitude
+    """
+    rng = np.random.default_rng(seed)
+    
+    positions = np.sort(rng.integers(0, technicians, rows))
+    latitude = 17.3 + rng.random(rows) / 10
+    longitude = 78.4 + rng.random(rows) / 10
+    
+    return positions, latitude, longitude
+
+
+class Command(BaseCommand):
+    help = "Compare process-pool distance computation with the single-process path"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--data-file', type=int, help="DataFile id to load coordinates from instead of synthetic data")
+        parser.add_argument('--rows', type=int, default=2000000, help="Number of synthetic trips")
+        parser.add_argument('--technicians', type=int, default=5000, help="Number of distinct technicians")
+        parser.add_argument('--workers', type=int, nargs='+', default=[2, 4], help="Worker counts to try")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per mode; the fastest is reported")
+    
+    def handle(self, *args, **options):
+        if options['data_file']:
+            try:
+                data_file = DataFile.objects.get(id=options['data_file'])
+            except DataFile.DoesNotExist:
+                raise CommandError(f"DataFile {options['data_file']} does not exist")
+            
+            technician_pks = list(Technician.objects.filter(data_file=data_file).values_list('id', flat=True))
+            trips = load_fleet_coordinates(data_file, technician_pks)
+            positions = trips['position'].to_numpy()
+            latitude = trips['latitude'].to_numpy(dtype=float)
+            longitude = trips['longitude'].to_numpy(dtype=float)
+            size = len(technician_pks)
+        else:
+            positions, latitude, longitude = make_synthetic_coordinates(options['rows'], options['technicians'])
+            size = options['technicians']
+        
+        self.stdout.write(f"{len(positions)} trips, {size} technicians, {os.cpu_count()} CPUs")
+        
+        baseline, expected = self.time_run(
+            lambda: segment_distance_sums(positions, latitude, longitude, size),
+            options['repeat']
+        )
+        self.stdout.write(f"Single process: {baseline:.3f}s")
+        
+        for workers in options['workers']:
+            elapsed, result = self.time_run(
+                lambda: parallel_segment_distance_sums(positions, latitude, longitude, size, workers),
+                options['repeat']
+            )
+            
+            if not (np.allclose(result[0], expected[0]) and np.array_equal(result[1], expected[1])):
+                raise CommandError(f"Results with {workers} workers differ from the single-process path")
+            
+            speedup = baseline / elapsed if elapsed > 0 else float('inf')
+            self.stdout.write(
+                f"{workers} workers: {elapsed:.3f}s, speedup {speedup:.2f}x, "
+                f"scaling efficiency {speedup / workers:.0%}"
+            )
+    
+    def time_run(self, run, repeat):
+        """Return the fastest wall time over repeat runs and the last result"""
+        best = float('inf')
+        result = None
+        
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            result = run()
+            best = min(best, time.perf_counter() - start)
+        
+        return best, result
@@ -0,0 +1,112 @@
+import time
+from contextlib import nullcontext
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from dashboard.models import DataFile, Technician
+from dashboard.utils.bulk_load import bulk_load
+from dashboard.utils.data_processor import (
+    clean_data,
+    save_to_database,
+    INGEST_TARGET_ROWS_PER_SEC,
+    INSERT_BATCH_SIZE,
+)
+
+
+# Synthetic technician ids start here, far above real ones; technician
+# ids are unique across data files
+BENCHMARK_TECHNICIAN_ID_START = 2000000000
+
+# Upload name of the data files the benchmark loads into
+BENCHMARK_FILE_NAME = 'uploads/benchmark.xlsx'
+
+
+def make_synthetic_trips(rows, technicians, seed=0, first_id=BENCHMARK_TECHNICIAN_ID_START):
+    """
+    Build a synthetic trip export shaped like a real upload
+    
+    Args:
+        rows: Number of rows to generate
+        technicians: Number of distinct technicians
+        seed: Random seed
+        first_id: Lowest technician id; ids run up from it
+    
+    Returns:
+        DataFrame: Raw trip data, before clean_data
+    """
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2024-01-01')
+    
+    return pd.DataFrame({
+        'technician_id': rng.integers(first_id, first_id + technicians, rows),
+        'trip_type': rng.choice(['Punch_In', 'punch_out', 'start_trip', 'end_trip', 'pickup', 'delivery'], rows),
+        'created_at': start + pd.to_timedelta(rng.integers(0, 30 * 86400, rows), unit='s'),
+        'location': rng.choice(['Depot', 'Site A', 'Site B', ''], rows),
+        'lat': 17.3 + rng.random(rows) / 10,
+        'long': 78.4 + rng.random(rows) / 10,
+    })
+
+
+class Command(BaseCommand):
+    help = "Measure save_to_database throughput in rows/sec on a synthetic file"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help="Number of synthetic rows")
+        parser.add_argument('--technicians', type=int, default=500, help="Number of distinct technicians")
+        parser.add_argument('--target', type=float, default=INGEST_TARGET_ROWS_PER_SEC, help="Target rows/sec")
+        parser.add_argument('--compare', action='store_true', help="Also time the per-batch autocommit path")
+    
+    def handle(self, *args, **options):
+        rows = options['rows']
+        self.remove_leftovers()
+        
+        # Refuse to touch real technicians that happen to use the synthetic range
+        last_id = BENCHMARK_TECHNICIAN_ID_START + options['technicians'] - 1
+        if Technician.objects.filter(technician_id__range=(BENCHMARK_TECHNICIAN_ID_START, last_id)).exists():
+            raise CommandError(
+                f"Technician ids {BENCHMARK_TECHNICIAN_ID_START}-{last_id} are already in use; "
+                f"the benchmark needs them for its synthetic technicians"
+            )
+        
+        df = clean_data(make_synthetic_trips(rows, options['technicians']))
+        
+        elapsed = self.time_load(df, bulk=True)
+        rate = rows / elapsed if elapsed > 0 else float('inf')
+        self.stdout.write(f"Bulk load: {rows} rows in {elapsed:.2f}s ({rate:,.0f} rows/sec)")
+        
+        if options['compare']:
+            autocommit_elapsed = self.time_load(df, bulk=False)
+            self.stdout.write(
+                f"Per-batch autocommit: {autocommit_elapsed:.2f}s "
+                f"({autocommit_elapsed / elapsed:.1f}x the bulk load time)"
+            )
+        
+        if rate >= options['target']:
+            self.stdout.write(self.style.SUCCESS(f"Target of {options['target']:,.0f} rows/sec met"))
+        else:
+            self.stdout.write(self.style.WARNING(f"Below target of {options['target']:,.0f} rows/sec"))
+    
+    def remove_leftovers(self):
+        """Delete data files left behind by an interrupted benchmark run"""
+        deleted, _ = DataFile.objects.filter(
+            file=BENCHMARK_FILE_NAME,
+            technicians__technician_id__gte=BENCHMARK_TECHNICIAN_ID_START
+        ).distinct().delete()
+        
+        if deleted:
+            self.stdout.write("Removed the data of an interrupted benchmark run")
+    
+    def time_load(self, df, bulk):
+        """Time save_to_database for one mode, then remove the loaded rows"""
+        data_file = DataFile.objects.create(
+            file=BENCHMARK_FILE_NAME,
+            original_filename='benchmark.xlsx'
+        )
+        
+        try:
+            start = time.perf_counter()
+            with (bulk_load() if bulk else nullcontext(INSERT_BATCH_SIZE)) as batch_size:
+                save_to_database(df, data_file, batch_size)
+            return time.perf_counter() - start
+        finally:
+            data_file.delete()
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from dashboard.models import DataFile
+from dashboard.utils.spatial_index import backfill_geohashes
+
+
+class Command(BaseCommand):
+    help = "Set the geohash of trip records stored before the spatial index existed"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--data-file', type=int, help="DataFile id to limit the backfill to")
+    
+    def handle(self, *args, **options):
+        data_file = None
+        
+        if options['data_file']:
+            try:
+                data_file = DataFile.objects.get(id=options['data_file'])
+            except DataFile.DoesNotExist:
+                raise CommandError(f"DataFile {options['data_file']} does not exist")
+        
+        updated = backfill_geohashes(data_file)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {updated} trip records"))
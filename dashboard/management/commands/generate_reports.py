@@ -0,0 +1,35 @@
+import json
+import zipfile
+from django.core.management.base import BaseCommand, CommandError
+from dashboard.models import DataFile
+from dashboard.utils.bulk_reports import generate_bulk_reports, stream_reports_zip
+
+
+class Command(BaseCommand):
+    help = "Generate reports for every technician of a data file into a ZIP archive"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--data-file', type=int, required=True, help="DataFile id to report on")
+        parser.add_argument('--output', required=True, help="Path of the ZIP archive to write")
+        parser.add_argument('--format', choices=['pdf', 'html'], default='pdf', help="Report format")
+        parser.add_argument('--workers', type=int, help="Worker processes rendering reports")
+    
+    def handle(self, *args, **options):
+        try:
+            data_file = DataFile.objects.get(id=options['data_file'])
+        except DataFile.DoesNotExist:
+            raise CommandError(f"DataFile {options['data_file']} does not exist")
+        
+        results = generate_bulk_reports(data_file, options['format'], workers=options['workers'])
+        
+        with open(options['output'], 'wb') as output:
+            for chunk in stream_reports_zip(results):
+                output.write(chunk)
+        
+        with zipfile.ZipFile(options['output']) as archive:
+            summary = json.loads(archive.read('manifest.json'))
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {summary['report_count']} report(s), {summary['cached_count']} reused, {summary['failed_count']} failed, "
+            f"in {summary['seconds']}s ({summary['reports_per_second']} reports/s)"
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from dashboard.models import DataFile
+from dashboard.utils.rollups import rebuild_daily_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily technician rollups of processed data files"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--data-file', type=int, help="DataFile id to rebuild; all processed files by default")
+    
+    def handle(self, *args, **options):
+        data_files = DataFile.objects.filter(processed=True)
+        
+        if options['data_file']:
+            data_files = data_files.filter(id=options['data_file'])
+            if not data_files.exists():
+                raise CommandError(f"Processed DataFile {options['data_file']} does not exist")
+        
+        for data_file in data_files:
+            count = rebuild_daily_rollups(data_file)
+            self.stdout.write(self.style.SUCCESS(f"{data_file}: {count} daily rollups"))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from dashboard.models import DataFile
+from dashboard.utils.change_tracking import recompute_dirty_technicians
+
+
+class Command(BaseCommand):
+    help = "Refresh distances, segments and rollups of technicians whose trip records changed"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--data-file', type=int, help="DataFile id to limit the recompute to")
+        parser.add_argument('--reports', action='store_true', help="Also regenerate the latest report of each dirty technician")
+        parser.add_argument('--workers', type=int, help="Worker processes for distance calculation")
+    
+    def handle(self, *args, **options):
+        data_file = None
+        
+        if options['data_file']:
+            try:
+                data_file = DataFile.objects.get(id=options['data_file'])
+            except DataFile.DoesNotExist:
+                raise CommandError(f"DataFile {options['data_file']} does not exist")
+        
+        summary = recompute_dirty_technicians(data_file, reports=options['reports'], workers=options['workers'])
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed {summary['technician_count']} technicians in {summary['data_file_count']} file(s), "
+            f"{summary['report_count']} report(s), {summary['seconds']}s"
+        ))
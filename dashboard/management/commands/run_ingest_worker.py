@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand
+from dashboard.utils.ingest_jobs import claim_next_job, run_ingest_job
+
+
+class Command(BaseCommand):
+    help = "Process queued file uploads and distance calculations in the background"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to wait when the queue is empty")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty")
+    
+    def handle(self, *args, **options):
+        self.stdout.write("Ingest worker started")
+        
+        while True:
+            job = claim_next_job()
+            
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+            
+            self.stdout.write(f"Processing {job.data_file} (job {job.id})")
+            result = run_ingest_job(job)
+            
+            if result['success']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Processed {result['record_count']} records, {result['technician_count']} technicians"
+                ))
+            else:
+                self.stdout.write(self.style.ERROR(f"Failed: {result['error']}"))
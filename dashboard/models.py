@@ -12,6 +12,16 @@ def report_file_path(instance, filename):
     return os.path.join('reports', filename)
 
 
+def row_hashes_file_path(instance, filename):
+    """Generate file path for stored row hashes of a data file"""
+    return os.path.join('row_hashes', f"rows_{uuid.uuid4().hex[:8]}.npy")
+
+
+def report_archive_path(instance, filename):
+    """Generate file path for ZIP archives of bulk reports"""
+    return os.path.join('reports', 'archives', f"reports_{uuid.uuid4().hex[:8]}.zip")
+
+
 def upload_file_path(instance, filename):
     """Generate file path for uploaded Excel files"""
     ext = filename.split('.')[-1]
@@ -26,15 +36,79 @@ class DataFile(models.Model):
     upload_date = models.DateTimeField(default=timezone.now)
     processed = models.BooleanField(default=False)
     record_count = models.IntegerField(null=True, blank=True)
+    # SHA-256 of the uploaded bytes, to spot re-uploads of the same file
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    # Digest of the first rows and hashes of all rows, to spot re-exports that grew
+    head_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    row_hashes = models.FileField(upload_to=row_hashes_file_path, blank=True)
+    # Per-stage timings, memory and query counts of the last ingest run
+    ingest_profile = models.JSONField(null=True, blank=True)
+    # Bumped whenever trip records are inserted or re-flagged, to key caches
+    # of data derived from them
+    trips_version = models.IntegerField(default=0)
     
     def __str__(self):
         return self.original_filename
 
 
+class IngestJob(models.Model):
+    """Model to queue background processing of an uploaded data file"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    TASK_CHOICES = [
+        ('ingest', 'Ingest'),
+        ('distances', 'Calculate distances'),
+        ('reports', 'Generate reports'),
+    ]
+    
+    data_file = models.ForeignKey(DataFile, on_delete=models.CASCADE, related_name='ingest_jobs')
+    # Work the job does; an ingest with a delta file appends it
+    task = models.CharField(max_length=20, choices=TASK_CHOICES, default='ingest')
+    # Delta upload appended to the data file; empty for the initial upload
+    file = models.FileField(upload_to=upload_file_path, blank=True)
+    original_filename = models.CharField(max_length=255, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True)
+    # Format of the reports a reports job generates, and the ZIP it wrote
+    report_type = models.CharField(max_length=10, blank=True)
+    archive = models.FileField(upload_to=report_archive_path, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    stage = models.CharField(max_length=50, blank=True)
+    rows_processed = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"Ingest job for {self.data_file} ({self.status})"
+    
+    @property
+    def rows_per_sec(self):
+        """Average ingest rate since the job started"""
+        if not self.started_at:
+            return 0
+        
+        end = self.finished_at or timezone.now()
+        elapsed = (end - self.started_at).total_seconds()
+        return round(self.rows_processed / elapsed, 1) if elapsed > 0 else 0
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+
 class Technician(models.Model):
     """Model to store technician information"""
     technician_id = models.IntegerField(unique=True)
     data_file = models.ForeignKey(DataFile, on_delete=models.CASCADE, related_name='technicians')
+    # Set when trip records change, until derived data is recomputed
+    dirty_at = models.DateTimeField(null=True, blank=True, db_index=True)
     
     def __str__(self):
         return f"Technician {self.technician_id}"
@@ -71,6 +145,8 @@ class TripRecord(models.Model):
         blank=True
     )
     duplicate = models.BooleanField(default=False)
+    # Geohash of the coordinates for area queries, empty without them
+    geohash = models.CharField(max_length=12, blank=True, default='')
     
     def __str__(self):
         return f"{self.technician} - {self.trip_type} at {self.created_at.strftime('%Y-%m-%d %H:%M:%S')}"
@@ -80,6 +156,7 @@ class TripRecord(models.Model):
         indexes = [
             models.Index(fields=['technician', 'created_at']),
             models.Index(fields=['trip_type']),
+            models.Index(fields=['geohash']),
         ]
 
 
@@ -94,6 +171,8 @@ class Report(models.Model):
     file = models.FileField(upload_to=report_file_path)
     report_type = models.CharField(max_length=10, choices=REPORT_TYPE_CHOICES)
     created_at = models.DateTimeField(default=timezone.now)
+    # Digest of the technician's data and the requested format the report was rendered from
+    data_version = models.CharField(max_length=64, blank=True, db_index=True)
     
     def __str__(self):
         return f"Report for {self.technician} ({self.report_type})"
@@ -112,4 +191,71 @@ class DistanceData(models.Model):
         return f"Distance data for {self.technician}"
     
     class Meta:
-        verbose_name_plural = "Distance Data"
\ No newline at end of file
+        verbose_name_plural = "Distance Data"
+
+
+class TripSegment(models.Model):
+    """Model to store the leg between two consecutive trip records of a technician"""
+    technician = models.ForeignKey(Technician, on_delete=models.CASCADE, related_name='segments')
+    from_record = models.ForeignKey(TripRecord, on_delete=models.CASCADE, related_name='outgoing_segments')
+    to_record = models.ForeignKey(TripRecord, on_delete=models.CASCADE, related_name='incoming_segments')
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField()
+    distance_km = models.FloatField()
+    duration_seconds = models.FloatField()
+    speed_kmh = models.FloatField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.technician} segment {self.started_at} - {self.ended_at}"
+    
+    class Meta:
+        ordering = ['technician', 'started_at']
+        indexes = [
+            models.Index(fields=['technician', 'started_at']),
+        ]
+
+
+class DailyRollup(models.Model):
+    """Model to store per-technician daily aggregates of trip records"""
+    technician = models.ForeignKey(Technician, on_delete=models.CASCADE, related_name='daily_rollups')
+    date = models.DateField()
+    # Counts of non-duplicate records, and of duplicates
+    trip_count = models.IntegerField(default=0)
+    duplicate_count = models.IntegerField(default=0)
+    trip_type_counts = models.JSONField(default=dict)
+    # Non-duplicate punch-ins per hour of day, 24 bins
+    punch_in_hours = models.JSONField(default=list)
+    first_event_at = models.DateTimeField(null=True, blank=True)
+    last_event_at = models.DateTimeField(null=True, blank=True)
+    # Distance of trip segments starting on this day, once distances are calculated
+    distance_km = models.FloatField(default=0)
+    
+    def __str__(self):
+        return f"{self.technician} on {self.date}"
+    
+    class Meta:
+        ordering = ['technician', 'date']
+        constraints = [
+            models.UniqueConstraint(fields=['technician', 'date'], name='unique_technician_daily_rollup'),
+        ]
+
+
+class ClusterCell(models.Model):
+    """Model to store map grid cells of a data file's points, per zoom level"""
+    data_file = models.ForeignKey(DataFile, on_delete=models.CASCADE, related_name='cluster_cells')
+    zoom = models.SmallIntegerField()
+    # Web Mercator grid coordinates of the cell at this zoom level
+    x = models.IntegerField()
+    y = models.IntegerField()
+    point_count = models.IntegerField(default=0)
+    # Coordinate sums, so centroids survive merging cells
+    latitude_sum = models.FloatField(default=0)
+    longitude_sum = models.FloatField(default=0)
+    
+    def __str__(self):
+        return f"Cell {self.zoom}/{self.x}/{self.y} of {self.data_file}"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['data_file', 'zoom', 'x', 'y'], name='unique_data_file_cluster_cell'),
+        ]
\ No newline at end of file
@@ -1,3 +1,1647 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+import zipfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest.mock import patch
+import numpy as np
+import openpyxl
+import pandas as pd
+from haversine import haversine
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from dashboard.forms import FileUploadForm
+from dashboard.models import DataFile, IngestJob, Technician, TripRecord, TripSegment, DailyRollup, ClusterCell, DistanceData, Report
+from dashboard.utils import data_processor, pdf_renderer
+from dashboard.utils.data_processor import (
+    FILE_READERS,
+    append_data_file,
+    clean_data,
+    epoch_nanoseconds,
+    get_file_reader,
+    iter_excel_rows,
+    process_excel_file,
+    read_data_chunks,
+    save_to_database
+)
+from dashboard.utils.bulk_load import SQLITE_BULK_LOAD_PRAGMAS, BULK_LOAD_BATCH_SIZE, aware_datetimes, bulk_load, insert_rows
+from dashboard.utils.change_tracking import mark_technicians_dirty
+from dashboard.utils.cluster_index import CLUSTER_MAX_ZOOM, rebuild_cluster_index, extend_cluster_index, get_cluster_cells
+from dashboard.utils.distance_analyzer import (
+    DISTANCE_HISTOGRAM_BINS,
+    DISTANCE_PERCENTILES,
+    build_segment_rows,
+    calculate_technician_distances,
+    distance_histogram,
+    distance_percentiles,
+    fleet_distance_sums,
+    get_distance_summary,
+    parallel_segment_distance_sums
+)
+from dashboard.utils.distance_kernels import segment_distance_sums
+from dashboard.utils.ingest_jobs import claim_next_job, enqueue_ingest, progress_cache_key, run_ingest_job
+from dashboard.utils.ingest_profile import IngestProfiler
+from dashboard.utils.nearest_technicians import bucket_tree, find_nearest_technicians
+from dashboard.utils.near_duplicates import EARTH_RADIUS_M, find_near_duplicates, flag_near_duplicates
+from dashboard.utils.punch_pairs import pair_punches, get_shifts
+from dashboard.utils.report_generator import analyze_technician_data, generate_technician_report, load_report_trips
+from dashboard.utils.rollups import rebuild_daily_rollups
+from dashboard.utils.route_simplify import ZOOM0_METERS_PER_PIXEL, farthest_point, project_meters, simplify_route, zoom_tolerance_m
+from dashboard.utils.upload_cache import find_overlapping_file
+from dashboard.utils.spatial_index import MAX_COVER_CELLS, encode_geohashes, geohash_ranges, records_in_bbox, records_within_radius
 
-# Create your tests here.
+
+def setUpModule():
+    """Create the dashboard tables; the app has no migrations to create them"""
+    existing = connection.introspection.table_names()
+    with connection.schema_editor() as editor:
+        for model in apps.get_app_config('dashboard').get_models():
+            if model._meta.db_table not in existing:
+                editor.create_model(model)
+
+
+def utc(*args):
+    """Aware UTC datetime"""
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+def punches(*events):
+    """Build punch arrays from (trip_type, 'YYYY-MM-DD HH:MM') pairs"""
+    trip_types = np.array([trip_type for trip_type, _ in events])
+    created_at = np.array([moment for _, moment in events], dtype='datetime64[ns]')
+    return trip_types, created_at
+
+
+class PunchPairingTests(SimpleTestCase):
+    """pair_punches and get_shifts"""
+    
+    def test_missing_punch_out_only_loses_its_own_shift(self):
+        trip_types, created_at = punches(
+            ('punch_in', '2024-01-01 08:00'),
+            ('punch_in', '2024-01-02 08:00'),
+            ('punch_out', '2024-01-02 17:00'),
+            ('punch_in', '2024-01-03 08:00'),
+            ('punch_out', '2024-01-03 17:00'),
+            ('punch_in', '2024-01-04 08:00'),
+            ('punch_out', '2024-01-04 17:00'),
+        )
+        
+        in_positions, out_positions = pair_punches(trip_types, created_at)
+        
+        self.assertEqual(in_positions.tolist(), [1, 3, 5])
+        self.assertEqual(out_positions.tolist(), [2, 4, 6])
+    
+    def test_shift_crossing_midnight(self):
+        trip_types, created_at = punches(
+            ('punch_in', '2024-01-01 22:00'),
+            ('pickup', '2024-01-01 23:30'),
+            ('punch_out', '2024-01-02 06:00'),
+        )
+        
+        in_positions, out_positions = pair_punches(trip_types, created_at)
+        
+        self.assertEqual(in_positions.tolist(), [0])
+        self.assertEqual(out_positions.tolist(), [2])
+    
+    def test_unmatched_punch_outs_stay_unpaired(self):
+        trip_types, created_at = punches(
+            ('punch_out', '2024-01-01 07:00'),
+            ('punch_in', '2024-01-01 08:00'),
+            ('punch_out', '2024-01-01 17:00'),
+            ('punch_out', '2024-01-01 18:00'),
+        )
+        
+        in_positions, out_positions = pair_punches(trip_types, created_at)
+        
+        self.assertEqual(list(zip(in_positions.tolist(), out_positions.tolist())), [(1, 2)])
+    
+    def test_punch_out_at_the_same_moment_does_not_close_the_punch_in(self):
+        trip_types, created_at = punches(
+            ('punch_in', '2024-01-01 08:00'),
+            ('punch_in', '2024-01-01 17:00'),
+            ('punch_out', '2024-01-01 17:00'),
+        )
+        
+        in_positions, out_positions = pair_punches(trip_types, created_at)
+        
+        self.assertEqual(list(zip(in_positions.tolist(), out_positions.tolist())), [(0, 2)])
+    
+    def test_pairs_never_span_technicians(self):
+        trip_types, created_at = punches(
+            ('punch_in', '2024-01-01 08:00'),
+            ('punch_out', '2024-01-01 09:00'),
+            ('punch_in', '2024-01-01 10:00'),
+        )
+        trip_types = np.append(trip_types, 'punch_out')
+        created_at = np.append(created_at, np.datetime64('2024-01-01T12:00', 'ns'))
+        
+        in_positions, out_positions = pair_punches(trip_types, created_at, np.array([1, 1, 1, 2]))
+        
+        self.assertEqual(list(zip(in_positions.tolist(), out_positions.tolist())), [(0, 1)])
+    
+    def test_pairs_longer_than_max_hours_are_dropped(self):
+        trip_types, created_at = punches(
+            ('punch_in', '2024-01-01 08:00'),
+            ('punch_out', '2024-01-02 17:00'),
+            ('punch_in', '2024-01-03 08:00'),
+            ('punch_out', '2024-01-03 17:00'),
+        )
+        
+        in_positions, out_positions = pair_punches(trip_types, created_at, max_hours=24)
+        
+        self.assertEqual(list(zip(in_positions.tolist(), out_positions.tolist())), [(2, 3)])
+    
+    @override_settings(MAX_SHIFT_HOURS=24)
+    def test_get_shifts_reports_hours_per_technician(self):
+        df = pd.DataFrame({
+            'technician_id': [1, 1, 2, 2],
+            'trip_type': ['punch_in', 'punch_out', 'punch_in', 'punch_out'],
+            'created_at': pd.to_datetime([
+                '2024-01-01 22:00', '2024-01-02 06:30', '2024-01-01 08:00', '2024-01-01 12:00'
+            ], utc=True),
+        })
+        
+        shifts = get_shifts(df)
+        
+        self.assertEqual(shifts['technician_id'].tolist(), [1, 2])
+        self.assertEqual(shifts['duration_hours'].tolist(), [8.5, 4.0])
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+)
+class ReportCacheTests(TestCase):
+    """Reuse of reports rendered from unchanged data"""
+    
+    def setUp(self):
+        data_file = DataFile.objects.create(file='uploads/test.csv', original_filename='test.csv')
+        self.technician = Technician.objects.create(technician_id=9001, data_file=data_file)
+        TripRecord.objects.create(technician=self.technician, trip_type='punch_in', created_at=utc(2024, 1, 1, 8))
+    
+    def test_unchanged_data_reuses_the_report(self):
+        first, _ = generate_technician_report(self.technician, 'html')
+        second, message = generate_technician_report(self.technician, 'html')
+        
+        self.assertEqual(second.id, first.id)
+        self.assertTrue(message.startswith('Data unchanged'))
+        
+        TripRecord.objects.create(technician=self.technician, trip_type='punch_out', created_at=utc(2024, 1, 1, 17))
+        third, _ = generate_technician_report(self.technician, 'html')
+        
+        self.assertNotEqual(third.id, first.id)
+    
+    def test_html_fallback_is_not_reused_for_pdf_requests(self):
+        with patch('dashboard.utils.report_generator.render_pdf', return_value=None):
+            fallback, _ = generate_technician_report(self.technician, 'pdf')
+        
+        self.assertEqual(fallback.report_type, 'html')
+        
+        with patch('dashboard.utils.report_generator.render_pdf', return_value=b'%PDF-1.4') as render_pdf:
+            report, _ = generate_technician_report(self.technician, 'pdf')
+            again, _ = generate_technician_report(self.technician, 'pdf')
+        
+        render_pdf.assert_called_once()
+        self.assertEqual(report.report_type, 'pdf')
+        self.assertEqual(again.id, report.id)
+
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    REPORT_WORKERS=1,
+)
+class BulkReportTests(TestCase):
+    """Report archives generated by the worker and streamed by the view"""
+    
+    def setUp(self):
+        self.data_file = DataFile.objects.create(file='uploads/test.csv', original_filename='test.csv', processed=True)
+        
+        for technician_id in (9001, 9002):
+            technician = Technician.objects.create(technician_id=technician_id, data_file=self.data_file)
+            TripRecord.objects.create(technician=technician, trip_type='punch_in', created_at=utc(2024, 1, 1, 8))
+        
+        Technician.objects.create(technician_id=9003, data_file=self.data_file)
+    
+    def test_worker_archive_is_streamed(self):
+        response = self.client.post(reverse('generate_bulk_report', args=[self.data_file.id]), {'report_type': 'html'})
+        
+        self.assertRedirects(response, reverse('report_generation', args=[self.data_file.id]))
+        self.assertFalse(Report.objects.exists())
+        
+        job = claim_next_job()
+        result = run_ingest_job(job)
+        
+        self.assertEqual((result['success'], result['record_count'], result['technician_count']), (True, 2, 3))
+        
+        response = self.client.get(reverse('download_bulk_report', args=[job.id]))
+        
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            names = sorted(archive.namelist())
+            manifest = json.loads(archive.read('manifest.json'))
+            report = archive.read('Technician_9001_Report.html')
+        
+        self.assertEqual(names, ['Technician_9001_Report.html', 'Technician_9002_Report.html', 'manifest.json'])
+        self.assertIn(b'9001', report)
+        self.assertEqual((manifest['report_count'], manifest['cached_count'], manifest['failed_count']), (2, 0, 1))
+        self.assertEqual(
+            sorted((entry['technician_id'], entry['file_name']) for entry in manifest['reports']),
+            [(9001, 'Technician_9001_Report.html'), (9002, 'Technician_9002_Report.html'), (9003, None)]
+        )
+    
+    def test_unfinished_archive_is_not_downloaded(self):
+        self.client.post(reverse('generate_bulk_report', args=[self.data_file.id]), {'report_type': 'pdf'})
+        job = IngestJob.objects.get(task='reports')
+        
+        response = self.client.get(reverse('download_bulk_report', args=[job.id]))
+        
+        self.assertEqual(job.report_type, 'pdf')
+        self.assertRedirects(response, reverse('report_generation', args=[self.data_file.id]))
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    PDF_RENDER_WORKERS=1,
+    PDF_RENDER_TIMEOUT=0.2,
+)
+class PdfRendererTests(TestCase):
+    """Backend detection and render timeouts of the shared PDF renderer"""
+    
+    def setUp(self):
+        data_file = DataFile.objects.create(file='uploads/test.csv', original_filename='test.csv')
+        self.technician = Technician.objects.create(technician_id=9001, data_file=data_file)
+        TripRecord.objects.create(technician=self.technician, trip_type='punch_in', created_at=utc(2024, 1, 1, 8))
+        
+        # Start each test with no detected backend and no render threads
+        for name in ('_backend', '_executor'):
+            patcher = patch.object(pdf_renderer, name, None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def test_backend_is_detected_once(self):
+        render = lambda html_content, technician_id: b'%PDF-1.4'
+        
+        with patch('dashboard.utils.pdf_renderer.detect_pdf_backend', return_value=('fake', render)) as detect:
+            self.assertEqual(pdf_renderer.render_pdf('<p>one</p>', 9001), b'%PDF-1.4')
+            self.assertEqual(pdf_renderer.render_pdf('<p>two</p>', 9001), b'%PDF-1.4')
+            self.assertEqual(pdf_renderer.get_pdf_backend_name(), 'fake')
+        
+        detect.assert_called_once()
+    
+    def test_timeout_falls_back_to_html(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        calls = []
+        
+        # The first render wedges its thread until the test ends
+        def render(html_content, technician_id):
+            calls.append(technician_id)
+            if len(calls) == 1:
+                release.wait(10)
+            return b'%PDF-1.4'
+        
+        with patch('dashboard.utils.pdf_renderer.detect_pdf_backend', return_value=('fake', render)):
+            report, _ = generate_technician_report(self.technician, 'pdf')
+            
+            self.assertEqual(report.report_type, 'html')
+            self.assertEqual(report.data_version, '')
+            
+            # The next render does not queue behind the wedged one
+            self.assertEqual(pdf_renderer.render_pdf('<p>next</p>', 9001), b'%PDF-1.4')
+    
+    def test_pdfkit_kills_wkhtmltopdf_at_the_timeout(self):
+        class PDFKit:
+            def __init__(self, *args, **kwargs):
+                pass
+            
+            def command(self):
+                return [sys.executable, '-c', 'import time; time.sleep(10)']
+        
+        pdfkit = types.SimpleNamespace(PDFKit=PDFKit, configuration=lambda **kwargs: None)
+        
+        with patch.dict(sys.modules, {'pdfkit': pdfkit}):
+            render = pdf_renderer.load_pdfkit()
+        
+        start = time.perf_counter()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            render('<p>slow</p>', 9001)
+        
+        self.assertLess(time.perf_counter() - start, 5)
+
+def north_of(latitude, metres):
+    """Latitude metres north of another"""
+    return latitude + np.degrees(metres / EARTH_RADIUS_M)
+
+
+class NearDuplicateToleranceTests(SimpleTestCase):
+    """find_near_duplicates at the edges of its tolerances"""
+    
+    def near_duplicates(self, metres, seconds, groups=(0, 0)):
+        return find_near_duplicates(
+            np.array(groups),
+            np.array([45.0, north_of(45.0, metres)]),
+            np.array([7.0, 7.0]),
+            np.array([1000, 1000 + seconds], dtype=np.int64),
+            10,
+            30
+        ).tolist()
+    
+    def test_just_inside_both_tolerances_is_flagged(self):
+        self.assertEqual(self.near_duplicates(9.9, 30), [False, True])
+    
+    def test_just_outside_the_distance_is_kept(self):
+        self.assertEqual(self.near_duplicates(10.1, 1), [False, False])
+    
+    def test_just_outside_the_time_is_kept(self):
+        self.assertEqual(self.near_duplicates(0, 31), [False, False])
+    
+    def test_other_groups_are_never_compared(self):
+        self.assertEqual(self.near_duplicates(0, 0, groups=(0, 1)), [False, False])
+
+
+@override_settings(NEAR_DUPLICATE_DISTANCE_METERS=10, NEAR_DUPLICATE_SECONDS=30)
+class FlagNearDuplicatesTests(TestCase):
+    """flag_near_duplicates over stored records"""
+    
+    def test_every_technician_batch_is_flagged(self):
+        data_file = DataFile.objects.create(file='uploads/test.csv', original_filename='test.csv')
+        
+        for technician_id in (9001, 9002, 9003):
+            technician = Technician.objects.create(technician_id=technician_id, data_file=data_file)
+            TripRecord.objects.bulk_create([
+                TripRecord(technician=technician, trip_type='pickup', created_at=utc(2024, 1, 1, 8, 0, second),
+                           latitude=north_of(45.0, metres), longitude=7.0)
+                for second, metres in [(0, 0), (20, 5), (40, 30)]
+            ])
+        
+        # One technician per batch
+        with patch('dashboard.utils.near_duplicates.NEAR_DUPLICATE_BATCH_ROWS', 1):
+            flagged = flag_near_duplicates(data_file)
+        
+        self.assertEqual(flagged, 3)
+        self.assertEqual(
+            sorted(TripRecord.objects.filter(duplicate=True).values_list('technician__technician_id', 'created_at')),
+            [(technician_id, utc(2024, 1, 1, 8, 0, 20)) for technician_id in (9001, 9002, 9003)]
+        )
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    NEAR_DUPLICATE_DISTANCE_METERS=10,
+    NEAR_DUPLICATE_SECONDS=30
+)
+class AppendTests(TestCase):
+    """Appending a delta file against ingesting everything at once"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        rng = np.random.default_rng(7)
+        rows = 600
+        
+        cls.rows = pd.DataFrame({
+            'technician_id': rng.choice([9001, 9002, 9003], rows),
+            'trip_type': rng.choice(['punch_in', 'punch_out', 'pickup', 'delivery'], rows),
+            'created_at': pd.Timestamp('2024-01-01') + pd.to_timedelta(np.sort(rng.integers(0, 14 * 86400, rows)), unit='s'),
+            'location': rng.choice(['A', 'B', ''], rows),
+            'lat': 45.0 + rng.integers(0, 50, rows) / 1000,
+            'long': 7.0 + rng.integers(0, 50, rows) / 1000,
+        })
+        
+        # GPS jitter a few seconds after some rows, near-duplicates on both sides of the split
+        jitter = cls.rows.sample(80, random_state=3).copy()
+        jitter['created_at'] += pd.to_timedelta(rng.integers(1, 30, len(jitter)), unit='s')
+        jitter['lat'] += 0.00003
+        
+        cls.split = pd.Timestamp('2024-01-08')
+        
+        # A jitter pair straddling the split, so the append must look back past it
+        straddling = pd.DataFrame({
+            'technician_id': [9001, 9001],
+            'trip_type': ['pickup', 'pickup'],
+            'created_at': [cls.split - pd.Timedelta(seconds=10), cls.split + pd.Timedelta(seconds=5)],
+            'location': ['A', 'A'],
+            'lat': [45.5, 45.50003],
+            'long': [7.5, 7.5],
+        })
+        
+        cls.rows = pd.concat([cls.rows, jitter, straddling]).sort_values('created_at', kind='stable').reset_index(drop=True)
+    
+    def ingest(self, frame):
+        data_file = DataFile(original_filename='trips.csv')
+        data_file.file.save('trips.csv', ContentFile(frame.to_csv(index=False).encode()))
+        result = process_excel_file(data_file, streaming=False)
+        self.assertTrue(result['success'], result.get('error'))
+        return data_file
+    
+    def append(self, data_file, frame):
+        job = IngestJob(data_file=data_file)
+        job.file.save('delta.csv', ContentFile(frame.to_csv(index=False).encode()))
+        result = append_data_file(data_file, job.file, streaming=False)
+        self.assertTrue(result['success'], result.get('error'))
+    
+    def snapshot(self, data_file):
+        trips = sorted(TripRecord.objects.filter(technician__data_file=data_file).values_list(
+            'technician__technician_id', 'trip_type', 'created_at', 'location', 'latitude', 'longitude', 'duplicate'
+        ))
+        rollups = list(DailyRollup.objects.filter(technician__data_file=data_file).order_by(
+            'technician__technician_id', 'date'
+        ).values_list(
+            'technician__technician_id', 'date', 'trip_count', 'duplicate_count',
+            'trip_type_counts', 'punch_in_hours', 'first_event_at', 'last_event_at'
+        ))
+        cells = [
+            (zoom, x, y, count, round(latitude_sum, 6), round(longitude_sum, 6))
+            for zoom, x, y, count, latitude_sum, longitude_sum in ClusterCell.objects.filter(
+                data_file=data_file
+            ).order_by('zoom', 'x', 'y').values_list(
+                'zoom', 'x', 'y', 'point_count', 'latitude_sum', 'longitude_sum'
+            )
+        ]
+        return trips, rollups, cells
+    
+    def test_append_matches_a_full_ingest(self):
+        full = self.ingest(self.rows)
+        expected = self.snapshot(full)
+        full.delete()
+        
+        before = self.rows['created_at'] < self.split
+        appended = self.ingest(self.rows[before])
+        self.append(appended, self.rows[~before])
+        
+        trips, rollups, cells = self.snapshot(appended)
+        
+        self.assertTrue(any(duplicate for *_, duplicate in trips))
+        self.assertEqual(trips, expected[0])
+        self.assertEqual(rollups, expected[1])
+        self.assertEqual(cells, expected[2])
+    
+    
+    def test_late_rows_are_appended_and_extend_derived_data(self):
+        trips = pd.DataFrame({
+            'technician_id': [9001] * 4,
+            'trip_type': ['pickup'] * 4,
+            'created_at': pd.to_datetime(['2024-01-01 08:00', '2024-01-02 08:00', '2024-01-03 08:00', '2024-01-04 08:00']),
+            'location': ['A'] * 4,
+            'lat': [45.0, 45.1, 45.2, 45.3],
+            'long': [7.0] * 4,
+        })
+        data_file = self.ingest(trips)
+        calculate_technician_distances(data_file)
+        
+        # A row older than the latest record, never uploaded before, plus a repeat
+        late = pd.DataFrame({
+            'technician_id': [9001, 9001],
+            'trip_type': ['delivery', 'pickup'],
+            'created_at': pd.to_datetime(['2024-01-02 12:00', '2024-01-04 08:00']),
+            'location': ['B', 'A'],
+            'lat': [46.0, 45.3],
+            'long': [7.0, 7.0],
+        })
+        self.append(data_file, late)
+        
+        self.assertTrue(TripRecord.objects.filter(trip_type='delivery', created_at=utc(2024, 1, 2, 12), duplicate=False).exists())
+        self.assertEqual(TripRecord.objects.filter(technician__data_file=data_file).count(), 5)
+        
+        rollup = DailyRollup.objects.get(technician__technician_id=9001, date='2024-01-02')
+        self.assertEqual((rollup.trip_count, rollup.trip_type_counts), (2, {'pickup': 1, 'delivery': 1}))
+        
+        appended = DistanceData.objects.get(technician__technician_id=9001)
+        calculate_technician_distances(data_file)
+        recalculated = DistanceData.objects.get(technician__technician_id=9001)
+        
+        self.assertEqual(appended.trip_count, 5)
+        self.assertAlmostEqual(appended.total_distance, recalculated.total_distance, places=2)
+    
+    def test_unprocessed_files_are_not_appended(self):
+        data_file = DataFile.objects.create(file='uploads/test.csv', original_filename='test.csv')
+        upload = ContentFile(self.rows.head().to_csv(index=False).encode(), name='delta.csv')
+        
+        response = self.client.post(reverse('append_file', args=[data_file.id]), {'file': upload})
+        
+        self.assertRedirects(response, reverse('data_overview', args=[data_file.id]), fetch_redirect_response=False)
+        self.assertFalse(IngestJob.objects.filter(data_file=data_file).exists())
+
+
+def trips_csv(*rows):
+    """CSV bytes of (technician_id, trip_type, 'YYYY-MM-DD HH:MM', location) rows at one spot"""
+    frame = pd.DataFrame(rows, columns=['technician_id', 'trip_type', 'created_at', 'location'])
+    frame['lat'] = 45.0
+    frame['long'] = 7.0
+    return frame.to_csv(index=False).encode()
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    NEAR_DUPLICATE_DISTANCE_METERS=0
+)
+class DuplicateFlagTests(TestCase):
+    """Exact duplicate flags, within and across streamed chunks"""
+    
+    def test_first_seen_record_is_kept(self):
+        data_file = DataFile(original_filename='trips.csv')
+        data_file.file.save('trips.csv', ContentFile(trips_csv(
+            # Chunk 1: a repeat within the chunk
+            (9001, 'pickup', '2024-01-01 08:00', 'A'),
+            (9001, 'pickup', '2024-01-01 09:00', 'A'),
+            (9001, 'pickup', '2024-01-01 10:00', 'B'),
+            # Chunk 2: a repeat of chunk 1
+            (9001, 'pickup', '2024-01-01 11:00', 'B'),
+            (9001, 'pickup', '2024-01-01 12:00', 'C'),
+            (9002, 'pickup', '2024-01-01 12:00', 'C'),
+            # Chunk 3: an earlier original of a row saved with chunk 2
+            (9001, 'pickup', '2024-01-01 07:00', 'C'),
+        )))
+        
+        read_data_chunks = data_processor.read_data_chunks
+        with patch.object(data_processor, 'read_data_chunks', lambda file, streaming: read_data_chunks(file, True, chunk_size=3)):
+            result = process_excel_file(data_file)
+        
+        self.assertTrue(result['success'], result.get('error'))
+        self.assertEqual([stage['calls'] for stage in result['profile']['stages'] if stage['name'] == 'cleaning'], [3])
+        self.assertEqual(result['duplicate_count'], 3)
+        self.assertEqual(
+            sorted(TripRecord.objects.filter(duplicate=True).values_list('technician__technician_id', 'created_at', 'location')),
+            [
+                (9001, utc(2024, 1, 1, 9), 'A'),
+                (9001, utc(2024, 1, 1, 11), 'B'),
+                (9001, utc(2024, 1, 1, 12), 'C'),
+            ]
+        )
+    
+    @override_settings(TIME_ZONE='Asia/Kolkata')
+    def test_naive_times_are_read_like_stored_values(self):
+        data_file = DataFile.objects.create(file='uploads/test.csv', original_filename='test.csv')
+        frame = pd.DataFrame({
+            'technician_id': [9001],
+            'trip_type': ['pickup'],
+            'created_at': pd.to_datetime(['2024-01-01 08:00']),
+        })
+        
+        save_to_database(frame, data_file)
+        stored = TripRecord.objects.get().created_at
+        
+        self.assertEqual(stored, utc(2024, 1, 1, 2, 30))
+        self.assertEqual(epoch_nanoseconds(frame['created_at']).tolist(), [pd.Timestamp(stored).value])
+
+@override_settings(NEAREST_BUCKET_MINUTES=15, NEAREST_MAX_AGE_HOURS=12)
+class NearestTechnicianTests(TestCase):
+    """find_nearest_technicians and its cached bucket trees"""
+    
+    def setUp(self):
+        # Test transactions roll back, so file ids and versions repeat between tests
+        bucket_tree.cache_clear()
+        
+        self.data_file = DataFile.objects.create(file='uploads/test.csv', original_filename='test.csv')
+        self.near = Technician.objects.create(technician_id=9001, data_file=self.data_file)
+        far = Technician.objects.create(technician_id=9002, data_file=self.data_file)
+        
+        TripRecord.objects.create(technician=self.near, trip_type='pickup', created_at=utc(2024, 1, 1, 7), latitude=45.0, longitude=7.0)
+        TripRecord.objects.create(technician=far, trip_type='pickup', created_at=utc(2024, 1, 1, 7), latitude=45.1, longitude=7.0)
+        
+        # Moves next to the site within the 08:00-08:15 bucket
+        self.move = TripRecord.objects.create(
+            technician=self.near, trip_type='pickup', created_at=utc(2024, 1, 1, 8, 10), latitude=45.2, longitude=7.0
+        )
+    
+    def nearest(self, moment):
+        self.data_file.refresh_from_db()
+        result = find_nearest_technicians(self.data_file, 45.2, 7.0, moment, k=1)
+        return [technician['technician_id'] for technician in result['technicians']]
+    
+    def test_records_after_the_moment_are_not_used(self):
+        self.assertEqual(self.nearest(utc(2024, 1, 1, 8, 5)), [9002])
+        self.assertEqual(self.nearest(utc(2024, 1, 1, 8, 10)), [9001])
+    
+    def test_reflagged_records_invalidate_the_cached_tree(self):
+        self.assertEqual(self.nearest(utc(2024, 1, 1, 9)), [9001])
+        
+        TripRecord.objects.filter(id=self.move.id).update(duplicate=True)
+        mark_technicians_dirty([self.near.id])
+        
+        self.assertEqual(self.nearest(utc(2024, 1, 1, 9)), [9002])
+
+
+class CalculateDistancesViewTests(TestCase):
+    """Queued calculations and dirty marks around the calculate distances view"""
+    
+    def setUp(self):
+        self.data_file = DataFile.objects.create(file='uploads/test.csv', original_filename='test.csv', processed=True)
+        
+        for technician_id in (9001, 9002):
+            technician = Technician.objects.create(technician_id=technician_id, data_file=self.data_file)
+            TripRecord.objects.bulk_create([
+                TripRecord(technician=technician, trip_type='pickup', created_at=utc(2024, 1, 1, hour), latitude=45.0 + hour / 100, longitude=7.0)
+                for hour in (8, 9)
+            ])
+        
+        mark_technicians_dirty(self.data_file.technicians.values('id'))
+    
+    def calculate(self, **data):
+        return self.client.post(reverse('calculate_distances', args=[self.data_file.id]), data)
+    
+    def dirty_marks(self):
+        return list(self.data_file.technicians.values_list('dirty_at', flat=True))
+    
+    def test_whole_file_is_calculated_by_the_worker(self):
+        response = self.calculate()
+        
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.calculate().json()['job_id'], response.json()['job_id'])
+        self.assertFalse(DistanceData.objects.exists())
+        
+        result = run_ingest_job(claim_next_job())
+        
+        self.assertEqual((result['success'], result['technician_count'], result['record_count']), (True, 2, 4))
+        self.assertEqual(IngestJob.objects.get(id=response.json()['job_id']).status, 'completed')
+        self.assertEqual(DistanceData.objects.count(), 2)
+        self.assertEqual(self.dirty_marks(), [None, None])
+    
+    def test_one_technician_is_calculated_at_once(self):
+        technician = self.data_file.technicians.get(technician_id=9001)
+        
+        response = self.calculate(technician=technician.id)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['technician_id'] for result in response.json()['results']], [9001])
+        self.assertEqual(self.dirty_marks().count(None), 1)
+    
+    def test_marks_made_while_calculating_stay(self):
+        def calculate_and_change(data_file):
+            mark_technicians_dirty(data_file.technicians.values('id'))
+            return []
+        
+        self.calculate()
+        with patch('dashboard.utils.ingest_jobs.calculate_technician_distances', side_effect=calculate_and_change):
+            run_ingest_job(claim_next_job())
+        
+        self.assertNotIn(None, self.dirty_marks())
+    
+    def test_failed_calculation_keeps_the_data(self):
+        self.calculate()
+        with patch('dashboard.utils.ingest_jobs.calculate_technician_distances', side_effect=RuntimeError('boom')):
+            result = run_ingest_job(claim_next_job())
+        
+        self.assertEqual(result, {'success': False, 'error': 'boom'})
+        self.assertEqual(self.data_file.technicians.count(), 2)
+
+
+class ParallelDistanceTests(SimpleTestCase):
+    """Process-pool distance sums against the single-process kernel"""
+    
+    def test_two_workers_match_one_process(self):
+        rng = np.random.default_rng(5)
+        positions = np.sort(rng.integers(0, 50, 5000))
+        trips = pd.DataFrame({
+            'position': positions,
+            'latitude': 17.3 + rng.random(len(positions)) / 10,
+            'longitude': 78.4 + rng.random(len(positions)) / 10,
+        })
+        trips.loc[7, 'latitude'] = np.nan
+        
+        expected = fleet_distance_sums(trips, 50, workers=1)
+        
+        with patch('dashboard.utils.distance_analyzer.PARALLEL_MIN_TRIPS', 1), \
+                patch('dashboard.utils.distance_analyzer.parallel_segment_distance_sums', wraps=parallel_segment_distance_sums) as parallel:
+            result = fleet_distance_sums(trips, 50, workers=2)
+        
+        parallel.assert_called_once()
+        np.testing.assert_allclose(result[0], expected[0])
+        self.assertEqual(result[1].tolist(), expected[1].tolist())
+
+def per_row_distances(points):
+    """
+    Total distance and located point count per technician with the
+    per-row haversine loop; points missing a coordinate are skipped
+    and break the route
+    """
+    totals = {}
+    counts = {}
+    previous = None
+    
+    for technician_id, latitude, longitude in points:
+        located = not (math.isnan(latitude) or math.isnan(longitude))
+        totals.setdefault(technician_id, 0.0)
+        counts[technician_id] = counts.get(technician_id, 0) + located
+        
+        if located and previous and previous[0] == technician_id and previous[3]:
+            totals[technician_id] += haversine(previous[1:3], (latitude, longitude))
+        
+        previous = (technician_id, latitude, longitude, located)
+    
+    return totals, counts
+
+
+class DistanceTotalsTests(TestCase):
+    """Vectorized distance totals against the per-row haversine loop"""
+    
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        self.points = [
+            (technician_id, float(17.3 + rng.random() / 10), float(78.4 + rng.random() / 10))
+            for technician_id in (0, 0, 0, 0, 1, 1, 2, 2, 2)
+        ]
+        
+        # A missing longitude in the middle of technician 0's route
+        self.points[2] = (0, self.points[2][1], math.nan)
+    
+    def test_segment_distance_sums_match_the_per_row_loop(self):
+        positions, latitude, longitude = (np.array(column) for column in zip(*self.points))
+        
+        totals, counts = segment_distance_sums(positions, latitude, longitude, 3)
+        expected_totals, expected_counts = per_row_distances(self.points)
+        
+        np.testing.assert_allclose(totals, [expected_totals[position] for position in range(3)])
+        self.assertEqual(counts.tolist(), [expected_counts[position] for position in range(3)])
+    
+    def test_a_missing_coordinate_does_not_spoil_the_stored_total(self):
+        data_file = DataFile.objects.create(file='uploads/test.csv', original_filename='test.csv')
+        technician = Technician.objects.create(technician_id=9001, data_file=data_file)
+        TripRecord.objects.bulk_create([
+            TripRecord(
+                technician=technician, trip_type='pickup', created_at=utc(2024, 1, 1, 8 + hour),
+                latitude=latitude, longitude=None if math.isnan(longitude) else longitude
+            )
+            for hour, (_, latitude, longitude) in enumerate(self.points[:4])
+        ])
+        
+        calculate_technician_distances(data_file)
+        
+        expected_totals, expected_counts = per_row_distances(self.points[:4])
+        data = DistanceData.objects.get(technician=technician)
+        self.assertEqual(data.total_distance, round(expected_totals[0], 2))
+        self.assertEqual(data.trip_count, expected_counts[0])
+
+
+class SpatialIndexTests(TestCase):
+    """Geohash range covers and spatial queries against brute-force filters"""
+    
+    # Boxes straddling geohash cell edges at several precisions, the code
+    # space's last cell and the antimeridian
+    BOXES = [
+        (-0.01, -0.01, 0.01, 0.01),
+        (-0.0005, 0.004, 0.0003, 0.0062),
+        (0.0, 0.0, 0.02, 0.02),
+        (179.99, 89.99, 180, 90),
+        (179.995, -0.01, -179.995, 0.01),
+        (179.9995, -0.002, -179.9999, 0.003),
+    ]
+    
+    def setUp(self):
+        rng = np.random.default_rng(18)
+        centres = rng.choice([0.0, 180.0, -180.0], 600)
+        latitude = np.concatenate([rng.uniform(-0.012, 0.012, 590), [0.0, 0.0, 90, 89.995, 0.004, 0.0062, 0.0, 0.0, 0.005, -0.005]])
+        longitude = np.clip(centres + rng.uniform(-0.012, 0.012, 600), -180, 180)
+        longitude[590:] = [0.0, 180, 180, 179.995, -0.0005, 0.0003, -180, 179.995, 179.9995, -179.9999]
+        
+        self.data_file = DataFile.objects.create(file='uploads/test.csv', original_filename='test.csv')
+        technician = Technician.objects.create(technician_id=9001, data_file=self.data_file)
+        TripRecord.objects.bulk_create([
+            TripRecord(
+                technician=technician, trip_type='pickup', created_at=utc(2024, 1, 1, 8),
+                latitude=float(lat), longitude=float(lon), geohash=geohash
+            )
+            for lat, lon, geohash in zip(latitude, longitude, encode_geohashes(latitude, longitude))
+        ])
+        
+        self.points = list(TripRecord.objects.values_list('id', 'latitude', 'longitude'))
+    
+    def brute_force_bbox(self, west, south, east, north):
+        def in_longitude(lon):
+            return west <= lon <= east if west <= east else lon >= west or lon <= east
+        
+        return {
+            record_id for record_id, lat, lon in self.points
+            if south <= lat <= north and in_longitude(lon)
+        }
+    
+    def test_ranges_cover_every_point_in_the_box(self):
+        for west, south, east, north in self.BOXES:
+            if west > east:
+                continue
+            
+            ranges = geohash_ranges(west, south, east, north)
+            inside = [
+                (lat, lon) for _, lat, lon in self.points
+                if south <= lat <= north and west <= lon <= east
+            ]
+            
+            self.assertLessEqual(len(ranges), MAX_COVER_CELLS)
+            self.assertTrue(inside)
+            for geohash in encode_geohashes(*zip(*inside)):
+                self.assertTrue(
+                    any(low <= geohash and (high is None or geohash < high) for low, high in ranges),
+                    (west, south, east, north, geohash)
+                )
+    
+    def test_records_in_bbox_match_a_brute_force_filter(self):
+        for box in self.BOXES:
+            found = set(records_in_bbox(self.data_file, *box).values_list('id', flat=True))
+            
+            self.assertEqual(found, self.brute_force_bbox(*box), box)
+    
+    def test_records_within_radius_match_a_brute_force_filter(self):
+        for latitude, longitude, radius_m in [(0.0, 0.0, 800), (0.001, 179.9995, 1000), (-0.002, -179.999, 600)]:
+            found = records_within_radius(self.data_file, latitude, longitude, radius_m)
+            expected = {
+                record_id for record_id, lat, lon in self.points
+                if haversine((latitude, longitude), (lat, lon)) * 1000 <= radius_m
+            }
+            
+            self.assertEqual({record['id'] for record in found}, expected)
+            self.assertTrue(expected)
+            self.assertEqual([record['distance_m'] for record in found], sorted(record['distance_m'] for record in found))
+
+
+class ClusterCellTests(TestCase):
+    """Incremental map cluster cells against a full rebuild"""
+    
+    def setUp(self):
+        self.data_file = DataFile.objects.create(file='uploads/test.csv', original_filename='test.csv')
+        self.technician = Technician.objects.create(technician_id=9001, data_file=self.data_file)
+        self.rng = np.random.default_rng(17)
+    
+    def add_records(self, count, longitude=78.4, duplicate=False):
+        TripRecord.objects.bulk_create([
+            TripRecord(
+                technician=self.technician, trip_type='pickup', created_at=utc(2024, 1, 1, 8), duplicate=duplicate,
+                latitude=float(17.3 + self.rng.random() / 10), longitude=float(longitude + self.rng.random() / 10)
+            )
+            for _ in range(count)
+        ])
+    
+    def cells(self):
+        return {
+            (zoom, x, y): (count, latitude_sum, longitude_sum)
+            for zoom, x, y, count, latitude_sum, longitude_sum in ClusterCell.objects.filter(data_file=self.data_file).values_list(
+                'zoom', 'x', 'y', 'point_count', 'latitude_sum', 'longitude_sum'
+            )
+        }
+    
+    def test_extend_after_rebuild_matches_a_full_rebuild(self):
+        self.add_records(40)
+        TripRecord.objects.create(technician=self.technician, trip_type='pickup', created_at=utc(2024, 1, 1, 9))
+        rebuild_cluster_index(self.data_file)
+        
+        last_id = TripRecord.objects.order_by('-id').values_list('id', flat=True).first()
+        self.add_records(30)
+        self.add_records(10, longitude=80.0)
+        self.add_records(5, duplicate=True)
+        extend_cluster_index(self.data_file, last_id)
+        extended = self.cells()
+        
+        rebuild_cluster_index(self.data_file)
+        rebuilt = self.cells()
+        
+        self.assertEqual(extended.keys(), rebuilt.keys())
+        for key, (count, latitude_sum, longitude_sum) in rebuilt.items():
+            self.assertEqual(extended[key][0], count)
+            self.assertAlmostEqual(extended[key][1], latitude_sum)
+            self.assertAlmostEqual(extended[key][2], longitude_sum)
+        self.assertEqual(sum(count for (zoom, _, _), (count, _, _) in rebuilt.items() if zoom == 0), 80)
+    
+    def test_cells_across_the_antimeridian(self):
+        for latitude, longitude in [(0.5, 179.9), (0.5, 179.95), (-0.5, -179.9), (0.5, 0.0), (20.0, 179.9)]:
+            TripRecord.objects.create(
+                technician=self.technician, trip_type='pickup', created_at=utc(2024, 1, 1, 8),
+                latitude=latitude, longitude=longitude
+            )
+        rebuild_cluster_index(self.data_file)
+        
+        for zoom in (3, 8, CLUSTER_MAX_ZOOM, CLUSTER_MAX_ZOOM + 2):
+            cells = get_cluster_cells(self.data_file, zoom, 179.5, -1, -179.5, 1)
+            
+            self.assertEqual(sum(cell['count'] for cell in cells), 3, zoom)
+            self.assertTrue(all(abs(cell['long']) > 179 for cell in cells), zoom)
+        
+        # The same box not crossing the antimeridian spans the other way round
+        cells = get_cluster_cells(self.data_file, 8, -179.5, -1, 179.5, 1)
+        self.assertEqual([cell['count'] for cell in cells], [1])
+
+
+class DistanceSummaryTests(TestCase):
+    """Fleet distance summary against numpy, and its query validation"""
+    
+    def setUp(self):
+        self.data_file = DataFile.objects.create(file='uploads/test.csv', original_filename='test.csv')
+        
+        rng = np.random.default_rng(20)
+        self.distances = np.round(rng.gamma(2, 40, 37), 2)
+        self.distances[5] = self.distances[6]
+        
+        for technician_id, distance in enumerate(self.distances, 9001):
+            technician = Technician.objects.create(technician_id=technician_id, data_file=self.data_file)
+            DistanceData.objects.create(technician=technician, total_distance=float(distance), trip_count=technician_id - 9000)
+    
+    def summary_of(self, **params):
+        return self.client.get(reverse('get_distance_data', args=[self.data_file.id]), params)
+    
+    def test_percentiles_and_histogram_match_numpy(self):
+        distance_data = DistanceData.objects.filter(technician__data_file=self.data_file)
+        
+        for count in (1, 2, 37):
+            subset = distance_data.filter(technician__technician_id__lt=9001 + count)
+            percentiles = distance_percentiles(subset, count)
+            
+            for percentile in DISTANCE_PERCENTILES:
+                self.assertAlmostEqual(percentiles[f"p{percentile}"], np.percentile(self.distances[:count], percentile), places=2)
+        
+        low, high = self.distances.min(), self.distances.max()
+        histogram = distance_histogram(distance_data, low, high)
+        counts, edges = np.histogram(self.distances, bins=DISTANCE_HISTOGRAM_BINS, range=(low, high))
+        
+        self.assertEqual([bin['count'] for bin in histogram], counts.tolist())
+        np.testing.assert_allclose([bin['start'] for bin in histogram], edges[:-1], atol=0.01)
+        self.assertEqual(distance_histogram(distance_data.filter(technician__technician_id=9001), low, low)[0]['count'], 1)
+    
+    def test_summary_pages_and_top_technicians(self):
+        summary = get_distance_summary(self.data_file, page=2, page_size=10)
+        
+        self.assertEqual(summary['total_technicians'], 37)
+        self.assertEqual(summary['avg_distance'], round(self.distances.mean(), 2))
+        self.assertEqual((summary['min_distance'], summary['max_distance']), (self.distances.min(), self.distances.max()))
+        self.assertEqual(sum(bin['count'] for bin in summary['histogram']), 37)
+        self.assertEqual(summary['page_count'], 4)
+        self.assertEqual([row['technician_id'] for row in summary['technicians']], list(range(9011, 9021)))
+        
+        summary = get_distance_summary(self.data_file, top=3)
+        longest = np.argsort(-self.distances, kind='stable')[:3]
+        
+        self.assertEqual([row['technician_id'] for row in summary['technicians']], (longest + 9001).tolist())
+        self.assertEqual(summary['top'], 3)
+    
+    def test_get_distance_data_validates_the_list_parameters(self):
+        for params in ({'top': 'x'}, {'page': '1.5'}, {'top': 0}, {'top': 1001}, {'page': 0}, {'page_size': 0}, {'page_size': 1001}):
+            response = self.summary_of(**params)
+            
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('error', response.json())
+        
+        response = self.summary_of(top=5)
+        self.assertEqual(len(response.json()['technicians']), 5)
+        
+        response = self.summary_of(page=4, page_size=10)
+        self.assertEqual(len(response.json()['technicians']), 7)
+        
+        self.assertEqual(self.summary_of(technician=0).status_code, 404)
+
+
+class TripSegmentTests(TestCase):
+    """Trip segments between consecutive records of a technician"""
+    
+    def test_segment_rows_join_located_trips_of_one_technician(self):
+        trips = pd.DataFrame({
+            'id': [1, 2, 3, 4, 5, 6, 7],
+            'technician_id': [10, 10, 10, 10, 10, 20, 20],
+            'latitude': [17.30, 17.31, math.nan, 17.33, 17.34, 17.35, 17.36],
+            'longitude': [78.40, 78.41, 78.42, 78.43, 78.44, 78.45, 78.46],
+            'created_at': [
+                utc(2024, 1, 1, 23, 50), utc(2024, 1, 2, 0, 10), utc(2024, 1, 2, 1), utc(2024, 1, 2, 2),
+                utc(2024, 1, 2, 2), utc(2024, 1, 2, 3), utc(2024, 1, 2, 3, 30)
+            ],
+        })
+        
+        rows = list(build_segment_rows(trips))
+        
+        self.assertEqual([(row[0], row[1], row[2]) for row in rows], [(10, 1, 2), (10, 4, 5), (20, 6, 7)])
+        self.assertEqual([row[6] for row in rows], [1200.0, 0.0, 1800.0])
+        
+        for technician_id, from_id, to_id, started_at, ended_at, distance_km, seconds, speed in rows:
+            start, end = trips.set_index('id').loc[[from_id, to_id]].itertuples(index=False)
+            
+            self.assertAlmostEqual(distance_km, haversine((start.latitude, start.longitude), (end.latitude, end.longitude)))
+            if seconds:
+                self.assertAlmostEqual(speed, distance_km / (seconds / 3600))
+            else:
+                self.assertIsNone(speed)
+        
+        # The first segment crosses midnight and keeps both ends
+        self.assertEqual(
+            (rows[0][3], rows[0][4]),
+            tuple(connection.ops.adapt_datetimefield_value(moment.replace(tzinfo=None)) for moment in (utc(2024, 1, 1, 23, 50), utc(2024, 1, 2, 0, 10)))
+        )
+    
+    def test_calculated_distances_store_the_segments(self):
+        data_file = DataFile.objects.create(file='uploads/test.csv', original_filename='test.csv')
+        technician = Technician.objects.create(technician_id=9001, data_file=data_file)
+        TripRecord.objects.bulk_create([
+            TripRecord(technician=technician, trip_type='pickup', created_at=utc(2024, 1, 1, hour), latitude=17.3 + hour / 100, longitude=78.4)
+            for hour in (8, 9, 10)
+        ] + [TripRecord(technician=technician, trip_type='pickup', created_at=utc(2024, 1, 1, 11), duplicate=True, latitude=10.0, longitude=10.0)])
+        
+        calculate_technician_distances(data_file)
+        
+        segments = list(TripSegment.objects.filter(technician=technician).values_list('distance_km', 'duration_seconds'))
+        self.assertEqual([seconds for _, seconds in segments], [3600.0, 3600.0])
+        self.assertAlmostEqual(sum(distance for distance, _ in segments), DistanceData.objects.get(technician=technician).total_distance, places=2)
+
+
+class DailyRollupTests(TestCase):
+    """Partial daily rollup rebuilds against a full rebuild"""
+    
+    def setUp(self):
+        self.data_file = DataFile.objects.create(file='uploads/test.csv', original_filename='test.csv')
+        self.technician = Technician.objects.create(technician_id=9001, data_file=self.data_file)
+        other = Technician.objects.create(technician_id=9002, data_file=self.data_file)
+        
+        TripRecord.objects.bulk_create([
+            TripRecord(technician=self.technician, trip_type=trip_type, created_at=created_at, latitude=latitude, longitude=78.4)
+            for trip_type, created_at, latitude in [
+                ('punch_in', utc(2024, 1, 1, 8), 17.30),
+                ('pickup', utc(2024, 1, 1, 12), 17.32),
+                ('pickup', utc(2024, 1, 2, 9), 17.33),
+                ('pickup', utc(2024, 1, 2, 23, 50), 17.35),
+                ('punch_out', utc(2024, 1, 3, 0, 10), 17.36),
+                ('punch_in', utc(2024, 1, 3, 8), 17.38),
+            ]
+        ] + [
+            TripRecord(technician=other, trip_type='pickup', created_at=utc(2024, 1, day, 10), latitude=17.0 + day / 100, longitude=78.0)
+            for day in (1, 2, 3)
+        ])
+        
+        calculate_technician_distances(self.data_file)
+    
+    def rollups(self):
+        return list(DailyRollup.objects.filter(technician__data_file=self.data_file).order_by('technician_id', 'date').values_list(
+            'technician_id', 'date', 'trip_count', 'duplicate_count', 'trip_type_counts',
+            'punch_in_hours', 'first_event_at', 'last_event_at', 'distance_km'
+        ))
+    
+    def test_rebuild_since_matches_a_full_rebuild(self):
+        # A late record between the two ends of the segment crossing midnight
+        # changes the distance of the day before since
+        since = utc(2024, 1, 3, 0, 5)
+        TripRecord.objects.bulk_create([
+            TripRecord(technician=self.technician, trip_type='pickup', created_at=since, latitude=17.50, longitude=78.6),
+            TripRecord(technician=self.technician, trip_type='pickup', created_at=utc(2024, 1, 3, 8), duplicate=True, latitude=17.38, longitude=78.4),
+        ])
+        
+        with patch('dashboard.utils.distance_analyzer.rebuild_daily_rollups'):
+            calculate_technician_distances(self.data_file)
+        
+        stale = self.rollups()
+        rebuild_daily_rollups(self.data_file, since=since)
+        partial = self.rollups()
+        
+        rebuild_daily_rollups(self.data_file)
+        full = self.rollups()
+        
+        self.assertEqual(partial, full)
+        self.assertNotEqual(stale, full)
+        
+        # Both the day the crossing segment starts and the day of since changed
+        changed = {(row[0], row[1].day) for row, old in zip(full, stale) if row != old}
+        self.assertEqual(changed, {(self.technician.id, 2), (self.technician.id, 3)})
+    
+    def test_rebuild_since_leaves_earlier_days_and_other_technicians(self):
+        before = self.rollups()
+        DailyRollup.objects.update(distance_km=0)
+        
+        rebuild_daily_rollups(self.data_file, technician_pks=[self.technician.id], since=utc(2024, 1, 3, 0, 15))
+        
+        # Only the technician's day of since is rebuilt; the rest keep the zeroed distance
+        for row, old in zip(self.rollups(), before):
+            rebuilt = (row[0], row[1].day) == (self.technician.id, 3)
+            self.assertEqual(row, old if rebuilt else old[:-1] + (0,))
+
+
+class SaveToDatabaseTests(TestCase):
+    """Columnar inserts of cleaned frames"""
+    
+    def test_columns_are_saved_like_model_fields(self):
+        data_file = DataFile.objects.create(file='uploads/test.csv', original_filename='test.csv')
+        existing = Technician.objects.create(technician_id=9001, data_file=data_file)
+        frame = pd.DataFrame({
+            'technician_id': [9001, 9002, 9002, 9003, 9001],
+            'trip_type': ['punch_in', 'pickup', 'pickup', 'delivery', 'punch_out'],
+            'created_at': pd.to_datetime(['2024-01-01 08:00', '2024-01-01 09:00', '2024-01-01 09:30', '2024-01-01 10:00', '2024-01-01 17:00']),
+            'location': ['A', '', 'B', 'C', ''],
+            'latitude': [45.0, 45.1, math.nan, 45.3, 45.4],
+            'longitude': [7.0, 7.1, 7.2, 7.3, 7.4],
+        })
+        
+        self.assertEqual(save_to_database(frame, data_file, batch_size=2), 5)
+        
+        technicians = dict(Technician.objects.filter(data_file=data_file).values_list('technician_id', 'id'))
+        self.assertEqual(sorted(technicians), [9001, 9002, 9003])
+        self.assertEqual(technicians[9001], existing.id)
+        
+        records = list(TripRecord.objects.order_by('created_at').values_list(
+            'technician__technician_id', 'trip_type', 'created_at', 'updated_at', 'location', 'latitude', 'longitude', 'duplicate', 'geohash'
+        ))
+        self.assertEqual(records[0], (9001, 'punch_in', utc(2024, 1, 1, 8), None, 'A', 45.0, 7.0, False, encode_geohashes([45.0], [7.0])[0]))
+        self.assertEqual(records[1][4], None)
+        self.assertEqual((records[2][5], records[2][8]), (None, ''))
+        self.assertEqual([record[0] for record in records], [9001, 9002, 9002, 9003, 9001])
+    
+    def test_insert_rows_sends_every_batch(self):
+        data_file = DataFile.objects.create(file='uploads/test.csv', original_filename='test.csv')
+        rows = ((technician_id, data_file.id) for technician_id in range(9001, 9008))
+        
+        with CaptureQueriesContext(connection) as queries:
+            inserted = insert_rows(Technician, ['technician_id', 'data_file'], rows, batch_size=3)
+        
+        # One executemany per batch
+        self.assertEqual(sum('INSERT INTO' in query['sql'] for query in queries), 3)
+        self.assertEqual(inserted, 7)
+        self.assertEqual(
+            list(Technician.objects.filter(data_file=data_file).order_by('technician_id').values_list('technician_id', flat=True)),
+            list(range(9001, 9008))
+        )
+
+
+class BulkLoadTests(TransactionTestCase):
+    """SQLite pragmas around a bulk load"""
+    
+    def read_pragmas(self):
+        with connection.cursor() as cursor:
+            values = {}
+            for name in SQLITE_BULK_LOAD_PRAGMAS:
+                cursor.execute(f"PRAGMA {name}")
+                values[name] = cursor.fetchone()[0]
+        return values
+    
+    def test_pragmas_apply_inside_and_are_restored(self):
+        before = self.read_pragmas()
+        
+        with bulk_load() as batch_size:
+            inside = self.read_pragmas()
+            self.assertTrue(connection.in_atomic_block)
+        
+        self.assertEqual(batch_size, BULK_LOAD_BATCH_SIZE)
+        # synchronous and temp_store read back as numbers: NORMAL is 1, MEMORY is 2
+        self.assertEqual(inside, {'synchronous': 1, 'cache_size': -262144, 'temp_store': 2})
+        self.assertNotEqual(before, inside)
+        self.assertEqual(self.read_pragmas(), before)
+    
+    def test_pragmas_are_skipped_inside_an_atomic_block(self):
+        before = self.read_pragmas()
+        
+        with transaction.atomic():
+            with bulk_load():
+                self.assertEqual(self.read_pragmas(), before)
+        
+        self.assertEqual(self.read_pragmas(), before)
+    
+    def test_failed_load_rolls_back_and_restores_pragmas(self):
+        data_file = DataFile.objects.create(file='uploads/test.csv', original_filename='test.csv')
+        before = self.read_pragmas()
+        
+        with self.assertRaises(ValueError):
+            with bulk_load() as batch_size:
+                insert_rows(Technician, ['technician_id', 'data_file'], [(9001, data_file.id)], batch_size)
+                raise ValueError('load failed')
+        
+        self.assertFalse(Technician.objects.filter(data_file=data_file).exists())
+        self.assertEqual(self.read_pragmas(), before)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class WorkbookStreamingTests(TestCase):
+    """Streaming workbooks in chunks against reading them whole"""
+    
+    def workbook(self, first_id=9001):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(['technician_id', 'trip_type', 'created_at', 'location', 'lat', 'long'])
+        
+        for hour in range(7):
+            sheet.append([first_id + hour % 2, 'pickup', datetime(2024, 1, 1, 8 + hour), 'A' if hour % 3 else None, 45.0 + hour / 100, 7.0])
+            if hour == 2:
+                sheet.append([None] * 6)
+        
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        return buffer.getvalue()
+    
+    def test_chunks_match_the_whole_workbook(self):
+        path = os.path.join(settings.MEDIA_ROOT, 'trips.xlsx')
+        with open(path, 'wb') as output:
+            output.write(self.workbook())
+        
+        chunks = list(iter_excel_rows(path, chunk_size=3))
+        whole = pd.read_excel(path).dropna(how='all')
+        
+        self.assertEqual([len(chunk) for chunk in chunks], [3, 2, 2])
+        pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), whole.reset_index(drop=True), check_dtype=False)
+    
+    def test_streamed_ingest_matches_a_whole_read(self):
+        snapshots = []
+        
+        # Technician ids are unique across data files
+        for streaming, first_id in ((True, 9001), (False, 9101)):
+            data_file = DataFile(original_filename='trips.xlsx')
+            data_file.file.save('trips.xlsx', ContentFile(self.workbook(first_id)))
+            
+            with patch.object(data_processor, 'STREAM_CHUNK_SIZE', 3):
+                result = process_excel_file(data_file, streaming=streaming)
+            
+            self.assertTrue(result['success'], result.get('error'))
+            snapshots.append(sorted(TripRecord.objects.filter(technician__data_file=data_file).annotate(
+                offset=F('technician__technician_id') - first_id
+            ).values_list(
+                'offset', 'trip_type', 'created_at', 'location', 'latitude', 'longitude', 'duplicate'
+            )))
+        
+        self.assertEqual(len(snapshots[0]), 7)
+        self.assertEqual(snapshots[0], snapshots[1])
+    
+    def test_oversized_uploads_are_refused(self):
+        upload = SimpleUploadedFile('trips.xlsx', self.workbook())
+        
+        with self.settings(MAX_UPLOAD_SIZE=len(upload) - 1):
+            form = FileUploadForm(files={'file': upload})
+            self.assertFalse(form.is_valid())
+        
+        self.assertIn('too large', form.errors['file'][0])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class FileReaderTests(TestCase):
+    """Readers in the FILE_READERS registry"""
+    
+    def setUp(self):
+        self.frame = pd.DataFrame({
+            'technician_id': [9001, 9002, 9001, 9002, 9001],
+            'trip_type': ['punch_in', 'pickup', ' Pickup', 'delivery', 'punch_out'],
+            'created_at': pd.to_datetime(['2024-01-01 08:00', '2024-01-01 09:00', '2024-01-01 10:00', '2024-01-01 11:00', '2024-01-01 17:00']),
+            'location': ['A', 'B', None, 'C', 'A'],
+            'lat': [45.0, 45.1, 45.2, None, 45.4],
+            'long': [7.0, 7.1, 7.2, 7.3, 7.4],
+        })
+        self.formats = {
+            '.csv': lambda frame: frame.to_csv(index=False).encode(),
+            '.ndjson': lambda frame: frame.to_json(orient='records', lines=True, date_format='iso').encode(),
+            '.jsonl': lambda frame: frame.to_json(orient='records', lines=True, date_format='iso').encode(),
+            '.parquet': lambda frame: frame.to_parquet(index=False),
+        }
+    
+    def saved(self, ext, frame):
+        data_file = DataFile(original_filename=f"trips{ext}")
+        data_file.file.save(f"trips{ext}", ContentFile(self.formats[ext](frame)))
+        return data_file
+    
+    def test_every_format_reads_the_same_rows(self):
+        self.assertEqual(set(FILE_READERS), set(self.formats) | {'.xlsx'})
+        
+        for ext in self.formats:
+            for streaming in (False, True):
+                data_file = self.saved(ext, self.frame)
+                chunks = list(read_data_chunks(data_file.file, streaming=streaming, chunk_size=2))
+                cleaned = clean_data(pd.concat(chunks, ignore_index=True))
+                
+                self.assertEqual(len(chunks), 3 if streaming else 1, (ext, streaming))
+                self.assertEqual(cleaned['technician_id'].astype('int64').tolist(), self.frame['technician_id'].tolist(), ext)
+                self.assertEqual(cleaned['trip_type'].tolist(), ['punch_in', 'pickup', 'pickup', 'delivery', 'punch_out'], ext)
+                self.assertEqual(
+                    aware_datetimes(cleaned['created_at']).tolist(),
+                    aware_datetimes(self.frame['created_at']).tolist(),
+                    ext
+                )
+                np.testing.assert_allclose(cleaned['latitude'].to_numpy(dtype=float), [45.0, 45.1, 45.2, 0.0, 45.4], err_msg=ext)
+    
+    def test_ingest_from_each_format(self):
+        for offset, ext in enumerate(self.formats):
+            # Technician ids are unique across data files
+            frame = self.frame.assign(technician_id=self.frame['technician_id'] + 10 * offset)
+            
+            result = process_excel_file(self.saved(ext, frame), streaming=False)
+            
+            self.assertTrue(result['success'], result.get('error'))
+            self.assertEqual((result['record_count'], result['technician_count']), (5, 2), ext)
+    
+    def test_unknown_extensions_are_rejected(self):
+        with self.assertRaisesMessage(ValueError, 'Unsupported file type: .xls'):
+            get_file_reader('trips.xls')
+        
+        self.assertIs(get_file_reader('TRIPS.CSV'), FILE_READERS['.csv'])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class IngestJobTests(TestCase):
+    """Claiming queued jobs, live progress and cleanup after failures"""
+    
+    def setUp(self):
+        cache.clear()
+        self.data_file = DataFile.objects.create(file='uploads/test.csv', original_filename='test.csv')
+    
+    def test_jobs_are_claimed_oldest_first_and_once(self):
+        first = enqueue_ingest(self.data_file)
+        second = enqueue_ingest(self.data_file)
+        IngestJob.objects.filter(id=second.id).update(created_at=first.created_at - timedelta(minutes=1))
+        
+        claimed = [claim_next_job(), claim_next_job(), claim_next_job()]
+        
+        self.assertEqual([job and job.id for job in claimed], [second.id, first.id, None])
+        self.assertEqual(claimed[0].status, 'running')
+        self.assertIsNotNone(claimed[0].started_at)
+    
+    def test_progress_is_read_from_the_cache_while_running(self):
+        enqueue_ingest(self.data_file)
+        job = claim_next_job()
+        seen = []
+        
+        def process(data_file, progress):
+            progress('saving', 1200)
+            seen.append(self.client.get(reverse('get_ingest_progress', args=[data_file.id])).json())
+            return {'success': True, 'record_count': 2500, 'technician_count': 3}
+        
+        with patch('dashboard.utils.ingest_jobs.process_excel_file', side_effect=process):
+            run_ingest_job(job)
+        
+        self.assertEqual((seen[0]['status'], seen[0]['stage'], seen[0]['rows_processed']), ('running', 'saving', 1200))
+        
+        done = self.client.get(reverse('get_ingest_progress', args=[self.data_file.id])).json()
+        self.assertEqual((done['status'], done['stage'], done['rows_processed']), ('completed', 'done', 2500))
+        self.assertIsNone(cache.get(progress_cache_key(job)))
+    
+    def test_failed_ingest_drops_partial_rows(self):
+        enqueue_ingest(self.data_file)
+        
+        def process(data_file, progress):
+            Technician.objects.create(technician_id=9001, data_file=data_file)
+            return {'success': False, 'error': 'Bad row 12'}
+        
+        with patch('dashboard.utils.ingest_jobs.process_excel_file', side_effect=process):
+            run_ingest_job(claim_next_job())
+        
+        job = IngestJob.objects.get()
+        self.assertEqual((job.status, job.error), ('failed', 'Bad row 12'))
+        self.assertIsNotNone(job.finished_at)
+        self.assertFalse(Technician.objects.filter(data_file=self.data_file).exists())
+    
+    def test_failed_append_keeps_existing_rows(self):
+        DataFile.objects.filter(id=self.data_file.id).update(processed=True)
+        Technician.objects.create(technician_id=9001, data_file=self.data_file)
+        enqueue_ingest(self.data_file, file=ContentFile(b'', name='delta.csv'), content_hash='a' * 64)
+        
+        with patch('dashboard.utils.ingest_jobs.append_data_file', return_value={'success': False, 'error': 'Bad delta'}):
+            run_ingest_job(claim_next_job())
+        
+        self.data_file.refresh_from_db()
+        self.assertEqual(IngestJob.objects.get().status, 'failed')
+        self.assertTrue(Technician.objects.filter(data_file=self.data_file).exists())
+        self.assertEqual(self.data_file.content_hash, '')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class UploadShortCircuitTests(TestCase):
+    """Recognising repeated uploads and re-exports before ingesting them"""
+    
+    def setUp(self):
+        self.rows = [
+            (9001, 'punch_in', f"2024-01-01 {hour:02d}:00", 'A')
+            for hour in range(6, 18)
+        ]
+    
+    def upload(self, content, name='trips.csv'):
+        return self.client.post(reverse('upload_file'), {'file': SimpleUploadedFile(name, content)})
+    
+    def test_identical_upload_goes_to_the_processed_file(self):
+        content = trips_csv(*self.rows)
+        self.upload(content)
+        
+        data_file = DataFile.objects.get()
+        self.assertEqual(data_file.content_hash, hashlib.sha256(content).hexdigest())
+        run_ingest_job(claim_next_job())
+        
+        response = self.upload(content, name='copy.csv')
+        
+        self.assertRedirects(response, reverse('data_overview', args=[data_file.id]))
+        self.assertEqual(DataFile.objects.count(), 1)
+        self.assertEqual(IngestJob.objects.count(), 1)
+    
+    def test_grown_re_export_is_appended(self):
+        self.upload(trips_csv(*self.rows[:8]))
+        data_file = DataFile.objects.get()
+        run_ingest_job(claim_next_job())
+        
+        grown = trips_csv(*self.rows)
+        response = self.upload(grown, name='trips_2.csv')
+        
+        self.assertRedirects(response, reverse('data_overview', args=[data_file.id]))
+        self.assertEqual(DataFile.objects.count(), 1)
+        
+        job = claim_next_job()
+        self.assertEqual((job.data_file_id, job.original_filename), (data_file.id, 'trips_2.csv'))
+        run_ingest_job(job)
+        
+        data_file.refresh_from_db()
+        self.assertEqual(TripRecord.objects.filter(technician__data_file=data_file).count(), 12)
+        self.assertEqual(data_file.content_hash, hashlib.sha256(grown).hexdigest())
+    
+    def test_unrelated_upload_is_a_new_file(self):
+        self.upload(trips_csv(*self.rows))
+        run_ingest_job(claim_next_job())
+        
+        other = trips_csv(*[(9002, trip_type, created_at, location) for _, trip_type, created_at, location in self.rows])
+        self.upload(other, name='other.csv')
+        
+        self.assertEqual(DataFile.objects.count(), 2)
+        self.assertFalse(IngestJob.objects.filter(status='queued').exclude(file='').exists())
+        
+        # Without a file on disk there is nothing to compare
+        self.assertIsNone(find_overlapping_file(SimpleUploadedFile('trips.csv', trips_csv(*self.rows))))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class IngestProfilerTests(TestCase):
+    """Per-stage ingest profiles"""
+    
+    def test_stages_accumulate_over_calls(self):
+        profiler = IngestProfiler('full', trace_memory=True)
+        
+        with profiler.profiling():
+            for chunk in profiler.iterate('reading', [[1, 2, 3], [4, 5]]):
+                with profiler.stage('saving') as counts:
+                    list(Technician.objects.all())
+                    data = bytearray(4 * 1024 * 1024)
+                    counts['rows'] = len(chunk)
+            
+            with profiler.stage('rollups', 7):
+                pass
+        
+        profile = profiler.as_dict()
+        stages = {stage['name']: stage for stage in profile['stages']}
+        
+        self.assertEqual([stage['name'] for stage in profile['stages']], ['reading', 'saving', 'rollups'])
+        self.assertEqual((stages['reading']['calls'], stages['reading']['rows']), (3, 5))
+        self.assertEqual((stages['saving']['calls'], stages['saving']['rows'], stages['saving']['queries']), (2, 5, 2))
+        self.assertEqual((stages['rollups']['rows'], stages['rollups']['queries']), (7, 0))
+        self.assertEqual(profile['query_count'], 2)
+        self.assertEqual(profile['memory_source'], 'tracemalloc')
+        self.assertGreaterEqual(stages['saving']['peak_memory_mb'], 4)
+        self.assertEqual(profile['peak_memory_mb'], max(stage['peak_memory_mb'] for stage in profile['stages']))
+        self.assertFalse(tracemalloc.is_tracing())
+        del data
+    
+    def test_ingest_records_its_profile(self):
+        data_file = DataFile(original_filename='trips.csv')
+        data_file.file.save('trips.csv', ContentFile(trips_csv(
+            (9001, 'punch_in', '2024-01-01 08:00', 'A'),
+            (9001, 'pickup', '2024-01-01 09:00', 'B'),
+            (9002, 'pickup', '2024-01-01 09:30', 'B'),
+        )))
+        
+        process_excel_file(data_file, streaming=False)
+        
+        data_file.refresh_from_db()
+        profile = data_file.ingest_profile
+        stages = {stage['name']: stage for stage in profile['stages']}
+        
+        self.assertEqual(profile['mode'], 'full')
+        self.assertEqual(profile['memory_source'], 'rss')
+        self.assertEqual(stages['cleaning']['rows'], 3)
+        self.assertEqual(stages['saving']['rows'], 3)
+        self.assertGreater(profile['query_count'], 0)
+        self.assertLessEqual(sum(stage['queries'] for stage in profile['stages']), profile['query_count'])
+
+
+class RouteSimplifyTests(TestCase):
+    """Douglas-Peucker route simplification for map payloads"""
+    
+    def setUp(self):
+        rng = np.random.default_rng(16)
+        steps = rng.normal(0, 0.0004, (300, 2)).cumsum(axis=0)
+        self.latitude = 17.4 + steps[:, 0]
+        self.longitude = 78.4 + steps[:, 1]
+        self.keep = np.zeros(300, dtype=bool)
+        self.keep[[40, 41, 200]] = True
+    
+    def deviation(self, kept, point):
+        """Distance in metres from a point to the simplified span around it"""
+        x, y = project_meters(self.latitude, self.longitude)
+        end = np.searchsorted(kept, point)
+        return farthest_point(
+            np.array([x[kept[end - 1]], x[point], x[kept[end]]]),
+            np.array([y[kept[end - 1]], y[point], y[kept[end]]]),
+            0, 2
+        )[1]
+    
+    def test_dropped_points_are_within_the_tolerance(self):
+        kept = simplify_route(self.latitude, self.longitude, self.keep, 25, max_points=300)
+        
+        self.assertTrue({0, 40, 41, 200, 299} <= set(kept.tolist()))
+        self.assertLess(len(kept), 300)
+        for point in np.setdiff1d(np.arange(300), kept):
+            self.assertLess(self.deviation(kept, point), 25)
+    
+    def test_max_points_keeps_the_most_significant_points(self):
+        full = simplify_route(self.latitude, self.longitude, self.keep, 5, max_points=300)
+        capped = simplify_route(self.latitude, self.longitude, self.keep, 5, max_points=30)
+        
+        self.assertEqual(len(capped), 30)
+        self.assertTrue(set(capped.tolist()) <= set(full.tolist()))
+        
+        # More fixed points than the cap are sampled evenly, ends included
+        sampled = simplify_route(self.latitude, self.longitude, np.ones(300, dtype=bool), 5, max_points=4)
+        self.assertEqual(sampled.tolist(), [0, 100, 199, 299])
+    
+    def test_straight_routes_keep_their_ends(self):
+        latitude = np.linspace(17.0, 17.1, 50)
+        longitude = np.linspace(78.0, 78.2, 50)
+        
+        self.assertEqual(simplify_route(latitude, longitude, np.zeros(50, dtype=bool), 1, max_points=50).tolist(), [0, 49])
+        self.assertEqual(simplify_route(latitude[:2], longitude[:2], [False, False], 1, max_points=50).tolist(), [0, 1])
+    
+    def test_zoom_tolerance_halves_per_level(self):
+        self.assertAlmostEqual(zoom_tolerance_m(0, 0), ZOOM0_METERS_PER_PIXEL)
+        self.assertAlmostEqual(zoom_tolerance_m(12, 60, pixels=2), zoom_tolerance_m(11, 60))
+    
+    def test_map_route_is_simplified_for_the_zoom_level(self):
+        data_file = DataFile.objects.create(file='uploads/test.csv', original_filename='test.csv')
+        technician = Technician.objects.create(technician_id=9001, data_file=data_file)
+        TripRecord.objects.bulk_create([
+            TripRecord(
+                technician=technician, trip_type='pickup' if self.keep[i] else 'en_route',
+                created_at=utc(2024, 1, 1, 8) + timedelta(minutes=i),
+                latitude=float(self.latitude[i]), longitude=float(self.longitude[i])
+            )
+            for i in range(300)
+        ])
+        url = reverse('get_location_map_data', args=[data_file.id, technician.id])
+        
+        routes = {zoom: self.client.get(url, {'zoom': zoom}).json()['locations'] for zoom in (10, 18)}
+        
+        self.assertLess(len(routes[10]), len(routes[18]))
+        self.assertLessEqual(len(routes[18]), 300)
+        self.assertEqual(len(self.client.get(url).json()['locations']), 300)
+        self.assertEqual(sum(point['trip_type'] == 'pickup' for point in routes[10]), 3)
+        self.assertEqual(self.client.get(url, {'zoom': 'far'}).status_code, 400)
+
+
+class ReportStatisticsTests(TestCase):
+    """Report statistics built from one columnar trip load"""
+    
+    def setUp(self):
+        data_file = DataFile.objects.create(file='uploads/test.csv', original_filename='test.csv')
+        self.technician = Technician.objects.create(technician_id=9001, data_file=data_file)
+        
+        TripRecord.objects.bulk_create([
+            TripRecord(
+                technician=self.technician, trip_type=trip_type, created_at=created_at,
+                location=location, latitude=latitude, longitude=longitude, duplicate=duplicate
+            )
+            for trip_type, created_at, location, latitude, longitude, duplicate in [
+                ('punch_in', utc(2024, 1, 1, 20), 'Depot', 45.0, 7.0, False),
+                ('pickup', utc(2024, 1, 1, 21), None, 45.1, 7.1, False),
+                ('pickup', utc(2024, 1, 1, 21, 0, 5), None, 45.1, 7.1, True),
+                ('delivery', utc(2024, 1, 1, 23), 'Shop', 0.0, 0.0, False),
+                ('punch_out', utc(2024, 1, 2, 4), 'Depot', None, None, False),
+                ('pickup', utc(2024, 1, 2, 10), 'Shop', 45.2, 7.2, False),
+            ]
+        ])
+        DistanceData.objects.create(technician=self.technician, total_distance=30.0, trip_count=4)
+    
+    def test_context_is_built_from_one_trip_query(self):
+        with self.assertNumQueries(2):
+            context = analyze_technician_data(self.technician, load_report_trips(self.technician))
+        
+        self.assertEqual(context['total_records'], 5)
+        self.assertEqual(context['date_range'], {'start': '2024-01-01', 'end': '2024-01-02'})
+        self.assertEqual(
+            [(stat['trip_type'], stat['count'], stat['percentage']) for stat in context['trip_type_stats']],
+            [('punch_in', 1, 20.0), ('pickup', 2, 40.0), ('delivery', 1, 20.0), ('punch_out', 1, 20.0)]
+        )
+        self.assertEqual(context['punch_analysis']['pairs'], [
+            {'date': '2024-01-01', 'punch_in': '20:00:00', 'punch_out': '2024-01-02 04:00:00', 'duration_hours': 8.0}
+        ])
+        self.assertEqual(context['distance_stats'], {'total_distance': 30.0, 'trip_count': 4, 'avg_distance': 7.5})
+        self.assertEqual(
+            [(row['created_at'], row['location'], row['coordinates']) for row in context['trip_records']],
+            [
+                ('2024-01-01 20:00:00', 'Depot', '(45.000000, 7.000000)'),
+                ('2024-01-01 21:00:00', 'N/A', '(45.100000, 7.100000)'),
+                ('2024-01-01 23:00:00', 'Shop', 'N/A'),
+                ('2024-01-02 04:00:00', 'Depot', 'N/A'),
+                ('2024-01-02 10:00:00', 'Shop', '(45.200000, 7.200000)'),
+            ]
+        )
+    
+    def test_technician_without_punches_or_distances(self):
+        TripRecord.objects.filter(trip_type__startswith='punch').delete()
+        DistanceData.objects.all().delete()
+        
+        context = analyze_technician_data(self.technician, load_report_trips(self.technician))
+        
+        self.assertIsNone(context['punch_analysis'])
+        self.assertIsNone(context['distance_stats'])
+        self.assertEqual(sum(stat['percentage'] for stat in context['trip_type_stats']), 100)
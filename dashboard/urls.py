@@ -6,6 +6,10 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('upload/', views.upload_file, name='upload_file'),
     path('data/<int:file_id>/', views.data_overview, name='data_overview'),
+    path('data/<int:file_id>/append/', views.append_file, name='append_file'),
+    path('data/<int:file_id>/progress/', views.get_ingest_progress, name='get_ingest_progress'),
+    path('data/<int:file_id>/dirty/', views.get_dirty_status, name='get_dirty_status'),
+    path('data/<int:file_id>/recompute/', views.recompute_derived_data, name='recompute_derived_data'),
     path('data/<int:file_id>/delete/', views.delete_file, name='delete_file'),
     path('data/switch/', views.switch_file, name='switch_file'),
     
@@ -22,6 +26,7 @@ urlpatterns = [
     
     # Technician logs views
     path('data/<int:file_id>/technicians/', views.technician_logs, name='technician_logs'),
+    path('data/<int:file_id>/technicians/worked-hours/', views.get_worked_hours_data, name='get_worked_hours_data'),
     path('data/<int:file_id>/technicians/<int:technician_id>/summary/', views.get_technician_summary, name='get_technician_summary'),
     path('data/<int:file_id>/technicians/<int:technician_id>/punch-data/', views.get_punch_in_out_data, name='get_punch_in_out_data'),
     path('data/<int:file_id>/technicians/<int:technician_id>/timeline/', views.get_timeline_data, name='get_timeline_data'),
@@ -31,13 +36,23 @@ urlpatterns = [
     path('data/<int:file_id>/distance/calculate/', views.calculate_distances, name='calculate_distances'),
     path('data/<int:file_id>/distance/data/', views.get_distance_data, name='get_distance_data'),
     path('data/<int:file_id>/distance/chart/', views.get_distance_chart_data, name='get_distance_chart_data'),
+    path('data/<int:file_id>/distance/window/', views.get_distance_window_data, name='get_distance_window_data'),
     path('data/<int:file_id>/distance/map/<int:technician_id>/', views.get_location_map_data, name='get_location_map_data'),
+    path('data/<int:file_id>/distance/map/clusters/', views.get_cluster_map_data, name='get_cluster_map_data'),
+    
+    # Spatial queries
+    path('data/<int:file_id>/spatial/bbox/', views.get_bbox_records, name='get_bbox_records'),
+    path('data/<int:file_id>/spatial/radius/', views.get_radius_records, name='get_radius_records'),
+    path('data/<int:file_id>/spatial/nearest/', views.get_nearest_technicians, name='get_nearest_technicians'),
     
     # Report generation views
     path('data/<int:file_id>/reports/', views.report_generation, name='report_generation'),
     path('data/<int:file_id>/reports/generate/', views.generate_report, name='generate_report'),
+    path('data/<int:file_id>/reports/bulk/', views.generate_bulk_report, name='generate_bulk_report'),
     path('data/<int:file_id>/reports/list/', views.get_reports_list, name='get_reports_list'),
     path('reports/<int:report_id>/view/', views.view_report, name='view_report'),
     path('reports/<int:report_id>/download/', views.download_report, name='download_report'),
+    path('reports/bulk/<int:job_id>/download/', views.download_bulk_report, name='download_bulk_report'),
     path('reports/<int:report_id>/delete/', views.delete_report, name='delete_report'),
+    path('reports/cache/', views.get_report_cache_status, name='get_report_cache_status'),
 ]
\ No newline at end of file
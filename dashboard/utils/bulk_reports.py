@@ -0,0 +1,231 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import json
+import time
+import zipfile
+from django.conf import settings
+from django.db import connections
+from dashboard.models import Technician
+from dashboard.utils.report_generator import (
+    render_technician_report,
+    save_report,
+    report_data_version,
+    find_cached_report,
+    count_report_cache
+)
+
+
+def generate_bulk_reports(data_file, report_format="pdf", workers=None):
+    """
+    Generate a report for every technician of a data file
+    
+    Reports whose data is unchanged since they were last rendered are
+    reused first. The rest are rendered across a process pool and saved
+    by this process as each one completes, so SQLite only ever sees one
+    writer. The pool closes this process's database connections, so only
+    the generate_reports command and the ingest worker call this, never
+    a request.
+    
+    Args:
+        data_file: DataFile model instance
+        report_format: Format of the reports (pdf or html)
+        workers: Worker processes. Defaults to settings.REPORT_WORKERS;
+            1 renders in this process.
+    
+    Yields:
+        dict: Result per technician, in completion order, with the saved
+            file name and content, or the reason no report was made
+    """
+    if workers is None:
+        workers = settings.REPORT_WORKERS
+    
+    technicians = {technician.id: technician for technician in Technician.objects.filter(data_file=data_file)}
+    versions = {}
+    pending = []
+    
+    for technician_pk, technician in technicians.items():
+        versions[technician_pk] = report_data_version(technician, report_format)
+        report = find_cached_report(technician, versions[technician_pk])
+        count_report_cache(report is not None)
+        
+        if report:
+            yield cached_result(technician, report)
+        else:
+            pending.append(technician_pk)
+    
+    if workers <= 1 or len(pending) <= 1:
+        for technician_pk in pending:
+            yield store_result(technicians, versions, report_format, render_report_task(technician_pk, report_format))
+        return
+    
+    # Forked workers must not share this process's database connections
+    connections.close_all()
+    
+    with ProcessPoolExecutor(max_workers=min(workers, len(pending)), initializer=init_report_worker) as pool:
+        futures = [pool.submit(render_report_task, technician_pk, report_format) for technician_pk in pending]
+        
+        try:
+            for future in as_completed(futures):
+                yield store_result(technicians, versions, report_format, future.result())
+        finally:
+            # Stop rendering if the consumer goes away early
+            for future in futures:
+                future.cancel()
+
+
+def init_report_worker():
+    """Set up Django in a report worker process"""
+    import django
+    django.setup()
+
+
+def render_report_task(technician_pk, report_format):
+    """
+    Render one technician's report, in a worker process
+    
+    Returns:
+        dict: Technician primary key, report content and format or an
+            error message, and the render time in seconds
+    """
+    start = time.perf_counter()
+    result = {'technician_pk': technician_pk, 'content': None, 'report_type': None, 'error': None}
+    
+    try:
+        technician = Technician.objects.get(id=technician_pk)
+        result['content'], result['report_type'] = render_technician_report(technician, report_format)
+        if result['content'] is None:
+            result['error'] = "No data available for this technician"
+    except Exception as e:
+        result['error'] = str(e)
+    
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def cached_result(technician, report):
+    """Describe a reused report like a rendered one"""
+    start = time.perf_counter()
+    
+    with report.file.open('rb') as report_file:
+        content = report_file.read()
+    
+    return {
+        'technician_pk': technician.id,
+        'technician_id': technician.technician_id,
+        'report_id': report.id,
+        'report_type': report.report_type,
+        'file_name': f"Technician_{technician.technician_id}_Report.{report.report_type}",
+        'content': content,
+        'cached': True,
+        'error': None,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def store_result(technicians, versions, report_format, result):
+    """
+    Save a rendered report and describe it for the ZIP manifest
+    
+    An HTML fallback for a PDF request is saved without a data version,
+    so it is not reused for later PDF requests.
+    """
+    technician = technicians[result['technician_pk']]
+    result['technician_id'] = technician.technician_id
+    result['report_id'] = None
+    result['file_name'] = None
+    result['cached'] = False
+    
+    if result['content'] is not None:
+        data_version = versions[technician.id] if result['report_type'] == report_format else ''
+        report = save_report(technician, result['report_type'], result['content'], data_version)
+        result['report_id'] = report.id
+        result['file_name'] = f"Technician_{technician.technician_id}_Report.{result['report_type']}"
+    
+    return result
+
+
+class ZipChunks:
+    """
+    Write-only file object that collects what zipfile writes
+    
+    zipfile falls back to data descriptors on streams it cannot seek, so
+    each entry can be handed on as soon as it is written.
+    """
+    
+    def __init__(self):
+        self.chunks = []
+    
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def take(self):
+        """Return and forget everything written so far"""
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_reports_zip(results):
+    """
+    Stream report results into a ZIP archive
+    
+    A manifest.json entry with per-report timings and overall throughput
+    is written last.
+    
+    Args:
+        results: Iterable of results from generate_bulk_reports
+    
+    Yields:
+        bytes: Pieces of the ZIP archive
+    """
+    start = time.perf_counter()
+    buffer = ZipChunks()
+    manifest = []
+    
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for result in results:
+            if result['file_name']:
+                archive.writestr(result['file_name'], result['content'])
+            
+            manifest.append({
+                'technician_id': result['technician_id'],
+                'report_id': result['report_id'],
+                'report_type': result['report_type'],
+                'file_name': result['file_name'],
+                'cached': result['cached'],
+                'seconds': result['seconds'],
+                'error': result['error'],
+            })
+            
+            yield buffer.take()
+        
+        archive.writestr('manifest.json', json.dumps(summarize_bulk_reports(manifest, time.perf_counter() - start), indent=2))
+    
+    yield buffer.take()
+
+
+def summarize_bulk_reports(reports, seconds):
+    """
+    Summarize a bulk report run
+    
+    Args:
+        reports: Manifest entries, one per technician
+        seconds: Wall time of the run
+    
+    Returns:
+        dict: Counts, wall time, throughput and the per-report entries
+    """
+    generated = sum(1 for report in reports if report['file_name'])
+    
+    return {
+        'report_count': generated,
+        'cached_count': sum(1 for report in reports if report['cached']),
+        'failed_count': len(reports) - generated,
+        'seconds': round(seconds, 3),
+        'render_seconds': round(sum(report['seconds'] for report in reports), 3),
+        'reports_per_second': round(generated / seconds, 2) if seconds > 0 else 0,
+        'reports': reports,
+    }
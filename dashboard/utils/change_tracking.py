@@ -0,0 +1,183 @@
+import time
+from django.db.models import F
+from django.utils import timezone
+from dashboard.models import DataFile, Technician, Report
+from dashboard.utils.distance_analyzer import calculate_technician_distances
+from dashboard.utils.cluster_index import rebuild_cluster_index
+from dashboard.utils.report_generator import generate_technician_report
+
+
+# Technician keys per IN (...) filter, below SQLite's bound parameter limit
+DIRTY_BATCH_SIZE = 900
+
+
+def mark_technicians_dirty(technician_pks):
+    """
+    Mark technicians whose trip records were inserted, deleted or
+    re-flagged, so recompute_dirty_technicians refreshes their derived data
+    
+    The trips_version of their data files is bumped as well.
+    
+    Args:
+        technician_pks: Technician primary keys, or a queryset of them
+    
+    Returns:
+        int: Number of technicians marked
+    """
+    now = timezone.now()
+    
+    if not isinstance(technician_pks, (list, tuple, set)):
+        # A queryset is sent as a subquery
+        technicians = Technician.objects.filter(id__in=technician_pks)
+        bump_trips_version(technicians)
+        return technicians.update(dirty_at=now)
+    
+    technician_pks = list(technician_pks)
+    marked = 0
+    
+    for start in range(0, len(technician_pks), DIRTY_BATCH_SIZE):
+        technicians = Technician.objects.filter(id__in=technician_pks[start:start + DIRTY_BATCH_SIZE])
+        bump_trips_version(technicians)
+        marked += technicians.update(dirty_at=now)
+    
+    return marked
+
+
+def bump_trips_version(technicians):
+    """Bump the trips_version of the data files of a Technician queryset"""
+    DataFile.objects.filter(
+        id__in=technicians.values('data_file_id')
+    ).update(trips_version=F('trips_version') + 1)
+
+
+def recompute_dirty_technicians(data_file=None, reports=False, workers=None):
+    """
+    Refresh the derived data of dirty technicians only
+    
+    Distance data, trip segments and daily rollups are recalculated for
+    each dirty technician, and the map cluster cells of their files are
+    rebuilt. Technicians marked dirty again while this runs stay dirty
+    for the next run.
+    
+    Args:
+        data_file: Optional DataFile model instance to limit the recompute to
+        reports: Also regenerate the latest report of each dirty
+            technician that has one, in the same format
+        workers: Passed to calculate_technician_distances
+    
+    Returns:
+        dict: Numbers of technicians, files and reports refreshed and the
+            time taken
+    """
+    started = timezone.now()
+    start = time.perf_counter()
+    
+    dirty = Technician.objects.filter(dirty_at__isnull=False, dirty_at__lte=started)
+    if data_file:
+        dirty = dirty.filter(data_file=data_file)
+    
+    by_file = {}
+    for technician in dirty.order_by('data_file_id', 'technician_id'):
+        by_file.setdefault(technician.data_file_id, []).append(technician)
+    
+    report_count = 0
+    
+    for file_id, technicians in by_file.items():
+        dirty_file = DataFile.objects.get(id=file_id)
+        technician_pks = [technician.id for technician in technicians]
+        
+        # Take the whole-file paths when every technician is dirty
+        whole_file = len(technicians) == Technician.objects.filter(data_file_id=file_id).count()
+        
+        # Also rebuilds the technicians' daily rollups
+        calculate_technician_distances(dirty_file, workers=workers, technicians=None if whole_file else technicians)
+        
+        # Map cells are shared by all technicians of the file
+        rebuild_cluster_index(dirty_file)
+        
+        if reports:
+            report_count += regenerate_reports(technicians)
+        
+        clear_dirty_marks(technician_pks, started)
+    
+    return {
+        'technician_count': sum(len(technicians) for technicians in by_file.values()),
+        'data_file_count': len(by_file),
+        'report_count': report_count,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def clear_dirty_marks(technician_pks, started):
+    """
+    Clear the dirty marks of technicians whose derived data was recomputed
+    
+    Only marks that predate the recompute are cleared, so technicians
+    marked again while it ran stay dirty for the next run.
+    
+    Args:
+        technician_pks: Technician primary keys, or a queryset of them
+        started: Datetime the recompute started
+    
+    Returns:
+        int: Number of technicians cleared
+    """
+    if not isinstance(technician_pks, (list, tuple, set)):
+        return Technician.objects.filter(id__in=technician_pks, dirty_at__lte=started).update(dirty_at=None)
+    
+    technician_pks = list(technician_pks)
+    cleared = 0
+    
+    for start in range(0, len(technician_pks), DIRTY_BATCH_SIZE):
+        cleared += Technician.objects.filter(
+            id__in=technician_pks[start:start + DIRTY_BATCH_SIZE],
+            dirty_at__lte=started
+        ).update(dirty_at=None)
+    
+    return cleared
+
+
+def regenerate_reports(technicians):
+    """
+    Regenerate the latest report of technicians that have one
+    
+    Args:
+        technicians: Technician model instances
+    
+    Returns:
+        int: Number of reports generated
+    """
+    generated = 0
+    
+    for technician in technicians:
+        latest = Report.objects.filter(technician=technician).order_by('-created_at').first()
+        if latest is None:
+            continue
+        
+        report, _ = generate_technician_report(technician, latest.report_type)
+        if report:
+            generated += 1
+    
+    return generated
+
+
+def get_dirty_counts(data_file=None):
+    """
+    Count dirty technicians
+    
+    Args:
+        data_file: Optional DataFile model instance
+    
+    Returns:
+        dict: Number of dirty technicians and the time of the oldest mark
+    """
+    dirty = Technician.objects.filter(dirty_at__isnull=False)
+    if data_file:
+        dirty = dirty.filter(data_file=data_file)
+    
+    oldest = dirty.order_by('dirty_at').values_list('dirty_at', flat=True).first()
+    
+    return {
+        'dirty_count': dirty.count(),
+        'oldest_dirty_at': oldest.isoformat() if oldest else None,
+    }
@@ -0,0 +1,242 @@
+from itertools import islice, repeat
+import numpy as np
+import pandas as pd
+from django.db import connection, transaction
+from dashboard.models import TripRecord, ClusterCell
+from dashboard.utils.bulk_load import insert_rows
+
+
+# Deepest zoom level with precomputed cells; deeper queries use its cells
+CLUSTER_MAX_ZOOM = 16
+
+# Grid cells along each edge of a 256px map tile, so cells are 64px wide
+CELLS_PER_TILE = 4
+
+# Web Mercator cannot show the poles; latitudes are clamped to this
+MAX_MERCATOR_LATITUDE = 85.05112878
+
+# ClusterCell columns written by write_cluster_cells and add_cluster_cells, in tuple order
+CLUSTER_CELL_COLUMNS = ['data_file', 'zoom', 'x', 'y', 'point_count', 'latitude_sum', 'longitude_sum']
+
+# Rows per batch when reading points and writing cells
+CLUSTER_BATCH_SIZE = 50000
+
+
+def grid_size(zoom):
+    """Number of grid cells along each axis of the world at a zoom level"""
+    return CELLS_PER_TILE * 2 ** zoom
+
+
+def cell_coordinates(latitude, longitude, zoom):
+    """
+    Web Mercator grid cell of each point at a zoom level
+    
+    Args:
+        latitude: Latitudes in degrees
+        longitude: Longitudes in degrees
+        zoom: Zoom level
+    
+    Returns:
+        tuple: Arrays of cell x (west to east) and y (north to south)
+    """
+    size = grid_size(zoom)
+    latitude = np.radians(np.clip(latitude, -MAX_MERCATOR_LATITUDE, MAX_MERCATOR_LATITUDE))
+    
+    x = np.floor((np.asarray(longitude) + 180) / 360 * size)
+    y = np.floor((1 - np.log(np.tan(latitude) + 1 / np.cos(latitude)) / np.pi) / 2 * size)
+    
+    return (
+        np.clip(x, 0, size - 1).astype('int64'),
+        np.clip(y, 0, size - 1).astype('int64'),
+    )
+
+
+def build_cluster_cells(latitude, longitude):
+    """
+    Aggregate points into grid cells at every zoom level
+    
+    Points are binned once at CLUSTER_MAX_ZOOM; each coarser level is
+    built by merging 2x2 blocks of the level below.
+    
+    Args:
+        latitude: Latitudes in degrees
+        longitude: Longitudes in degrees
+    
+    Returns:
+        DataFrame: zoom, x, y, point_count, latitude_sum and longitude_sum
+            per non-empty cell
+    """
+    x, y = cell_coordinates(latitude, longitude, CLUSTER_MAX_ZOOM)
+    points = pd.DataFrame({
+        'x': x,
+        'y': y,
+        'point_count': 1,
+        'latitude_sum': latitude,
+        'longitude_sum': longitude,
+    })
+    
+    level = points.groupby(['x', 'y'], as_index=False).sum()
+    levels = []
+    
+    for zoom in range(CLUSTER_MAX_ZOOM, -1, -1):
+        levels.append(level.assign(zoom=zoom))
+        level = level.assign(x=level['x'] // 2, y=level['y'] // 2).groupby(['x', 'y'], as_index=False).sum()
+    
+    return pd.concat(levels, ignore_index=True)
+
+
+def located_points(trips):
+    """Load latitude and longitude arrays of non-duplicate trips with coordinates"""
+    points = trips.filter(
+        duplicate=False,
+        latitude__isnull=False,
+        longitude__isnull=False
+    ).values_list('latitude', 'longitude')
+    
+    df = pd.DataFrame.from_records(
+        points.iterator(chunk_size=CLUSTER_BATCH_SIZE),
+        columns=['latitude', 'longitude']
+    )
+    
+    return df['latitude'].to_numpy(dtype=float), df['longitude'].to_numpy(dtype=float)
+
+
+def cluster_cell_rows(data_file, cells):
+    """Database-ready tuples of cells, in CLUSTER_CELL_COLUMNS order"""
+    return zip(
+        repeat(data_file.id),
+        cells['zoom'].tolist(),
+        cells['x'].tolist(),
+        cells['y'].tolist(),
+        cells['point_count'].tolist(),
+        cells['latitude_sum'].tolist(),
+        cells['longitude_sum'].tolist(),
+    )
+
+
+def write_cluster_cells(data_file, cells):
+    """Replace the cells of a data file"""
+    with transaction.atomic():
+        ClusterCell.objects.filter(data_file=data_file).delete()
+        return insert_rows(ClusterCell, CLUSTER_CELL_COLUMNS, cluster_cell_rows(data_file, cells), CLUSTER_BATCH_SIZE)
+
+
+def add_cluster_cells(data_file, cells):
+    """
+    Add cell counts and sums to the stored cells of a data file
+    
+    Cells that exist are incremented in place and new cells are inserted,
+    in one upsert per batch, so untouched cells are never read or written.
+    
+    Args:
+        data_file: DataFile model instance
+        cells: DataFrame from build_cluster_cells
+    
+    Returns:
+        int: Number of cells written
+    """
+    opts = ClusterCell._meta
+    quote = connection.ops.quote_name
+    table = quote(opts.db_table)
+    columns = [quote(opts.get_field(name).column) for name in CLUSTER_CELL_COLUMNS]
+    keys, sums = columns[:4], columns[4:]
+    
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+        f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET "
+        + ', '.join(f"{column} = {table}.{column} + excluded.{column}" for column in sums)
+    )
+    
+    written = 0
+    rows = cluster_cell_rows(data_file, cells)
+    with transaction.atomic(), connection.cursor() as cursor:
+        while True:
+            batch = list(islice(rows, CLUSTER_BATCH_SIZE))
+            if not batch:
+                break
+            cursor.executemany(sql, batch)
+            written += len(batch)
+    
+    return written
+
+
+def rebuild_cluster_index(data_file):
+    """
+    Rebuild the map cluster cells of a data file from its trip records
+    
+    Args:
+        data_file: DataFile model instance
+    
+    Returns:
+        int: Number of cells written
+    """
+    latitude, longitude = located_points(TripRecord.objects.filter(technician__data_file=data_file))
+    
+    return write_cluster_cells(data_file, build_cluster_cells(latitude, longitude))
+
+
+def extend_cluster_index(data_file, after_id):
+    """
+    Add appended trip records to the map cluster cells of a data file
+    
+    Only records saved after after_id are binned; their counts and
+    coordinate sums are added to the existing cells.
+    
+    Args:
+        data_file: DataFile model instance
+        after_id: Highest TripRecord id before the append
+    
+    Returns:
+        int: Number of cells written
+    """
+    latitude, longitude = located_points(TripRecord.objects.filter(
+        technician__data_file=data_file,
+        id__gt=after_id
+    ))
+    
+    if not len(latitude):
+        return 0
+    
+    return add_cluster_cells(data_file, build_cluster_cells(latitude, longitude))
+
+
+def get_cluster_cells(data_file, zoom, west, south, east, north):
+    """
+    Get point clusters of a data file in the cells intersecting a bounding box
+    
+    Args:
+        data_file: DataFile model instance
+        zoom: Map zoom level; levels deeper than CLUSTER_MAX_ZOOM use
+            the cells of CLUSTER_MAX_ZOOM
+        west, south, east, north: Bounding box in degrees. A box crossing
+            the antimeridian has west greater than east.
+    
+    Returns:
+        list: Point count and centroid of each non-empty cell
+    """
+    zoom = min(zoom, CLUSTER_MAX_ZOOM)
+    (x_min, x_max), (y_max, y_min) = (
+        axis.tolist() for axis in cell_coordinates(np.array([south, north]), np.array([west, east]), zoom)
+    )
+    
+    cells = ClusterCell.objects.filter(
+        data_file=data_file,
+        zoom=zoom,
+        y__gte=y_min,
+        y__lte=y_max
+    )
+    
+    if x_min <= x_max:
+        cells = cells.filter(x__gte=x_min, x__lte=x_max)
+    else:
+        # Wrap around the antimeridian
+        cells = cells.filter(x__gte=x_min) | cells.filter(x__lte=x_max)
+    
+    return [{
+        'lat': latitude_sum / point_count,
+        'long': longitude_sum / point_count,
+        'count': point_count,
+        'cell': f"{zoom}/{x}/{y}",
+    } for x, y, point_count, latitude_sum, longitude_sum in cells.values_list(
+        'x', 'y', 'point_count', 'latitude_sum', 'longitude_sum'
+    )]
@@ -1,44 +1,220 @@
+import os
+import time
+import hashlib
+from io import BytesIO
 import pandas as pd
 import numpy as np
+from contextlib import nullcontext
+from itertools import islice, repeat
+from django.core.files.base import ContentFile
+from django.db.models import F, Max, Min, Window
+from django.db.models.functions import RowNumber
 from django.utils import timezone
-from dashboard.models import DataFile, Technician, TripRecord
+from openpyxl import load_workbook
+from dashboard.models import DataFile, Technician, TripRecord, DailyRollup
+from dashboard.utils.bulk_load import bulk_load, insert_rows, datetime_values, aware_datetimes
+from dashboard.utils.near_duplicates import flag_near_duplicates
+from dashboard.utils.distance_analyzer import calculate_technician_distances, extend_technician_distances
+from dashboard.utils.rollups import rebuild_daily_rollups, summarize_rollups
+from dashboard.utils.change_tracking import mark_technicians_dirty
+from dashboard.utils.cluster_index import rebuild_cluster_index, extend_cluster_index
+from dashboard.utils.spatial_index import encode_geohashes
+from dashboard.utils.ingest_profile import IngestProfiler
 
 
-def process_excel_file(data_file):
+# TripRecord columns written by the columnar insert path, in tuple order
+TRIP_RECORD_COLUMNS = [
+    'technician', 'trip_type', 'created_at', 'updated_at',
+    'location', 'latitude', 'longitude', 'duplicate', 'geohash',
+]
+
+# Rows sent to the database per executemany call
+INSERT_BATCH_SIZE = 10000
+
+# Files at least this large are streamed in chunks instead of read whole
+STREAM_THRESHOLD_BYTES = 20 * 1024 * 1024
+
+# Rows per chunk when streaming a workbook
+STREAM_CHUNK_SIZE = 50000
+
+# Column dtypes pushed down to the text readers so values are typed at read time
+READ_DTYPES = {
+    'technician_id': 'Int64',
+    'trip_type': 'object',
+    'location': 'object',
+    'lat': 'float64',
+    'long': 'float64',
+    'latitude': 'float64',
+    'longitude': 'float64',
+}
+
+# Columns parsed as datetimes at read time
+DATE_COLUMNS = ['created_at', 'updated_at']
+
+# Throughput save_to_database should sustain, checked by benchmark_ingest
+INGEST_TARGET_ROWS_PER_SEC = 50000
+
+# Leading rows digested into DataFile.head_hash to recognise re-exports
+HEAD_ROWS = 100
+
+
+def process_excel_file(data_file, streaming=None, progress=None, bulk=True):
     """
-    Process the uploaded Excel file and save records to the database
+    Process the uploaded data file and save records to the database
     
     Args:
         data_file: DataFile model instance
+        streaming: Read the file in fixed-size chunks. When None,
+            streaming is used for files of STREAM_THRESHOLD_BYTES or more.
+        progress: Optional callable taking (stage, rows_processed),
+            called as the pipeline moves through its stages
+        bulk: Load the whole file in one transaction with write-friendly
+            database settings (see bulk_load). When False, each insert
+            batch commits on its own.
     
     Returns:
         dict: Summary of processing results
     """
+    if progress is None:
+        progress = lambda stage, rows_processed: None
+    
     try:
-        # Read Excel file
-        df = pd.read_excel(data_file.file.path)
+        with (bulk_load() if bulk else nullcontext(INSERT_BATCH_SIZE)) as batch_size:
+            return ingest_data_file(data_file, streaming, progress, batch_size)
+    
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+
+def ingest_data_file(data_file, streaming, progress, batch_size):
+    """
+    Run the read, clean, save and duplicate stages for a data file
+    
+    Args:
+        data_file: DataFile model instance
+        streaming: Passed to read_data_chunks
+        progress: Callable taking (stage, rows_processed)
+        batch_size: Rows per insert batch in save_to_database
+    
+    Returns:
+        dict: Summary of processing results, including the load time
+    """
+    record_count = 0
+    duplicate_count = 0
+    duplicates = DuplicateMarker()
+    hashes = []
+    profiler = IngestProfiler('full')
+    progress('reading', record_count)
+    load_start = time.perf_counter()
+    
+    with profiler.profiling():
+        # Clean, flag and save each chunk; only one chunk is held in memory at a time
+        for df in profiler.iterate('reading', read_data_chunks(data_file.file, streaming)):
+            progress('cleaning', record_count)
+            with profiler.stage('cleaning', len(df)):
+                df_cleaned = clean_data(df, copy=False)
+                hashes.append(row_hashes(df_cleaned))
+            
+            progress('duplicates', record_count)
+            with profiler.stage('duplicates', len(df_cleaned)):
+                duplicate_count += duplicates.mark(df_cleaned)
+            
+            progress('saving', record_count)
+            with profiler.stage('saving') as counts:
+                counts['rows'] = save_to_database(df_cleaned, data_file, batch_size)
+            
+            record_count += counts['rows']
+            del df, df_cleaned
+            
+            progress('reading', record_count)
         
-        # Clean the data
-        df_cleaned = clean_data(df)
+        # A row that predates an already-saved original makes that original a
+        # duplicate; settle those with one set-based pass over the database
+        if duplicates.displaced:
+            with profiler.stage('identify_duplicates') as counts:
+                counts['rows'] = identify_duplicates(data_file)
+            
+            duplicate_count = TripRecord.objects.filter(
+                technician__data_file=data_file,
+                duplicate=True
+            ).count()
         
-        # Create record in database
-        data_file.record_count = len(df_cleaned)
-        data_file.processed = True
-        data_file.save()
+        load_seconds = time.perf_counter() - load_start
         
-        # Save technicians and trip records
-        save_to_database(df_cleaned, data_file)
+        # Flag GPS-jitter near-duplicates within the configured tolerances
+        progress('near_duplicates', record_count)
+        with profiler.stage('near_duplicates') as counts:
+            counts['rows'] = flag_near_duplicates(data_file)
         
-        # Identify duplicates
-        duplicate_count = identify_duplicates(data_file)
+        duplicate_count += counts['rows']
         
-        return {
-            'success': True,
-            'record_count': data_file.record_count,
-            'technician_count': Technician.objects.filter(data_file=data_file).count(),
-            'duplicate_count': duplicate_count
-        }
+        # Aggregate per technician and day once duplicate flags are final
+        progress('rollups', record_count)
+        with profiler.stage('rollups') as counts:
+            counts['rows'] = rebuild_daily_rollups(data_file)
+        
+        progress('cluster_index', record_count)
+        with profiler.stage('cluster_index') as counts:
+            counts['rows'] = rebuild_cluster_index(data_file)
+        
+        # Distances are not calculated yet, so every technician starts dirty
+        mark_technicians_dirty(Technician.objects.filter(data_file=data_file).values('id'))
         
+        # Keep row hashes so a later re-export only ingests its new rows
+        with profiler.stage('row_hashes') as counts:
+            hashes = np.concatenate(hashes) if hashes else np.array([], dtype='uint64')
+            counts['rows'] = len(hashes)
+            data_file.head_hash = head_digest(hashes)
+            store_row_hashes(data_file, hashes)
+    
+    # Create record in database
+    data_file.record_count = record_count
+    data_file.processed = True
+    data_file.ingest_profile = profiler.as_dict()
+    
+    # trips_version was bumped in the database while ingesting
+    data_file.save(update_fields=['head_hash', 'row_hashes', 'record_count', 'processed', 'ingest_profile'])
+    
+    return {
+        'success': True,
+        'record_count': data_file.record_count,
+        'technician_count': Technician.objects.filter(data_file=data_file).count(),
+        'duplicate_count': duplicate_count,
+        'load_seconds': round(load_seconds, 3),
+        'profile': data_file.ingest_profile
+    }
+
+
+def append_data_file(data_file, source, streaming=None, progress=None, bulk=True):
+    """
+    Append a delta file to an already processed data file
+    
+    Only rows whose hash was not ingested from an earlier upload are
+    saved, and derived data is extended rather than rebuilt, so the cost
+    follows the size of the delta rather than the whole history. Late
+    rows, at or before their technician's latest existing record, are
+    saved too; their technicians' distances are recalculated.
+    
+    Args:
+        data_file: Processed DataFile model instance
+        source: FieldFile of the delta upload
+        streaming: Passed to read_data_chunks
+        progress: Optional callable taking (stage, rows_processed)
+        bulk: Load inside bulk_load, as in process_excel_file
+    
+    Returns:
+        dict: Summary of processing results
+    """
+    if progress is None:
+        progress = lambda stage, rows_processed: None
+    
+    try:
+        with (bulk_load() if bulk else nullcontext(INSERT_BATCH_SIZE)) as batch_size:
+            return ingest_delta_file(data_file, source, streaming, progress, batch_size)
+    
     except Exception as e:
         return {
             'success': False,
@@ -46,18 +222,369 @@ def process_excel_file(data_file):
         }
 
 
-def clean_data(df):
+def ingest_delta_file(data_file, source, streaming, progress, batch_size):
+    """
+    Run the append stages for a delta file
+    
+    Args:
+        data_file: Processed DataFile model instance
+        source: FieldFile of the delta upload
+        streaming: Passed to read_data_chunks
+        progress: Callable taking (stage, rows_processed)
+        batch_size: Rows per insert batch in save_to_database
+    
+    Returns:
+        dict: Summary of processing results, including skipped rows
+    """
+    if not data_file.processed:
+        raise ValueError("The data file has not finished processing; append once it has")
+    
+    # Latest existing record per technician, fixed before anything is
+    # appended. Rows at or before it are still ingested, but land inside
+    # history that derived data already covers
+    latest = Technician.objects.filter(data_file=data_file).annotate(
+        last_created_at=Max('trips__created_at')
+    ).values_list('id', 'technician_id', 'last_created_at')
+    
+    watermarks = {pk: last for pk, _, last in latest if last is not None}
+    tech_pks = {tech_id: pk for pk, tech_id, _ in latest}
+    watermark_ns = pd.Series({
+        tech_id: pd.Timestamp(last).value for pk, tech_id, last in latest if last is not None
+    }, dtype='float64')
+    
+    # Records saved by this append get higher ids
+    last_record_id = TripRecord.objects.filter(technician__data_file=data_file).aggregate(last=Max('id'))['last'] or 0
+    
+    # Rows already ingested from earlier uploads, by row hash
+    known_hashes = load_row_hashes(data_file)
+    new_hashes = []
+    
+    record_count = 0
+    skipped_count = 0
+    duplicate_count = 0
+    duplicates = DuplicateMarker()
+    seen_technicians = set()
+    late_technicians = set()
+    since = None
+    profiler = IngestProfiler('append')
+    progress('reading', record_count)
+    load_start = time.perf_counter()
+    
+    with profiler.profiling():
+        for df in profiler.iterate('reading', read_data_chunks(source, streaming)):
+            progress('cleaning', record_count)
+            with profiler.stage('cleaning', len(df)):
+                df_cleaned = clean_data(df, copy=False)
+                
+                # Keep only rows not ingested from an earlier upload
+                hashes = row_hashes(df_cleaned)
+                is_new = ~np.isin(hashes, known_hashes)
+                new_hashes.append(hashes[is_new])
+                skipped_count += int((~is_new).sum())
+                df_cleaned = df_cleaned[is_new].copy()
+            
+            if df_cleaned.empty:
+                continue
+            
+            times = epoch_nanoseconds(df_cleaned['created_at'])
+            first_new = pd.Timestamp(int(times.min()), tz='UTC').to_pydatetime()
+            since = first_new if since is None else min(since, first_new)
+            
+            # Technicians receiving rows at or before their latest existing record
+            technician_ids = df_cleaned['technician_id'].astype('int64')
+            late = times <= technician_ids.map(watermark_ns).to_numpy()
+            late_technicians |= set(pd.unique(technician_ids[late]).tolist())
+            
+            # Compare new rows only with the existing rows of the same technicians
+            progress('duplicates', record_count)
+            with profiler.stage('duplicates', len(df_cleaned)):
+                chunk_technicians = set(pd.unique(df_cleaned['technician_id'].astype('int64')).tolist())
+                duplicates.remember(existing_trip_keys(data_file, chunk_technicians - seen_technicians))
+                seen_technicians |= chunk_technicians
+                duplicate_count += duplicates.mark(df_cleaned)
+            
+            progress('saving', record_count)
+            with profiler.stage('saving') as counts:
+                counts['rows'] = save_to_database(df_cleaned, data_file, batch_size)
+            
+            record_count += counts['rows']
+            del df, df_cleaned
+            
+            progress('reading', record_count)
+        
+        if duplicates.displaced:
+            with profiler.stage('identify_duplicates') as counts:
+                counts['rows'] = identify_duplicates(data_file)
+            
+            duplicate_count += counts['rows']
+        
+        load_seconds = time.perf_counter() - load_start
+        
+        if record_count:
+            progress('near_duplicates', record_count)
+            with profiler.stage('near_duplicates') as counts:
+                counts['rows'] = flag_near_duplicates(data_file, since=since)
+            
+            duplicate_count += counts['rows']
+            
+            # Extend distance totals of technicians that received new rows.
+            # Late rows fall between points already counted, so those
+            # technicians are recalculated instead
+            progress('distances', record_count)
+            with profiler.stage('distances') as counts:
+                counts['rows'] = extend_technician_distances({
+                    tech_pks[tech_id]: watermarks[tech_pks[tech_id]]
+                    for tech_id in seen_technicians - late_technicians
+                    if tech_pks.get(tech_id) in watermarks
+                })
+                
+                recalculated = [
+                    technician for technician in Technician.objects.filter(
+                        data_file=data_file,
+                        distance_data__isnull=False
+                    )
+                    if technician.technician_id in late_technicians
+                ]
+                if recalculated:
+                    calculate_technician_distances(data_file, technicians=recalculated)
+                    counts['rows'] += len(recalculated)
+            
+            appended_pks = [
+                pk for tech_id, pk in Technician.objects.filter(data_file=data_file).values_list('technician_id', 'id')
+                if tech_id in seen_technicians
+            ]
+            
+            # Rebuild the days from the earliest new row on, or the
+            # technicians' whole history when older rows were flagged as
+            # duplicates
+            progress('rollups', record_count)
+            with profiler.stage('rollups') as counts:
+                counts['rows'] = rebuild_daily_rollups(
+                    data_file,
+                    technician_pks=appended_pks,
+                    since=None if duplicates.displaced else since
+                )
+            
+            # Add the new points to the map cells. Re-flagged older rows, and
+            # late rows that may make existing rows near-duplicates, change
+            # existing cells, so those need a rebuild
+            progress('cluster_index', record_count)
+            with profiler.stage('cluster_index') as counts:
+                if duplicates.displaced or late_technicians:
+                    counts['rows'] = rebuild_cluster_index(data_file)
+                else:
+                    counts['rows'] = extend_cluster_index(data_file, last_record_id)
+            
+            mark_technicians_dirty(appended_pks)
+            
+            with profiler.stage('row_hashes') as counts:
+                known_hashes = np.concatenate([known_hashes] + new_hashes)
+                counts['rows'] = len(known_hashes)
+                store_row_hashes(data_file, known_hashes)
+    
+    data_file.record_count = (data_file.record_count or 0) + record_count
+    data_file.ingest_profile = profiler.as_dict()
+    data_file.save(update_fields=['row_hashes', 'record_count', 'ingest_profile'])
+    
+    return {
+        'success': True,
+        'record_count': record_count,
+        'skipped_count': skipped_count,
+        'technician_count': Technician.objects.filter(data_file=data_file).count(),
+        'duplicate_count': duplicate_count,
+        'load_seconds': round(load_seconds, 3),
+        'profile': data_file.ingest_profile
+    }
+
+
+def existing_trip_keys(data_file, technician_ids):
+    """
+    Load the distinct duplicate keys already saved for some technicians
+    
+    Args:
+        data_file: DataFile model instance
+        technician_ids: Technician ids (not primary keys)
+    
+    Returns:
+        DataFrame: One row per key, with its earliest created_at
+    """
+    columns = ['technician_id', 'trip_type', 'location', 'latitude', 'longitude', 'created_at']
+    technician_ids = list(technician_ids)
+    rows = []
+    
+    # Batch the id list to stay under SQLite's variable limit
+    for start in range(0, len(technician_ids), 900):
+        rows.extend(
+            TripRecord.objects.filter(
+                technician__data_file=data_file,
+                technician__technician_id__in=technician_ids[start:start + 900]
+            ).values_list(
+                'technician__technician_id', 'trip_type', 'location', 'latitude', 'longitude'
+            ).annotate(
+                first_created_at=Min('created_at')
+            ).order_by()
+        )
+    
+    return pd.DataFrame.from_records(rows, columns=columns)
+
+
+def read_data_chunks(file, streaming=None, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Read an uploaded file as a sequence of DataFrames
+    
+    The reader is picked from FILE_READERS by file extension.
+    
+    Args:
+        file: FieldFile of the upload, e.g. DataFile.file
+        streaming: Stream in chunks, or read the whole file at once.
+            When None, decided by file size.
+        chunk_size: Number of rows per chunk when streaming
+    
+    Yields:
+        DataFrame: Raw rows from the file
+    """
+    path = file.path
+    reader = get_file_reader(file.name)
+    
+    if streaming is None:
+        streaming = os.path.getsize(path) >= STREAM_THRESHOLD_BYTES
+    
+    yield from reader(path, streaming, chunk_size)
+
+
+def get_file_reader(filename):
+    """
+    Look up the reader for a file name
+    
+    Args:
+        filename: Name or path of the uploaded file
+    
+    Returns:
+        function: Reader from FILE_READERS
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    
+    if ext not in FILE_READERS:
+        raise ValueError(f"Unsupported file type: {ext or filename}")
+    
+    return FILE_READERS[ext]
+
+
+def read_xlsx(path, streaming, chunk_size):
+    """Read an Excel workbook, whole or with the read-only row iterator"""
+    if streaming:
+        yield from iter_excel_rows(path, chunk_size)
+    else:
+        # Drop blank rows, as the row iterator does
+        yield pd.read_excel(path).dropna(how='all')
+
+
+def read_csv(path, streaming, chunk_size):
+    """Read a CSV file with column dtypes and date parsing pushed down"""
+    columns = pd.read_csv(path, nrows=0).columns
+    
+    options = {
+        'dtype': READ_DTYPES,
+        'parse_dates': [col for col in DATE_COLUMNS if col in columns],
+    }
+    
+    if streaming:
+        with pd.read_csv(path, chunksize=chunk_size, **options) as reader:
+            yield from reader
+    else:
+        yield pd.read_csv(path, **options)
+
+
+def read_ndjson(path, streaming, chunk_size):
+    """Read newline-delimited JSON with column dtypes and dates pushed down"""
+    options = {
+        'lines': True,
+        'dtype': READ_DTYPES,
+        'convert_dates': DATE_COLUMNS,
+    }
+    
+    if streaming:
+        with pd.read_json(path, chunksize=chunk_size, **options) as reader:
+            yield from reader
+    else:
+        yield pd.read_json(path, **options)
+
+
+def read_parquet(path, streaming, chunk_size):
+    """Read a Parquet file; columns arrive already typed, with no text parsing"""
+    if streaming:
+        import pyarrow.parquet as pq
+        
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield pd.read_parquet(path)
+
+
+def iter_excel_rows(path, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Stream the first worksheet with openpyxl's read-only row iterator
+    
+    Args:
+        path: Path to the .xlsx file
+        chunk_size: Number of rows per chunk
+    
+    Yields:
+        DataFrame: Up to chunk_size rows, using the first row as header
+    """
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        
+        header = next(rows, None)
+        if header is None:
+            return
+        
+        columns = [
+            name if name is not None else f"Unnamed: {i}"
+            for i, name in enumerate(header)
+        ]
+        
+        while True:
+            batch = list(islice(rows, chunk_size))
+            if not batch:
+                break
+            
+            # Skip blank rows
+            batch = [row for row in batch if any(value is not None for value in row)]
+            if batch:
+                yield pd.DataFrame.from_records(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+# Readers keyed by file extension. Each takes (path, streaming, chunk_size)
+# and yields raw DataFrames for clean_data.
+FILE_READERS = {
+    '.xlsx': read_xlsx,
+    '.csv': read_csv,
+    '.parquet': read_parquet,
+    '.ndjson': read_ndjson,
+    '.jsonl': read_ndjson,
+}
+
+
+def clean_data(df, copy=True):
     """
     Clean the data from Excel file
     
     Args:
         df: Pandas DataFrame
+        copy: Work on a copy of df. Pass False when the caller owns df,
+            to avoid holding two copies of the data.
     
     Returns:
         df_cleaned: Cleaned DataFrame
     """
     # Make a copy to avoid modifying the original
-    df_cleaned = df.copy()
+    df_cleaned = df.copy() if copy else df
     
     # Handle missing values
     for col in df_cleaned.columns:
@@ -67,8 +594,7 @@ def clean_data(df):
             df_cleaned[col] = df_cleaned[col].fillna(0)
     
     # Format date columns
-    date_cols = ['created_at', 'updated_at']
-    for col in date_cols:
+    for col in DATE_COLUMNS:
         if col in df_cleaned.columns:
             df_cleaned[col] = pd.to_datetime(df_cleaned[col], errors='coerce')
     
@@ -79,7 +605,7 @@ def clean_data(df):
     # Rename lat/long columns if needed
     if 'lat' in df_cleaned.columns and 'latitude' not in df_cleaned.columns:
         df_cleaned.rename(columns={'lat': 'latitude'}, inplace=True)
-        
+    
     if 'long' in df_cleaned.columns and 'longitude' not in df_cleaned.columns:
         df_cleaned.rename(columns={'long': 'longitude'}, inplace=True)
     
@@ -91,113 +617,318 @@ def clean_data(df):
     return df_cleaned
 
 
-def save_to_database(df, data_file):
+def save_to_database(df, data_file, batch_size=INSERT_BATCH_SIZE):
     """
     Save the cleaned data to database
     
+    Technicians are created in one bulk pass and trip records are
+    inserted from whole columns, so no pandas row is ever touched.
+    
     Args:
         df: Cleaned DataFrame
         data_file: DataFile model instance
+        batch_size: Rows per insert batch
+    
+    Returns:
+        int: Number of trip records inserted
     """
-    # Dictionary to store technician objects
-    technicians = {}
-    
-    # Batch create trip records for better performance
-    trip_records = []
-    
-    # Process each row
-    for _, row in df.iterrows():
-        # Get or create technician
-        tech_id = row['technician_id']
-        if tech_id not in technicians:
-            technician, _ = Technician.objects.get_or_create(
-                technician_id=tech_id,
-                data_file=data_file
-            )
-            technicians[tech_id] = technician
-        else:
-            technician = technicians[tech_id]
+    if df.empty:
+        return 0
+    
+    # Map each row's technician id to a Technician primary key
+    tech_pks = map_technician_pks(df['technician_id'], data_file)
+    
+    # Convert whole columns into insert tuples
+    rows = build_trip_rows(df, tech_pks)
+    
+    return insert_trip_rows(rows, batch_size)
+
+
+def map_technician_pks(technician_ids, data_file):
+    """
+    Create missing technicians in one bulk pass and map ids to primary keys
+    
+    Args:
+        technician_ids: Series of technician ids, one per row
+        data_file: DataFile model instance
+    
+    Returns:
+        Series: Technician primary key for each row
+    """
+    technician_ids = technician_ids.astype('int64')
+    
+    existing = dict(
+        Technician.objects.filter(data_file=data_file).values_list('technician_id', 'id')
+    )
+    
+    # Create all new technicians at once
+    missing = [tech_id for tech_id in pd.unique(technician_ids).tolist() if tech_id not in existing]
+    if missing:
+        Technician.objects.bulk_create([
+            Technician(technician_id=tech_id, data_file=data_file)
+            for tech_id in missing
+        ])
+        existing = dict(
+            Technician.objects.filter(data_file=data_file).values_list('technician_id', 'id')
+        )
+    
+    # Vectorized join of technician ids onto primary keys
+    return technician_ids.map(pd.Series(existing, dtype='int64'))
+
+
+def build_trip_rows(df, tech_pks):
+    """
+    Build TripRecord insert tuples from DataFrame columns
+    
+    Args:
+        df: Cleaned DataFrame
+        tech_pks: Series of Technician primary keys aligned with df
+    
+    Returns:
+        iterator: Tuples ordered as TRIP_RECORD_COLUMNS
+    """
+    n = len(df)
+    
+    columns = [
+        tech_pks.tolist(),
+        df['trip_type'].tolist(),
+        datetime_values(df['created_at']),
+        datetime_values(df['updated_at']) if 'updated_at' in df.columns else repeat(None, n),
+        _location_values(df).tolist(),
+        _float_values(df['latitude']) if 'latitude' in df.columns else repeat(None, n),
+        _float_values(df['longitude']) if 'longitude' in df.columns else repeat(None, n),
+        df['duplicate'].tolist() if 'duplicate' in df.columns else repeat(False, n),
+        _geohash_values(df) if 'latitude' in df.columns and 'longitude' in df.columns else repeat('', n),
+    ]
+    
+    return zip(*columns)
+
+
+def insert_trip_rows(rows, batch_size=INSERT_BATCH_SIZE):
+    """
+    Insert TripRecord tuples with executemany in fixed-size batches
+    
+    Args:
+        rows: Iterable of tuples ordered as TRIP_RECORD_COLUMNS
+        batch_size: Number of rows sent per executemany call
+    
+    Returns:
+        int: Number of rows inserted
+    """
+    return insert_rows(TripRecord, TRIP_RECORD_COLUMNS, rows, batch_size)
+
+
+def _location_values(df):
+    """Location column as objects, with empty or missing values as None"""
+    if 'location' not in df.columns:
+        return pd.Series(None, index=df.index, dtype=object)
+    
+    # Empty locations are stored as NULL
+    location = df['location'].astype(object)
+    return location.where(location.notna() & location.astype(bool), None)
+
+
+def _geohash_values(df):
+    """Geohash of each row's coordinates, empty where they are missing"""
+    return encode_geohashes(
+        pd.to_numeric(df['latitude'], errors='coerce').to_numpy(dtype=float),
+        pd.to_numeric(df['longitude'], errors='coerce').to_numpy(dtype=float)
+    )
+
+
+def epoch_nanoseconds(series):
+    """Datetime column as int64 nanoseconds since the epoch, read like stored values"""
+    values = aware_datetimes(series)
+    
+    if values.dt.tz is not None:
+        values = values.dt.tz_convert('UTC').dt.tz_localize(None)
+    
+    return values.to_numpy(dtype='datetime64[ns]').view('int64')
+
+
+def _float_values(series):
+    """Convert a numeric column into floats with NULL for missing values"""
+    values = pd.to_numeric(series, errors='coerce').astype(object)
+    return values.where(values.notna(), None).tolist()
+
+
+class DuplicateMarker:
+    """
+    Flag duplicate trip records on cleaned DataFrames before they are saved
+    
+    A record is a duplicate when an earlier record has the same technician,
+    trip type, location and coordinates. Each key is hashed to a 64-bit
+    integer and the earliest time seen per key is kept between chunks, so a
+    streamed file is checked against every chunk before it.
+    """
+    
+    # Time looked up for keys not seen before
+    UNSEEN = np.iinfo('int64').max
+    
+    def __init__(self):
+        # Earliest time in epoch nanoseconds by key hash; a dict, so each
+        # chunk only touches its own keys
+        self.first_seen = {}
+        self.displaced = False
+    
+    def mark(self, df):
+        """
+        Add a boolean 'duplicate' column to a cleaned DataFrame
+        
+        Args:
+            df: Cleaned DataFrame, modified in place
         
-        # Create trip record dict
-        trip_record = TripRecord(
-            technician=technician,
-            trip_type=row['trip_type'],
-            created_at=row['created_at'],
-            updated_at=row.get('updated_at', None)
+        Returns:
+            int: Number of rows flagged as duplicates
+        """
+        if df.empty:
+            df['duplicate'] = pd.Series(dtype=bool)
+            return 0
+        
+        frame = self.key_frame(df)
+        
+        # Keep the earliest record per key; ties go to the first row in the file
+        ordered = frame.sort_values(['key', 'time'], kind='stable')
+        duplicate = ordered.duplicated('key').reindex(frame.index).to_numpy(copy=True)
+        
+        # Compare against keys from earlier chunks
+        first_seen = self.first_seen
+        earlier = np.fromiter(
+            (first_seen.get(key, self.UNSEEN) for key in frame['key'].tolist()),
+            dtype='int64',
+            count=len(frame)
         )
+        seen_before = earlier != self.UNSEEN
+        duplicate |= seen_before & (earlier <= frame['time'].to_numpy())
         
-        # Add location data if available
-        if 'location' in row and row['location']:
-            trip_record.location = row['location']
+        # An original earlier than a saved one turns that saved row into a duplicate
+        if (seen_before & ~duplicate).any():
+            self.displaced = True
         
-        # Add coordinates if available
-        if 'latitude' in row and not pd.isna(row['latitude']):
-            trip_record.latitude = row['latitude']
-            
-        if 'longitude' in row and not pd.isna(row['longitude']):
-            trip_record.longitude = row['longitude']
-            
-        trip_records.append(trip_record)
+        self.remember_keys(frame)
+        
+        df['duplicate'] = duplicate
+        return int(duplicate.sum())
+    
+    def remember(self, df):
+        """
+        Register records that are already saved, without flagging them
+        
+        Args:
+            df: DataFrame with the duplicate key columns and created_at
+        """
+        if not df.empty:
+            self.remember_keys(self.key_frame(df))
+    
+    def remember_keys(self, frame):
+        """Keep the earliest time per key hash"""
+        chunk_first = frame.groupby('key')['time'].min()
+        first_seen = self.first_seen
+        
+        for key, first in zip(chunk_first.index.tolist(), chunk_first.tolist()):
+            if first < first_seen.get(key, self.UNSEEN):
+                first_seen[key] = first
+    
+    @staticmethod
+    def key_frame(df):
+        """Hash each row's duplicate key and pair it with its time"""
+        keys = pd.DataFrame({
+            'technician_id': df['technician_id'].astype('int64').to_numpy(),
+            'trip_type': df['trip_type'].to_numpy(),
+            'location': _location_values(df).to_numpy(),
+            'latitude': pd.to_numeric(df['latitude'], errors='coerce').to_numpy() if 'latitude' in df.columns else np.nan,
+            'longitude': pd.to_numeric(df['longitude'], errors='coerce').to_numpy() if 'longitude' in df.columns else np.nan,
+        })
         
-        # Batch create every 1000 records
-        if len(trip_records) >= 1000:
-            TripRecord.objects.bulk_create(trip_records)
-            trip_records = []
+        return pd.DataFrame({
+            'key': pd.util.hash_pandas_object(keys, index=False).to_numpy(),
+            'time': epoch_nanoseconds(df['created_at']),
+        })
+
+
+def row_hashes(df):
+    """
+    Hash each cleaned row by its duplicate key and created_at
+    
+    Args:
+        df: Cleaned DataFrame
+    
+    Returns:
+        ndarray: uint64 hash per row, in row order
+    """
+    if df.empty:
+        return np.array([], dtype='uint64')
     
-    # Create any remaining records
-    if trip_records:
-        TripRecord.objects.bulk_create(trip_records)
+    return pd.util.hash_pandas_object(DuplicateMarker.key_frame(df), index=False).to_numpy()
+
+
+def head_digest(hashes):
+    """SHA-256 of the first HEAD_ROWS row hashes, or of all of them if fewer"""
+    return hashlib.sha256(np.ascontiguousarray(hashes[:HEAD_ROWS]).tobytes()).hexdigest()
+
+
+def store_row_hashes(data_file, hashes):
+    """
+    Save a data file's row hashes as a sorted, de-duplicated .npy file
+    
+    Args:
+        data_file: DataFile model instance; saved by the caller
+        hashes: uint64 row hashes
+    """
+    buffer = BytesIO()
+    np.save(buffer, np.unique(hashes))
+    
+    if data_file.row_hashes:
+        data_file.row_hashes.delete(save=False)
+    
+    data_file.row_hashes.save('rows.npy', ContentFile(buffer.getvalue()), save=False)
+
+
+def load_row_hashes(data_file):
+    """
+    Load a data file's sorted row hashes
+    
+    Args:
+        data_file: DataFile model instance
+    
+    Returns:
+        ndarray: Sorted uint64 row hashes, empty if none were stored
+    """
+    if not data_file.row_hashes:
+        return np.array([], dtype='uint64')
+    
+    with data_file.row_hashes.open('rb') as f:
+        return np.load(BytesIO(f.read()))
 
 
 def identify_duplicates(data_file):
     """
     Identify duplicate records in the database
     
+    Runs as a single UPDATE: records are ranked by created_at within each
+    (technician, trip type, location, coordinates) group, and everything
+    after the first is flagged.
+    
     Args:
         data_file: DataFile model instance
     
     Returns:
-        int: Count of duplicate records
+        int: Count of records newly flagged as duplicates
     """
-    duplicate_count = 0
+    ranked = TripRecord.objects.filter(technician__data_file=data_file).annotate(
+        rank=Window(
+            RowNumber(),
+            partition_by=[F('technician'), F('trip_type'), F('location'), F('latitude'), F('longitude')],
+            order_by=[F('created_at').asc(), F('id').asc()]
+        )
+    )
     
-    # Get all technicians for this file
-    technicians = Technician.objects.filter(data_file=data_file)
+    duplicates = ranked.filter(rank__gt=1, duplicate=False)
+    duplicate_ids = duplicates.values('id')
     
-    for technician in technicians:
-        # Get all trip records for this technician
-        trip_records = TripRecord.objects.filter(technician=technician)
-        
-        # Group by everything except id and created_at/updated_at
-        trips_by_props = {}
-        
-        for trip in trip_records:
-            # Create a key based on trip properties (excluding time-based fields)
-            key = (
-                trip.trip_type,
-                trip.location,
-                trip.latitude,
-                trip.longitude
-            )
-            
-            if key in trips_by_props:
-                trips_by_props[key].append(trip)
-            else:
-                trips_by_props[key] = [trip]
-        
-        # Mark duplicates
-        for key, trips in trips_by_props.items():
-            if len(trips) > 1:
-                # Sort by created_at to keep the first one
-                trips.sort(key=lambda x: x.created_at)
-                
-                # Mark all but the first one as duplicates
-                for trip in trips[1:]:
-                    trip.duplicate = True
-                    trip.save()
-                    duplicate_count += 1
+    mark_technicians_dirty(duplicates.values('technician_id'))
     
-    return duplicate_count
+    return TripRecord.objects.filter(id__in=duplicate_ids).update(duplicate=True)
 
 
 def get_trip_type_distribution(data_file, technician=None):
@@ -211,21 +942,21 @@ def get_trip_type_distribution(data_file, technician=None):
     Returns:
         list: Trip type distribution data
     """
-    query = TripRecord.objects.filter(technician__data_file=data_file, duplicate=False)
+    query = DailyRollup.objects.filter(technician__data_file=data_file)
     
     if technician:
         query = query.filter(technician=technician)
     
-    # Count by trip type
-    trip_counts = query.values('trip_type').annotate(count=models.Count('id'))
+    # Count by trip type from the daily rollups
+    trip_counts = summarize_rollups(query)['trip_types']
     
     # Format for frontend chart
-    total = query.count()
+    total = sum(trip_counts.values())
     return [{
-        'trip_type': item['trip_type'],
-        'count': item['count'],
-        'percentage': round((item['count'] / total) * 100, 2) if total > 0 else 0
-    } for item in trip_counts]
+        'trip_type': trip_type,
+        'count': count,
+        'percentage': round((count / total) * 100, 2) if total > 0 else 0
+    } for trip_type, count in sorted(trip_counts.items())]
 
 
 def get_punch_in_distribution(data_file, technician=None):
@@ -239,29 +970,20 @@ def get_punch_in_distribution(data_file, technician=None):
     Returns:
         list: Punch-in hour distribution data
     """
-    # Filter punch-in records
-    query = TripRecord.objects.filter(
-        technician__data_file=data_file, 
-        trip_type='punch_in',
-        duplicate=False
-    )
+    query = DailyRollup.objects.filter(technician__data_file=data_file)
     
     if technician:
         query = query.filter(technician=technician)
     
-    hour_counts = {}
-    
-    # Extract hour from created_at
-    for record in query:
-        hour = record.created_at.hour
-        hour_counts[hour] = hour_counts.get(hour, 0) + 1
+    # Add up the hourly punch-in bins of the daily rollups
+    hour_counts = summarize_rollups(query)['punch_in_hours']
     
     # Format for frontend chart
     result = []
     for hour in range(24):
         result.append({
             'hour': hour,
-            'count': hour_counts.get(hour, 0),
+            'count': hour_counts[hour],
             'label': f"{hour}:00"
         })
     
@@ -1,35 +1,111 @@
-from haversine import haversine
-from django.db.models import F
-from dashboard.models import Technician, TripRecord, DistanceData
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Count, Sum, Avg, Max, Min, IntegerField
+from django.db.models.functions import TruncDate, Cast, Least
+from dashboard.models import Technician, TripRecord, DistanceData, TripSegment
+from dashboard.utils.bulk_load import insert_rows, datetime_values
+from dashboard.utils.rollups import rebuild_daily_rollups
+from dashboard.utils.distance_kernels import haversine_km, segment_distance_sums, shard_bounds
+from dashboard.utils.route_simplify import zoom_tolerance_m, simplify_route
 
 
-def calculate_technician_distances(data_file, technician=None):
+# Below this many trips the process pool costs more than it saves: the
+# kernel handles about 2M trips in 0.16s, while starting a pool takes ~0.3s
+PARALLEL_MIN_TRIPS = 5000000
+
+# Largest technician selection filtered with IN (...), below SQLite's
+# bound parameter limit
+FLEET_FILTER_LIMIT = 900
+
+# Fleet distance summary: percentiles reported, histogram bins and
+# technicians listed per page
+DISTANCE_PERCENTILES = [50, 90, 99]
+DISTANCE_HISTOGRAM_BINS = 10
+DISTANCE_SUMMARY_PAGE_SIZE = 100
+
+# TripSegment columns written by build_segment_rows, in tuple order
+TRIP_SEGMENT_COLUMNS = [
+    'technician', 'from_record', 'to_record', 'started_at', 'ended_at',
+    'distance_km', 'duration_seconds', 'speed_kmh',
+]
+
+
+def calculate_technician_distances(data_file, technician=None, workers=None, technicians=None):
     """
     Calculate distances for all technicians in the data file
     or for a specific technician if provided.
     
+    All coordinates are loaded in one ordered query and the distances of
+    every technician are computed together with NumPy, then written with
+    a single bulk upsert of DistanceData.
+    
     Args:
         data_file: DataFile model instance
         technician: Optional Technician model instance
+        workers: Worker processes for large files. Defaults to
+            settings.DISTANCE_WORKERS; 1 computes in this process.
+        technicians: Optional list of Technician model instances to
+            calculate instead of the whole file
     
     Returns:
         dict: Distance calculation results
     """
     if technician:
         technicians = [technician]
-    else:
-        technicians = Technician.objects.filter(data_file=data_file)
     
-    results = []
-    for tech in technicians:
-        distance_data = calculate_distance_for_technician(tech)
-        results.append({
-            'technician_id': tech.technician_id,
-            'total_distance': distance_data.total_distance,
-            'trip_count': distance_data.trip_count
-        })
+    whole_file = technicians is None
+    if whole_file:
+        technicians = list(Technician.objects.filter(data_file=data_file))
+    
+    if not technicians:
+        return []
+    
+    if workers is None:
+        workers = settings.DISTANCE_WORKERS
+    
+    technician_pks = [tech.id for tech in technicians]
+    trips = load_fleet_coordinates(data_file, technician_pks)
+    totals, trip_counts = fleet_distance_sums(trips, len(technician_pks), workers)
     
-    return results
+    distance_data = [
+        DistanceData(
+            technician=tech,
+            total_distance=round(float(total), 2),
+            trip_count=int(trip_count)
+        )
+        for tech, total, trip_count in zip(technicians, totals, trip_counts)
+    ]
+    
+    with transaction.atomic():
+        # Insert or update every technician's row in one statement
+        DistanceData.objects.bulk_create(
+            distance_data,
+            update_conflicts=True,
+            unique_fields=['technician'],
+            update_fields=['total_distance', 'trip_count']
+        )
+        
+        # Replace the segments of the recalculated technicians
+        segments = TripSegment.objects.filter(technician__data_file=data_file)
+        if whole_file:
+            segments.delete()
+        else:
+            for start in range(0, len(technician_pks), FLEET_FILTER_LIMIT):
+                segments.filter(technician_id__in=technician_pks[start:start + FLEET_FILTER_LIMIT]).delete()
+        
+        insert_rows(TripSegment, TRIP_SEGMENT_COLUMNS, build_segment_rows(trips[trips['position'] >= 0]))
+        
+        # Rollups carry the per-day distance of the new segments
+        rebuild_daily_rollups(data_file, None if whole_file else technician_pks)
+    
+    return [{
+        'technician_id': data.technician.technician_id,
+        'total_distance': data.total_distance,
+        'trip_count': data.trip_count
+    } for data in distance_data]
 
 
 def calculate_distance_for_technician(technician):
@@ -42,66 +118,309 @@ def calculate_distance_for_technician(technician):
     Returns:
         DistanceData: DistanceData model instance
     """
-    # Get trip records with coordinates, sorted by time
+    calculate_technician_distances(technician.data_file, technician)
+    return DistanceData.objects.get(technician=technician)
+
+
+def fleet_distance_sums(trips, size, workers=1):
+    """
+    Sum the distance between consecutive trips for many technicians at once
+    
+    Args:
+        trips: DataFrame from load_fleet_coordinates
+        size: Number of technicians
+        workers: Worker processes to shard the computation over
+    
+    Returns:
+        tuple: Arrays of total distance in km and trip count per technician
+    """
+    positions = trips['position'].to_numpy()
+    latitude = trips['latitude'].to_numpy(dtype=float)
+    longitude = trips['longitude'].to_numpy(dtype=float)
+    
+    if workers > 1 and len(positions) >= PARALLEL_MIN_TRIPS:
+        return parallel_segment_distance_sums(positions, latitude, longitude, size, workers)
+    
+    return segment_distance_sums(positions, latitude, longitude, size)
+
+
+def load_fleet_coordinates(data_file, technician_pks):
+    """
+    Load the coordinates of all non-duplicate trips in one ordered query
+    
+    Args:
+        data_file: DataFile model instance
+        technician_pks: Technician primary keys to load
+    
+    Returns:
+        DataFrame: id, technician_id, latitude, longitude and created_at
+            of each trip, plus its technician's position in
+            technician_pks (-1 for others), grouped by technician and in
+            time order
+    """
     trips = TripRecord.objects.filter(
-        technician=technician, 
+        technician__data_file=data_file,
         duplicate=False
     ).exclude(
         latitude__isnull=True,
         longitude__isnull=True
-    ).order_by('created_at')
+    )
     
-    # Delete any existing distance data
-    DistanceData.objects.filter(technician=technician).delete()
+    # Small selections are filtered in SQL; trips of other technicians
+    # in larger ones get position -1
+    if len(technician_pks) <= FLEET_FILTER_LIMIT:
+        trips = trips.filter(technician_id__in=technician_pks)
     
-    # Create new distance data
-    distance_data = DistanceData.objects.create(
-        technician=technician,
-        total_distance=0,
-        trip_count=trips.count()
-    )
+    columns = ['id', 'technician_id', 'latitude', 'longitude', 'created_at']
+    rows = trips.order_by('technician_id', 'created_at', 'id').values_list(*columns)
     
-    total_distance = 0
-    locations = []
+    df = pd.DataFrame.from_records(rows.iterator(chunk_size=50000), columns=columns)
+    df['position'] = pd.Index(technician_pks).get_indexer(df['technician_id'].to_numpy())
     
-    # Calculate distance between consecutive points
-    prev_point = None
-    for trip in trips:
-        curr_point = (trip.latitude, trip.longitude)
+    return df
+
+
+def build_segment_rows(trips):
+    """
+    Build TripSegment insert tuples from consecutive trips
+    
+    Args:
+        trips: DataFrame with id, technician_id, latitude, longitude and
+            created_at, grouped by technician and in time order
+    
+    Returns:
+        iterator: Tuples ordered as TRIP_SEGMENT_COLUMNS
+    """
+    technician_ids = trips['technician_id'].to_numpy()
+    latitude = trips['latitude'].to_numpy(dtype=float)
+    longitude = trips['longitude'].to_numpy(dtype=float)
+    
+    distance = haversine_km(latitude[:-1], longitude[:-1], latitude[1:], longitude[1:])
+    
+    # A segment joins two consecutive trips of the same technician with coordinates
+    keep = (technician_ids[1:] == technician_ids[:-1]) & ~np.isnan(distance)
+    
+    created_at = pd.to_datetime(trips['created_at'], utc=True)
+    nanoseconds = created_at.dt.tz_localize(None).to_numpy(dtype='datetime64[ns]').view('int64')
+    seconds = np.diff(nanoseconds)[keep] / 1e9
+    distance = distance[keep]
+    
+    # Implied speed; undefined when both trips share a timestamp
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = np.where(seconds > 0, distance / (seconds / 3600), np.nan)
+    
+    ids = trips['id'].to_numpy()
+    
+    columns = [
+        technician_ids[1:][keep].tolist(),
+        ids[:-1][keep].tolist(),
+        ids[1:][keep].tolist(),
+        datetime_values(created_at.iloc[:-1][keep]),
+        datetime_values(created_at.iloc[1:][keep]),
+        distance.tolist(),
+        seconds.tolist(),
+        [None if np.isnan(value) else value for value in speed.tolist()],
+    ]
+    
+    return zip(*columns)
+
+
+def parallel_segment_distance_sums(positions, latitude, longitude, size, workers):
+    """
+    Run segment_distance_sums over technician shards in a process pool
+    
+    The coordinate arrays are sliced into shards balanced by trip count
+    and sent to the workers, so nothing is queried again per shard.
+    
+    Args:
+        positions: Technician position of each trip, grouped by technician
+        latitude: Latitudes in degrees
+        longitude: Longitudes in degrees
+        size: Number of technicians
+        workers: Number of worker processes
+    
+    Returns:
+        tuple: Arrays of total distance in km and trip count per technician
+    """
+    bounds = shard_bounds(positions, workers)
+    totals = np.zeros(size)
+    counts = np.zeros(size, dtype=np.int64)
+    
+    with ProcessPoolExecutor(max_workers=len(bounds)) as pool:
+        futures = [
+            pool.submit(
+                segment_distance_sums,
+                positions[start:stop],
+                latitude[start:stop],
+                longitude[start:stop],
+                size
+            )
+            for start, stop in bounds
+        ]
+        
+        # Each technician lives in one shard, so shard results just add up
+        for future in futures:
+            shard_totals, shard_counts = future.result()
+            totals += shard_totals
+            counts += shard_counts
+    
+    return totals, counts
+
+
+def extend_technician_distances(watermarks):
+    """
+    Add the distance of newly appended trips to existing distance data
+    
+    Instead of recalculating a technician's whole history, the distance
+    and segments are continued from the last point at or before the
+    watermark. Technicians without distance data are left for
+    calculate_technician_distances.
+    
+    Args:
+        watermarks: Dict of Technician primary key to the created_at of
+            its latest trip before the append
+    
+    Returns:
+        int: Number of DistanceData records updated
+    """
+    columns = ['id', 'technician_id', 'latitude', 'longitude', 'created_at']
+    distance_data = []
+    points = []
+    
+    for data in DistanceData.objects.filter(technician_id__in=list(watermarks)):
+        since = watermarks[data.technician_id]
+        
+        trips = TripRecord.objects.filter(
+            technician_id=data.technician_id,
+            duplicate=False
+        ).exclude(
+            latitude__isnull=True,
+            longitude__isnull=True
+        )
+        
+        new_points = list(trips.filter(created_at__gt=since).order_by('created_at', 'id').values_list(*columns))
         
-        # Store location information
-        locations.append({
-            'name': trip.location if trip.location else f"Point {len(locations) + 1}",
-            'lat': trip.latitude,
-            'long': trip.longitude,
-            'time': trip.created_at,
-            'trip_type': trip.trip_type
-        })
+        if not new_points:
+            continue
         
-        if prev_point:
-            # Calculate distance in kilometers using haversine formula
-            distance = haversine(prev_point, curr_point)
-            total_distance += distance
+        # Continue from the last point already counted
+        last_point = trips.filter(created_at__lte=since).order_by('-created_at', '-id').values_list(*columns).first()
         
-        prev_point = curr_point
+        # Points missing a coordinate are not counted, as in segment_distance_sums
+        data.trip_count += sum(1 for point in new_points if point[2] is not None and point[3] is not None)
+        distance_data.append(data)
+        points.extend(([last_point] if last_point else []) + new_points)
     
-    # Update distance data
-    distance_data.total_distance = round(total_distance, 2)
-    distance_data.save()
+    if not distance_data:
+        return 0
     
-    return distance_data
+    trips = pd.DataFrame.from_records(points, columns=columns)
+    trips['position'] = pd.Index([data.technician_id for data in distance_data]).get_indexer(trips['technician_id'])
+    added_distance, _ = segment_distance_sums(
+        trips['position'].to_numpy(),
+        trips['latitude'].to_numpy(dtype=float),
+        trips['longitude'].to_numpy(dtype=float),
+        len(distance_data)
+    )
+    
+    for data, added in zip(distance_data, added_distance):
+        data.total_distance = round(data.total_distance + float(added), 2)
+    
+    DistanceData.objects.bulk_update(distance_data, ['total_distance', 'trip_count'])
+    insert_rows(TripSegment, TRIP_SEGMENT_COLUMNS, build_segment_rows(trips))
+    
+    return len(distance_data)
+
+
+def get_window_distance(technician, start=None, end=None):
+    """
+    Total distance of a technician's segments starting within a time window
+    
+    Args:
+        technician: Technician model instance
+        start: Optional datetime; segments starting at or after it count
+        end: Optional datetime; segments starting before it count
+    
+    Returns:
+        dict: Total distance in km and number of segments
+    """
+    segments = window_segments(TripSegment.objects.filter(technician=technician), start, end)
+    totals = segments.aggregate(total_distance=Sum('distance_km'), segment_count=Count('id'))
+    
+    return {
+        'technician_id': technician.technician_id,
+        'total_distance': round(totals['total_distance'] or 0, 2),
+        'segment_count': totals['segment_count'],
+    }
 
 
-def get_trip_locations(technician):
+def get_daily_distances(data_file, technician=None, start=None, end=None):
+    """
+    Distance per technician and day, summed from trip segments
+    
+    Segments are counted on the day they start.
+    
+    Args:
+        data_file: DataFile model instance
+        technician: Optional Technician model instance
+        start: Optional datetime lower bound on segment start
+        end: Optional datetime upper bound on segment start
+    
+    Returns:
+        list: Daily distance totals
+    """
+    segments = TripSegment.objects.filter(technician__data_file=data_file)
+    if technician:
+        segments = segments.filter(technician=technician)
+    
+    daily = window_segments(segments, start, end).annotate(
+        day=TruncDate('started_at')
+    ).values(
+        'technician__technician_id', 'day'
+    ).annotate(
+        total_distance=Sum('distance_km'),
+        segment_count=Count('id')
+    ).order_by('technician__technician_id', 'day')
+    
+    return [{
+        'technician_id': row['technician__technician_id'],
+        'date': row['day'].strftime('%Y-%m-%d'),
+        'total_distance': round(row['total_distance'], 2),
+        'segment_count': row['segment_count'],
+    } for row in daily]
+
+
+def window_segments(segments, start=None, end=None):
+    """Filter segments to those starting within [start, end)"""
+    if start:
+        segments = segments.filter(started_at__gte=start)
+    if end:
+        segments = segments.filter(started_at__lt=end)
+    return segments
+
+
+def get_trip_locations(technician, zoom=None, max_points=None):
     """
     Get location data for a technician's trips
     
+    The route is simplified for the map: points that deviate from it by
+    less than settings.MAP_SIMPLIFY_PIXELS at the zoom level are dropped,
+    and at most max_points are returned. Points of the trip types in
+    settings.MAP_EVENT_TRIP_TYPES are always kept.
+    
     Args:
         technician: Technician model instance
+        zoom: Optional web map zoom level. Without it the route is only
+            cut down to max_points.
+        max_points: Largest number of points returned. Defaults to
+            settings.MAP_MAX_POINTS.
     
     Returns:
         list: Location data for map visualization
     """
+    if max_points is None:
+        max_points = settings.MAP_MAX_POINTS
+    
     # Get trip records with coordinates, sorted by time
     trips = TripRecord.objects.filter(
         technician=technician, 
@@ -109,28 +428,79 @@ def get_trip_locations(technician):
     ).exclude(
         latitude__isnull=True,
         longitude__isnull=True
-    ).order_by('created_at')
+    ).order_by('created_at', 'id')
+    
+    columns = ['location', 'latitude', 'longitude', 'created_at', 'trip_type']
+    df = pd.DataFrame.from_records(trips.values_list(*columns).iterator(chunk_size=50000), columns=columns)
+    
+    if df.empty:
+        return []
+    
+    latitude = df['latitude'].to_numpy(dtype=float)
+    longitude = df['longitude'].to_numpy(dtype=float)
+    
+    tolerance = 0
+    if zoom is not None:
+        tolerance = zoom_tolerance_m(zoom, np.mean(latitude), settings.MAP_SIMPLIFY_PIXELS)
+    
+    keep = df['trip_type'].isin(settings.MAP_EVENT_TRIP_TYPES).to_numpy()
+    indices = simplify_route(latitude, longitude, keep, tolerance, max_points)
+    
+    points = df.iloc[indices]
+    times = pd.to_datetime(points['created_at'], utc=True).dt.strftime('%Y-%m-%d %H:%M:%S')
+    
+    # Unnamed points keep their position in the full route
+    return [{
+        'name': name if name else f"Point {index + 1}",
+        'lat': lat,
+        'long': long,
+        'time': time,
+        'trip_type': trip_type
+    } for index, name, lat, long, time, trip_type in zip(
+        indices.tolist(),
+        points['location'].tolist(),
+        points['latitude'].tolist(),
+        points['longitude'].tolist(),
+        times.tolist(),
+        points['trip_type'].tolist()
+    )]
+
+
+def get_trip_location_counts(technician):
+    """
+    Count a technician's located trips by trip type
+    
+    Args:
+        technician: Technician model instance
     
-    locations = []
-    for trip in trips:
-        locations.append({
-            'name': trip.location if trip.location else f"Point {len(locations) + 1}",
-            'lat': trip.latitude,
-            'long': trip.longitude,
-            'time': trip.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'trip_type': trip.trip_type
-        })
+    Returns:
+        list: Trip type counts over the whole route, simplified or not
+    """
+    counts = TripRecord.objects.filter(
+        technician=technician,
+        duplicate=False
+    ).exclude(
+        latitude__isnull=True,
+        longitude__isnull=True
+    ).values('trip_type').annotate(count=Count('id')).order_by('trip_type')
     
-    return locations
+    return [{'trip_type': item['trip_type'], 'count': item['count']} for item in counts]
 
 
-def get_distance_summary(data_file, technician=None):
+def get_distance_summary(data_file, technician=None, top=None, page=1, page_size=DISTANCE_SUMMARY_PAGE_SIZE):
     """
     Get distance summary for one technician or all technicians
     
+    The fleet summary is aggregated by the database, so only the
+    requested slice of the technician list is loaded.
+    
     Args:
         data_file: DataFile model instance
         technician: Optional Technician model instance
+        top: Optional number of technicians with the longest distance to
+            list, instead of a page ordered by technician ID
+        page: Page of the technician list, starting at 1
+        page_size: Technicians per page
     
     Returns:
         dict: Distance summary data
@@ -154,30 +524,107 @@ def get_distance_summary(data_file, technician=None):
             }
     else:
         # Get distance data for all technicians
-        distance_data = DistanceData.objects.filter(
-            technician__data_file=data_file
-        ).select_related('technician')
+        distance_data = DistanceData.objects.filter(technician__data_file=data_file)
+        
+        stats = distance_data.aggregate(
+            count=Count('id'),
+            avg=Avg('total_distance'),
+            max=Max('total_distance'),
+            min=Min('total_distance')
+        )
         
-        if not distance_data.exists():
+        if not stats['count']:
             return {
                 'total_technicians': 0,
                 'avg_distance': 0,
                 'max_distance': 0,
                 'min_distance': 0,
+                'percentiles': {f"p{percentile}": 0 for percentile in DISTANCE_PERCENTILES},
+                'histogram': [],
                 'technicians': []
             }
         
-        # Calculate summary stats
-        all_distances = [d.total_distance for d in distance_data]
+        summary = {
+            'total_technicians': stats['count'],
+            'avg_distance': round(stats['avg'], 2),
+            'max_distance': round(stats['max'], 2),
+            'min_distance': round(stats['min'], 2),
+            'percentiles': distance_percentiles(distance_data, stats['count']),
+            'histogram': distance_histogram(distance_data, stats['min'], stats['max']),
+        }
         
-        return {
-            'total_technicians': len(distance_data),
-            'avg_distance': round(sum(all_distances) / len(all_distances), 2),
-            'max_distance': round(max(all_distances), 2),
-            'min_distance': round(min(all_distances), 2),
-            'technicians': [{
-                'technician_id': d.technician.technician_id, 
-                'total_distance': d.total_distance,
-                'trip_count': d.trip_count
-            } for d in distance_data]
-        }
\ No newline at end of file
+        if top:
+            listed = distance_data.order_by('-total_distance', 'technician__technician_id')[:top]
+            summary['top'] = top
+        else:
+            offset = (page - 1) * page_size
+            listed = distance_data.order_by('technician__technician_id')[offset:offset + page_size]
+            summary['page'] = page
+            summary['page_size'] = page_size
+            summary['page_count'] = -(-stats['count'] // page_size)
+        
+        summary['technicians'] = [{
+            'technician_id': technician_id,
+            'total_distance': total_distance,
+            'trip_count': trip_count
+        } for technician_id, total_distance, trip_count in listed.values_list(
+            'technician__technician_id', 'total_distance', 'trip_count'
+        )]
+        
+        return summary
+
+
+def distance_percentiles(distance_data, count):
+    """
+    Percentiles of total distance, interpolated linearly between ranks
+    
+    Each percentile reads at most two rows from the database.
+    
+    Args:
+        distance_data: DistanceData queryset
+        count: Number of rows in distance_data
+    
+    Returns:
+        dict: Distance per percentile, keyed 'p50', 'p90', ...
+    """
+    ordered = distance_data.order_by('total_distance').values_list('total_distance', flat=True)
+    percentiles = {}
+    
+    for percentile in DISTANCE_PERCENTILES:
+        rank = percentile / 100 * (count - 1)
+        lower = int(rank)
+        values = list(ordered[lower:lower + 2])
+        value = values[0] + (values[-1] - values[0]) * (rank - lower)
+        percentiles[f"p{percentile}"] = round(value, 2)
+    
+    return percentiles
+
+
+def distance_histogram(distance_data, low, high, bins=DISTANCE_HISTOGRAM_BINS):
+    """
+    Count technicians in equal-width total distance bins
+    
+    Args:
+        distance_data: DistanceData queryset
+        low: Smallest total distance
+        high: Largest total distance
+        bins: Number of bins
+    
+    Returns:
+        list: Start, end and technician count of each bin, empty bins included
+    """
+    if high <= low:
+        return [{'start': round(low, 2), 'end': round(high, 2), 'count': distance_data.count()}]
+    
+    width = (high - low) / bins
+    
+    # The largest distance falls on the upper edge; keep it in the last bin
+    counts = dict(distance_data.annotate(
+        bin=Least(Cast((F('total_distance') - low) / width, IntegerField()), bins - 1)
+    ).values('bin').annotate(count=Count('id')).values_list('bin', 'count'))
+    
+    return [{
+        'start': round(low + i * width, 2),
+        'end': round(low + (i + 1) * width, 2),
+        'count': counts.get(i, 0),
+    } for i in range(bins)]
\ No newline at end of file
@@ -0,0 +1,89 @@
+# Distance kernels shared by the single-process and process-pool paths.
+# Only NumPy is imported here, so pool workers can load this module
+# without setting up Django.
+import numpy as np
+
+
+# Mean Earth radius in kilometres, as used by the haversine package
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in kilometres between arrays of points
+    
+    Vectorized form of haversine.haversine, using the same mean Earth radius.
+    
+    Args:
+        lat1, lon1: Start points in degrees
+        lat2, lon2: End points in degrees
+    
+    Returns:
+        ndarray: Distances in kilometres
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    
+    d = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(d))
+
+
+def segment_distance_sums(positions, latitude, longitude, size):
+    """
+    Sum the distance between consecutive points of each technician
+    
+    Points missing a coordinate are not counted, and segments to or from
+    them are left out, as in build_segment_rows.
+    
+    Args:
+        positions: Technician index of each point, -1 to ignore the point.
+            Points of one technician must be contiguous and in time order.
+        latitude: Latitudes in degrees, NaN when missing
+        longitude: Longitudes in degrees, NaN when missing
+        size: Number of technicians
+    
+    Returns:
+        tuple: Arrays of total distance in km and point count per technician
+    """
+    located = np.isfinite(latitude) & np.isfinite(longitude)
+    
+    # Only consecutive located points of the same technician form a segment
+    same_technician = (positions[1:] == positions[:-1]) & (positions[1:] >= 0) & located[1:] & located[:-1]
+    segments = haversine_km(latitude[:-1], longitude[:-1], latitude[1:], longitude[1:])
+    
+    totals = np.bincount(
+        positions[1:][same_technician],
+        weights=segments[same_technician],
+        minlength=size
+    )
+    counts = np.bincount(positions[(positions >= 0) & located], minlength=size)
+    
+    return totals, counts
+
+
+def shard_bounds(positions, shards):
+    """
+    Split points into contiguous shards of about equal size
+    
+    Shards only break where the technician changes, so every technician's
+    points stay in one shard and shards are balanced by trip count.
+    
+    Args:
+        positions: Technician index of each point, grouped by technician
+        shards: Number of shards wanted
+    
+    Returns:
+        list: (start, stop) row ranges, at most shards of them
+    """
+    n = len(positions)
+    
+    # Row offsets where a new technician starts
+    starts = np.flatnonzero(positions[1:] != positions[:-1]) + 1
+    
+    # Snap evenly spaced targets to the next technician boundary
+    targets = np.arange(1, shards) * n / shards
+    cuts = np.unique(starts[np.minimum(np.searchsorted(starts, targets), len(starts) - 1)]) if len(starts) else []
+    
+    edges = [0] + [int(cut) for cut in cuts] + [n]
+    
+    return [(start, stop) for start, stop in zip(edges, edges[1:]) if stop > start]
@@ -0,0 +1,266 @@
+import json
+import tempfile
+import zipfile
+from django.core.cache import cache
+from django.core.files import File
+from django.utils import timezone
+from dashboard.models import DataFile, IngestJob, Technician
+from dashboard.utils.bulk_reports import generate_bulk_reports, stream_reports_zip
+from dashboard.utils.data_processor import process_excel_file, append_data_file
+from dashboard.utils.distance_analyzer import calculate_technician_distances
+from dashboard.utils.change_tracking import clear_dirty_marks
+
+
+def enqueue_ingest(data_file, file=None, content_hash=''):
+    """
+    Queue a data file for background processing
+    
+    Args:
+        data_file: DataFile model instance
+        file: Optional uploaded delta file to append to the data file
+        content_hash: SHA-256 of the delta file, recorded on the data
+            file once the append succeeds
+    
+    Returns:
+        IngestJob: The queued job
+    """
+    if file is None:
+        return IngestJob.objects.create(data_file=data_file)
+    
+    return IngestJob.objects.create(
+        data_file=data_file,
+        file=file,
+        original_filename=file.name,
+        content_hash=content_hash
+    )
+
+
+def enqueue_distances(data_file):
+    """
+    Queue calculating the distances of every technician of a data file
+    
+    A calculation still waiting in the queue for the file is reused.
+    
+    Args:
+        data_file: DataFile model instance
+    
+    Returns:
+        IngestJob: The queued job
+    """
+    job = IngestJob.objects.filter(data_file=data_file, task='distances', status='queued').first()
+    
+    return job or IngestJob.objects.create(data_file=data_file, task='distances')
+
+
+def enqueue_reports(data_file, report_format):
+    """
+    Queue generating every technician's report of a data file into a ZIP
+    archive
+    
+    A queued run for the same file and format is reused.
+    
+    Args:
+        data_file: DataFile model instance
+        report_format: Format of the reports (pdf or html)
+    
+    Returns:
+        IngestJob: The queued job
+    """
+    job = IngestJob.objects.filter(
+        data_file=data_file,
+        task='reports',
+        report_type=report_format,
+        status='queued'
+    ).first()
+    
+    return job or IngestJob.objects.create(data_file=data_file, task='reports', report_type=report_format)
+
+
+def claim_next_job():
+    """
+    Claim the oldest queued job for this worker
+    
+    The status update only succeeds while the job is still queued, so two
+    workers polling the same table never run the same job.
+    
+    Returns:
+        IngestJob: The claimed job, or None if the queue is empty
+    """
+    while True:
+        job = IngestJob.objects.filter(status='queued').order_by('created_at').first()
+        if job is None:
+            return None
+        
+        claimed = IngestJob.objects.filter(id=job.id, status='queued').update(
+            status='running',
+            started_at=timezone.now()
+        )
+        
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def run_ingest_job(job):
+    """
+    Process a claimed job's data file and record the outcome on the job
+    
+    Args:
+        job: IngestJob model instance in the running state
+    
+    Returns:
+        dict: Summary of processing results from process_excel_file,
+            append_data_file for a delta upload, calculate_file_distances
+            or generate_file_reports
+    """
+    # Progress goes to the cache because the bulk-load transaction keeps
+    # database writes invisible to other connections until it commits
+    def progress(stage, rows_processed):
+        cache.set(progress_cache_key(job), {'stage': stage, 'rows_processed': rows_processed})
+    
+    if job.task == 'distances':
+        result = calculate_file_distances(job.data_file, progress)
+    elif job.task == 'reports':
+        result = generate_file_reports(job, progress)
+    elif job.file:
+        result = append_data_file(job.data_file, job.file, progress=progress)
+    else:
+        result = process_excel_file(job.data_file, progress=progress)
+    
+    job.refresh_from_db()
+    job.finished_at = timezone.now()
+    
+    if result['success']:
+        job.status = 'completed'
+        job.stage = 'done'
+        job.rows_processed = result['record_count']
+        
+        # A re-upload of the appended file can now go straight to the data file
+        if job.content_hash:
+            DataFile.objects.filter(id=job.data_file_id).update(content_hash=job.content_hash)
+    else:
+        job.status = 'failed'
+        job.error = result['error']
+        
+        # Drop any rows saved before the failure; a failed append leaves
+        # the existing data as it was. A processed data file means the load
+        # committed and only something after it failed, so its data stays
+        job.data_file.refresh_from_db()
+        if job.task == 'ingest' and not job.file and not job.data_file.processed:
+            Technician.objects.filter(data_file=job.data_file).delete()
+    
+    job.save()
+    cache.delete(progress_cache_key(job))
+    
+    return result
+
+
+def calculate_file_distances(data_file, progress):
+    """
+    Calculate the distances of every technician of a data file and clear
+    their dirty marks
+    
+    Args:
+        data_file: DataFile model instance
+        progress: Callable taking (stage, rows_processed)
+    
+    Returns:
+        dict: Summary like process_excel_file's, counting trips as records
+    """
+    progress('distances', 0)
+    started = timezone.now()
+    
+    try:
+        results = calculate_technician_distances(data_file)
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+    
+    # Marks made while calculating stay for the next recompute
+    clear_dirty_marks(data_file.technicians.values('id'), started)
+    
+    return {
+        'success': True,
+        'record_count': sum(result['trip_count'] for result in results),
+        'technician_count': len(results),
+    }
+
+
+def generate_file_reports(job, progress):
+    """
+    Generate every technician's report of a job's data file and save the
+    ZIP archive on the job
+    
+    Reports are rendered across settings.REPORT_WORKERS processes, which
+    is why this runs in the worker rather than in a request.
+    
+    Args:
+        job: IngestJob model instance with a report_type
+        progress: Callable taking (stage, rows_processed)
+    
+    Returns:
+        dict: Summary like process_excel_file's, counting reports as records
+    """
+    def results():
+        for count, result in enumerate(generate_bulk_reports(job.data_file, job.report_type), 1):
+            progress('reports', count)
+            yield result
+    
+    progress('reports', 0)
+    
+    try:
+        with tempfile.TemporaryFile() as output:
+            for chunk in stream_reports_zip(results()):
+                output.write(chunk)
+            
+            with zipfile.ZipFile(output) as archive:
+                summary = json.loads(archive.read('manifest.json'))
+            
+            output.seek(0)
+            job.archive.save(f"reports_{job.data_file_id}.zip", File(output), save=False)
+            job.save(update_fields=['archive'])
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+    
+    return {
+        'success': True,
+        'record_count': summary['report_count'],
+        'technician_count': len(summary['reports']),
+    }
+
+
+def progress_cache_key(job):
+    """Cache key holding live progress for a running job"""
+    return f"ingest_job_progress:{job.id}"
+
+
+def get_job_progress(job):
+    """
+    Format a job's progress for the progress endpoint
+    
+    Args:
+        job: IngestJob model instance
+    
+    Returns:
+        dict: Job status, stage, rows processed and rows/sec
+    """
+    if job.status == 'running':
+        live = cache.get(progress_cache_key(job))
+        if live:
+            job.stage = live['stage']
+            job.rows_processed = live['rows_processed']
+    
+    return {
+        'status': job.status,
+        'stage': job.stage,
+        'rows_processed': job.rows_processed,
+        'rows_per_sec': job.rows_per_sec,
+        'error': job.error,
+        'started_at': job.started_at.strftime('%Y-%m-%d %H:%M:%S') if job.started_at else None,
+        'finished_at': job.finished_at.strftime('%Y-%m-%d %H:%M:%S') if job.finished_at else None,
+    }
@@ -0,0 +1,138 @@
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connection
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak memory is then only known with tracemalloc
+    resource = None
+
+
+class IngestProfiler:
+    """
+    Collect wall time, peak memory, row counts and SQL query counts per
+    ingest stage
+    
+    Stages run once per chunk, so each stage accumulates over all of its
+    calls. With trace_memory, peak memory is the highest memory traced by
+    tracemalloc during any call of the stage. Otherwise it is the process's
+    peak RSS when the stage finished, which is cheap but only rises, so it
+    shows which stage pushed the high-water mark.
+    """
+    def __init__(self, mode, trace_memory=None):
+        self.mode = mode
+        self.trace_memory = settings.INGEST_PROFILE_MEMORY if trace_memory is None else trace_memory
+        self.stages = {}
+        self.query_count = 0
+        self.total_seconds = 0
+    
+    @contextmanager
+    def profiling(self):
+        """Count queries and trace memory for the duration of an ingest"""
+        start_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if start_tracing:
+            tracemalloc.start()
+        
+        start = time.perf_counter()
+        
+        try:
+            with connection.execute_wrapper(self.count_query):
+                yield self
+        finally:
+            self.total_seconds = time.perf_counter() - start
+            if start_tracing:
+                tracemalloc.stop()
+    
+    def count_query(self, execute, sql, params, many, context):
+        """Database execute wrapper counting every statement sent"""
+        self.query_count += 1
+        return execute(sql, params, many, context)
+    
+    @contextmanager
+    def stage(self, name, rows=0):
+        """
+        Profile one call of a stage
+        
+        Yields a dict whose 'rows' entry the caller may update once the
+        number of rows handled is known.
+        """
+        counts = {'rows': rows}
+        queries = self.query_count
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        
+        start = time.perf_counter()
+        
+        try:
+            yield counts
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if tracing else peak_rss_bytes()
+            
+            stage = self.stages.setdefault(name, {
+                'name': name,
+                'calls': 0,
+                'seconds': 0,
+                'rows': 0,
+                'queries': 0,
+                'peak_memory_mb': None,
+            })
+            stage['calls'] += 1
+            stage['seconds'] += seconds
+            stage['rows'] += counts['rows']
+            stage['queries'] += self.query_count - queries
+            
+            if peak is not None:
+                stage['peak_memory_mb'] = max(stage['peak_memory_mb'] or 0, round(peak / (1024 * 1024), 1))
+    
+    def iterate(self, name, chunks):
+        """Profile pulling each chunk from an iterator as a call of a stage"""
+        chunks = iter(chunks)
+        
+        while True:
+            with self.stage(name) as counts:
+                chunk = next(chunks, None)
+                counts['rows'] = len(chunk) if chunk is not None else 0
+            
+            if chunk is None:
+                return
+            
+            yield chunk
+    
+    def as_dict(self):
+        """
+        Format the profile for DataFile.ingest_profile
+        
+        Returns:
+            dict: Totals plus one entry per stage, in first-run order
+        """
+        stages = [
+            dict(stage, seconds=round(stage['seconds'], 3))
+            for stage in self.stages.values()
+        ]
+        peaks = [stage['peak_memory_mb'] for stage in stages if stage['peak_memory_mb'] is not None]
+        
+        return {
+            'mode': self.mode,
+            'total_seconds': round(self.total_seconds, 3),
+            'query_count': self.query_count,
+            'peak_memory_mb': max(peaks) if peaks else None,
+            'memory_source': 'tracemalloc' if self.trace_memory else 'rss',
+            'stages': stages,
+        }
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process, or None if unavailable"""
+    if resource is None:
+        return None
+    
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
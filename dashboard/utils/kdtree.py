@@ -0,0 +1,161 @@
+# KD-tree for nearest-neighbour lookups on the sphere. Only NumPy is
+# imported here, like distance_kernels, so the tree can be built and
+# queried without Django.
+import heapq
+import numpy as np
+
+
+# Mean Earth radius in metres
+EARTH_RADIUS_M = 6371008.8
+
+# Most points in a leaf; leaves are searched with one vectorized pass
+LEAF_SIZE = 16
+
+
+def unit_vectors(latitude, longitude):
+    """
+    Points on the unit sphere
+    
+    Straight-line (chord) distance between unit vectors grows with the
+    great-circle distance, so nearest neighbours in 3D are nearest on
+    the Earth, with no special case at the antimeridian or the poles.
+    
+    Returns:
+        ndarray: Array of shape (n, 3)
+    """
+    latitude = np.radians(np.asarray(latitude, dtype=float))
+    longitude = np.radians(np.asarray(longitude, dtype=float))
+    cos_lat = np.cos(latitude)
+    
+    return np.column_stack([cos_lat * np.cos(longitude), cos_lat * np.sin(longitude), np.sin(latitude)])
+
+
+def chord_to_meters(chord):
+    """Great-circle distance in metres for chord lengths on the unit sphere"""
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+
+class KDTree:
+    """
+    Balanced KD-tree over latitude/longitude points
+    
+    Points are stored as unit vectors. Each node splits its points at the
+    median of the axis with the largest spread, so the depth stays
+    logarithmic; nodes are kept in flat lists rather than objects.
+    """
+    
+    def __init__(self, latitude, longitude, leaf_size=LEAF_SIZE):
+        self.points = unit_vectors(latitude, longitude)
+        self.order = np.arange(len(self.points))
+        self.leaf_size = leaf_size
+        
+        # Per node: range of self.order it covers, split axis and value,
+        # and children; leaves have axis -1
+        self.start = []
+        self.end = []
+        self.axis = []
+        self.split = []
+        self.children = []
+        
+        if len(self.points):
+            self.build()
+    
+    def __len__(self):
+        return len(self.points)
+    
+    def add_node(self, start, end):
+        """Append an unsplit node and return its index"""
+        self.start.append(start)
+        self.end.append(end)
+        self.axis.append(-1)
+        self.split.append(0.0)
+        self.children.append((-1, -1))
+        return len(self.start) - 1
+    
+    def build(self):
+        """Split nodes until every leaf holds at most leaf_size points"""
+        pending = [self.add_node(0, len(self.points))]
+        
+        while pending:
+            node = pending.pop()
+            start, end = self.start[node], self.end[node]
+            if end - start <= self.leaf_size:
+                continue
+            
+            indices = self.order[start:end]
+            block = self.points[indices]
+            axis = int(np.argmax(block.max(axis=0) - block.min(axis=0)))
+            
+            # Partition around the median along the widest axis
+            middle = (end - start) // 2
+            partition = np.argpartition(block[:, axis], middle)
+            self.order[start:end] = indices[partition]
+            
+            self.axis[node] = axis
+            self.split[node] = float(self.points[self.order[start + middle], axis])
+            
+            left = self.add_node(start, start + middle)
+            right = self.add_node(start + middle, end)
+            self.children[node] = (left, right)
+            pending.extend([left, right])
+    
+    def query(self, latitude, longitude, k=1, max_distance_m=None):
+        """
+        Find the points nearest to a location
+        
+        Args:
+            latitude: Latitude of the location in degrees
+            longitude: Longitude of the location in degrees
+            k: Number of points to return
+            max_distance_m: Optional largest great-circle distance in metres
+        
+        Returns:
+            tuple: Arrays of point indices and distances in metres, nearest first
+        """
+        if not len(self.points) or k < 1:
+            return np.array([], dtype='int64'), np.array([])
+        
+        target = unit_vectors([latitude], [longitude])[0]
+        
+        # Squared chord length beyond which points are not wanted
+        bound = np.inf
+        if max_distance_m is not None:
+            bound = (2 * np.sin(min(max_distance_m / (2 * EARTH_RADIUS_M), np.pi / 2))) ** 2
+        
+        # Max-heap of the best points so far, as (-squared distance, index)
+        best = []
+        
+        def limit():
+            return -best[0][0] if len(best) == k else bound
+        
+        # Depth-first, visiting the near child before the far one
+        stack = [(0, 0.0)]
+        while stack:
+            node, plane = stack.pop()
+            if plane > limit():
+                continue
+            
+            axis = self.axis[node]
+            if axis < 0:
+                indices = self.order[self.start[node]:self.end[node]]
+                squared = ((self.points[indices] - target) ** 2).sum(axis=1)
+                for index, distance in zip(indices.tolist(), squared.tolist()):
+                    if distance > limit():
+                        continue
+                    if len(best) == k:
+                        heapq.heapreplace(best, (-distance, index))
+                    else:
+                        heapq.heappush(best, (-distance, index))
+                continue
+            
+            offset = target[axis] - self.split[node]
+            left, right = self.children[node]
+            near, far = (left, right) if offset < 0 else (right, left)
+            stack.append((far, offset * offset))
+            stack.append((near, 0.0))
+        
+        found = sorted((-distance, index) for distance, index in best)
+        indices = np.array([index for _, index in found], dtype='int64')
+        distances = chord_to_meters(np.sqrt([distance for distance, _ in found]))
+        
+        return indices, distances
@@ -0,0 +1,230 @@
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db.models import Count
+from dashboard.models import TripRecord
+from dashboard.utils.change_tracking import mark_technicians_dirty
+
+
+# Mean Earth radius in metres
+EARTH_RADIUS_M = 6371008.8
+
+# Flagged ids sent per UPDATE, kept under SQLite's default variable limit
+UPDATE_BATCH_SIZE = 900
+
+# Records loaded at once; technicians are flagged in batches of about this many
+NEAR_DUPLICATE_BATCH_ROWS = 200000
+
+
+def flag_near_duplicates(data_file, distance_m=None, seconds=None, since=None):
+    """
+    Flag GPS-jitter near-duplicates in a data file as duplicates
+    
+    A record is a near-duplicate when an earlier record of the same
+    technician and trip type lies within distance_m metres and seconds
+    seconds of it. Records already flagged as duplicates are ignored.
+    
+    Args:
+        data_file: DataFile model instance
+        distance_m: Distance tolerance in metres. Defaults to
+            settings.NEAR_DUPLICATE_DISTANCE_METERS.
+        seconds: Time tolerance in seconds. Defaults to
+            settings.NEAR_DUPLICATE_SECONDS.
+        since: Only flag records created at or after this datetime,
+            e.g. rows appended to the file. Earlier records within the
+            time tolerance are still loaded to compare against.
+    
+    Returns:
+        int: Count of records newly flagged as duplicates
+    """
+    if distance_m is None:
+        distance_m = settings.NEAR_DUPLICATE_DISTANCE_METERS
+    if seconds is None:
+        seconds = settings.NEAR_DUPLICATE_SECONDS
+    
+    # A zero tolerance disables the check
+    if not distance_m or not seconds:
+        return 0
+    
+    trips = TripRecord.objects.filter(
+        technician__data_file=data_file,
+        duplicate=False,
+        latitude__isnull=False,
+        longitude__isnull=False
+    )
+    
+    if since is not None:
+        trips = trips.filter(created_at__gte=since - timedelta(seconds=seconds))
+    
+    # Records are only compared within a technician, so technicians are
+    # processed in batches of about NEAR_DUPLICATE_BATCH_ROWS records
+    record_counts = trips.values('technician_id').annotate(count=Count('id')).order_by('technician_id')
+    flagged = 0
+    
+    for technician_pks in technician_batches(record_counts.values_list('technician_id', 'count')):
+        flagged += flag_technician_batch(
+            trips.filter(technician_id__in=technician_pks),
+            distance_m,
+            seconds,
+            since
+        )
+    
+    return flagged
+
+
+def technician_batches(record_counts):
+    """
+    Group technicians into batches of about NEAR_DUPLICATE_BATCH_ROWS records
+    
+    A technician with more records than that gets a batch of their own.
+    
+    Args:
+        record_counts: Iterable of (technician primary key, record count)
+    
+    Yields:
+        list: Technician primary keys, at most UPDATE_BATCH_SIZE of them
+    """
+    batch = []
+    rows = 0
+    
+    for technician_pk, count in record_counts:
+        if batch and (rows + count > NEAR_DUPLICATE_BATCH_ROWS or len(batch) == UPDATE_BATCH_SIZE):
+            yield batch
+            batch = []
+            rows = 0
+        
+        batch.append(technician_pk)
+        rows += count
+    
+    if batch:
+        yield batch
+
+
+def flag_technician_batch(trips, distance_m, seconds, since):
+    """
+    Flag near-duplicates among one batch of technicians' records
+    
+    Args:
+        trips: TripRecord QuerySet of the batch's candidate records
+        distance_m: Distance tolerance in metres
+        seconds: Time tolerance in seconds
+        since: Only flag records created at or after this datetime
+    
+    Returns:
+        int: Count of records newly flagged as duplicates
+    """
+    # Time order within each technician is all find_near_duplicates needs,
+    # and lets the batch be read through the technician index
+    trips = trips.order_by('technician_id', 'created_at', 'id').values_list(
+        'id', 'technician_id', 'trip_type', 'latitude', 'longitude', 'created_at'
+    )
+    
+    df = pd.DataFrame.from_records(
+        trips.iterator(chunk_size=50000),
+        columns=['id', 'technician_id', 'trip_type', 'latitude', 'longitude', 'created_at']
+    )
+    
+    if len(df) < 2:
+        return 0
+    
+    # Points are only compared within the same technician and trip type
+    groups = df.groupby(['technician_id', 'trip_type'], sort=False).ngroup().to_numpy()
+    
+    created_at = pd.to_datetime(df['created_at'], utc=True).dt.tz_localize(None)
+    timestamps = created_at.to_numpy(dtype='datetime64[s]').view('int64')
+    
+    flags = find_near_duplicates(
+        groups,
+        df['latitude'].to_numpy(dtype=float),
+        df['longitude'].to_numpy(dtype=float),
+        timestamps,
+        distance_m,
+        seconds
+    )
+    
+    if since is not None:
+        flags &= (df['created_at'] >= since).to_numpy()
+    
+    flagged_ids = df['id'].to_numpy()[flags].tolist()
+    
+    for start in range(0, len(flagged_ids), UPDATE_BATCH_SIZE):
+        TripRecord.objects.filter(
+            id__in=flagged_ids[start:start + UPDATE_BATCH_SIZE]
+        ).update(duplicate=True)
+    
+    mark_technicians_dirty(np.unique(df['technician_id'].to_numpy()[flags]).tolist())
+    
+    return len(flagged_ids)
+
+
+def find_near_duplicates(groups, latitude, longitude, timestamps, distance_m, seconds):
+    """
+    Find points within a distance and time tolerance of an earlier point
+    
+    Points are hashed into grid cells distance_m wide and time windows
+    seconds long. Each point is only compared with points in its own and
+    neighbouring cells of the same or previous window, so the cost grows
+    linearly with the number of points rather than with all pairs.
+    
+    Args:
+        groups: Integer array; points are only compared within a group
+        latitude: Latitudes in degrees
+        longitude: Longitudes in degrees
+        timestamps: Integer times in seconds, sorted ascending within each
+            group; ties are broken by array position
+        distance_m: Distance tolerance in metres
+        seconds: Time tolerance in seconds
+    
+    Returns:
+        ndarray: Boolean mask, True for near-duplicate points
+    """
+    n = len(groups)
+    flags = np.zeros(n, dtype=bool)
+    
+    if n < 2:
+        return flags
+    
+    # Equirectangular projection to metres around each group's mean latitude
+    lat_rad = np.radians(latitude)
+    lon_rad = np.radians(longitude)
+    ref_lat = pd.Series(lat_rad).groupby(groups).transform('mean').to_numpy()
+    
+    x = lon_rad * np.cos(ref_lat) * EARTH_RADIUS_M
+    y = lat_rad * EARTH_RADIUS_M
+    
+    points = pd.DataFrame({
+        'position': np.arange(n),
+        'group': groups,
+        'cell_x': np.floor(x / distance_m).astype(np.int64),
+        'cell_y': np.floor(y / distance_m).astype(np.int64),
+        'window': np.floor_divide(timestamps, seconds),
+    })
+    keys = ['group', 'cell_x', 'cell_y', 'window']
+    
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            for dt in (0, 1):
+                # Move every point forward into the bucket of the points it may precede
+                shifted = points.assign(
+                    cell_x=points['cell_x'] + dx,
+                    cell_y=points['cell_y'] + dy,
+                    window=points['window'] + dt
+                )
+                
+                pairs = points.merge(shifted, on=keys, suffixes=('', '_earlier'))
+                
+                current = pairs['position'].to_numpy()
+                earlier = pairs['position_earlier'].to_numpy()
+                
+                # Positions follow time order within a group, so earlier points have lower positions
+                keep = earlier < current
+                current = current[keep]
+                earlier = earlier[keep]
+                
+                close_in_time = (timestamps[current] - timestamps[earlier]) <= seconds
+                distance = np.hypot(x[current] - x[earlier], y[current] - y[earlier])
+                
+                flags[current[close_in_time & (distance <= distance_m)]] = True
+    
+    return flags
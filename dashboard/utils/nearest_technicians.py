@@ -0,0 +1,160 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from dashboard.models import Technician, TripRecord
+from dashboard.utils.kdtree import KDTree, chord_to_meters, unit_vectors
+
+
+# Bucket trees kept in memory per process; the least recently used go first
+NEAREST_CACHE_SIZE = 64
+
+# Start of the bucket grid, so buckets line up across processes
+BUCKET_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def bucket_bounds(moment):
+    """
+    Time bucket containing a moment
+    
+    Args:
+        moment: Aware datetime
+    
+    Returns:
+        tuple: Start and end of the bucket, NEAREST_BUCKET_MINUTES apart
+    """
+    size = timedelta(minutes=settings.NEAREST_BUCKET_MINUTES)
+    start = BUCKET_EPOCH + (moment - BUCKET_EPOCH) // size * size
+    return start, start + size
+
+
+def last_positions(file_id, since, until):
+    """
+    Last known position of each technician of a data file within a window
+    
+    Only non-duplicate records with coordinates count.
+    
+    Args:
+        file_id: DataFile primary key
+        since: Aware datetime; earlier records are ignored
+        until: Aware datetime; records created up to and including it are used
+    
+    Returns:
+        DataFrame: technician_id, latitude, longitude and created_at
+    """
+    latest = TripRecord.objects.filter(
+        technician=OuterRef('pk'),
+        duplicate=False,
+        latitude__isnull=False,
+        longitude__isnull=False,
+        created_at__gte=since,
+        created_at__lte=until
+    )
+    
+    # One index seek per technician on (technician, created_at)
+    record_ids = Technician.objects.filter(data_file_id=file_id).annotate(
+        last_record=Subquery(latest.order_by('-created_at', '-id').values('id')[:1])
+    ).filter(last_record__isnull=False).values('last_record')
+    
+    columns = ['technician_id', 'latitude', 'longitude', 'created_at']
+    positions = TripRecord.objects.filter(id__in=record_ids).values_list(
+        'technician__technician_id', 'latitude', 'longitude', 'created_at'
+    )
+    
+    return pd.DataFrame.from_records(list(positions), columns=columns)
+
+
+def oldest_position_time(moment):
+    """Earliest time a position may have to place a technician at a moment"""
+    if settings.NEAREST_MAX_AGE_HOURS:
+        return moment - timedelta(hours=settings.NEAREST_MAX_AGE_HOURS)
+    
+    return BUCKET_EPOCH
+
+
+@lru_cache(maxsize=NEAREST_CACHE_SIZE)
+def bucket_tree(file_id, trips_version, bucket_start):
+    """
+    KD-tree over the last known technician positions at the start of a bucket
+    
+    Cached per data file, DataFile.trips_version and bucket; the version
+    is bumped whenever records are added or re-flagged, so a stale tree
+    is never returned.
+    
+    Returns:
+        tuple: KDTree and the DataFrame of positions it was built from
+    """
+    positions = last_positions(file_id, oldest_position_time(bucket_start), bucket_start)
+    
+    return KDTree(positions['latitude'].to_numpy(dtype=float), positions['longitude'].to_numpy(dtype=float)), positions
+
+
+def find_nearest_technicians(data_file, latitude, longitude, moment, k=5, max_distance_m=None):
+    """
+    Find the technicians nearest to a site at a given time
+    
+    Each technician is placed at their last known position at or before
+    moment. Positions as of the start of the NEAREST_BUCKET_MINUTES
+    bucket containing moment come from a tree built once and cached;
+    the few records made within the bucket up to moment replace them.
+    
+    Args:
+        data_file: DataFile model instance
+        latitude: Latitude of the site in degrees
+        longitude: Longitude of the site in degrees
+        moment: Aware datetime of the lookup
+        k: Number of technicians to return
+        max_distance_m: Optional largest distance in metres
+    
+    Returns:
+        dict: Bucket bounds, number of technicians placed and the nearest
+            technicians with their distance in metres
+    """
+    bucket_start, bucket_end = bucket_bounds(moment)
+    tree, positions = bucket_tree(data_file.id, data_file.trips_version, bucket_start)
+    recent = last_positions(data_file.id, bucket_start, moment)
+    
+    # Tree positions replaced within the bucket, or too old by moment
+    stale = (
+        positions['technician_id'].isin(recent['technician_id']) |
+        (positions['created_at'] < oldest_position_time(moment))
+    ).to_numpy(dtype=bool)
+    
+    # Ask for enough neighbours that k remain once stale ones are dropped
+    indices, distances = tree.query(latitude, longitude, k + int(stale.sum()), max_distance_m)
+    fresh = ~stale[indices]
+    indices, distances = indices[fresh], distances[fresh]
+    
+    placed = len(tree) - int(stale.sum()) + len(recent)
+    
+    recent_distances = chord_to_meters(np.linalg.norm(
+        unit_vectors(recent['latitude'].to_numpy(dtype=float), recent['longitude'].to_numpy(dtype=float))
+        - unit_vectors([latitude], [longitude]),
+        axis=1
+    ))
+    
+    if max_distance_m is not None:
+        within = recent_distances <= max_distance_m
+        recent, recent_distances = recent[within], recent_distances[within]
+    
+    candidates = [
+        row + (distance,) for row, distance in zip(positions.iloc[indices].itertuples(index=False), distances.tolist())
+    ] + [
+        row + (distance,) for row, distance in zip(recent.itertuples(index=False), recent_distances.tolist())
+    ]
+    nearest = sorted(candidates, key=lambda candidate: candidate[-1])[:k]
+    
+    return {
+        'bucket_start': bucket_start.isoformat(),
+        'bucket_end': bucket_end.isoformat(),
+        'technician_count': placed,
+        'technicians': [{
+            'technician_id': technician_id,
+            'lat': lat,
+            'long': long,
+            'seen_at': created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'distance_m': round(distance, 1),
+        } for technician_id, lat, long, created_at, distance in nearest]
+    }
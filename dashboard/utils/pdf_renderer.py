@@ -0,0 +1,238 @@
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from datetime import datetime
+from io import BytesIO
+from django.conf import settings
+
+
+# Options passed to wkhtmltopdf by the pdfkit backend
+PDFKIT_OPTIONS = {
+    'page-size': 'A4',
+    'margin-top': '1cm',
+    'margin-right': '1cm',
+    'margin-bottom': '1cm',
+    'margin-left': '1cm',
+    'encoding': 'UTF-8',
+    'no-outline': None,
+    'enable-local-file-access': None
+}
+
+# Document each backend renders once to show that it works
+PROBE_HTML = '<html><body><p>PDF</p></body></html>'
+
+# Detected backend as (name, render function); None before detection and
+# False when no backend works
+_backend = None
+_backend_lock = threading.Lock()
+
+# Render threads shared by all requests of this process, created on first use
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def render_pdf(html_content, technician_id):
+    """
+    Render report HTML to PDF bytes on the shared renderer pool
+    
+    At most settings.PDF_RENDER_WORKERS PDFs render at once, so PDF work
+    cannot take over every request thread. A caller waits at most
+    settings.PDF_RENDER_TIMEOUT seconds, queueing included. pdfkit kills
+    wkhtmltopdf at the timeout; the other backends render in-process and
+    cannot be stopped, so a render still running then keeps its thread
+    and later renders go to a fresh pool.
+    
+    Args:
+        html_content: Report HTML string
+        technician_id: Technician ID, for the ReportLab summary
+    
+    Returns:
+        bytes: PDF content, or None if no backend works, rendering failed
+            or it timed out
+    """
+    backend = get_pdf_backend()
+    if not backend:
+        return None
+    
+    executor = get_render_executor()
+    future = executor.submit(backend[1], html_content, technician_id)
+    
+    try:
+        return future.result(timeout=settings.PDF_RENDER_TIMEOUT) or None
+    except TimeoutError:
+        # A render still waiting for a thread is dropped; one that started
+        # holds its thread, so stop queueing work behind it
+        if not future.cancel():
+            replace_render_executor(executor)
+        return None
+    except Exception:
+        return None
+
+
+def get_pdf_backend():
+    """
+    Find the first PDF backend that renders, once per process
+    
+    pdfkit, WeasyPrint and ReportLab are tried in that order. The winner
+    stays loaded for every later render.
+    
+    Returns:
+        tuple: Backend name and render function, or False if none works
+    """
+    global _backend
+    
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = detect_pdf_backend()
+    
+    return _backend
+
+
+def detect_pdf_backend():
+    """Load each backend in turn and return the first that renders the probe"""
+    for name, loader in [
+        ('pdfkit', load_pdfkit),
+        ('weasyprint', load_weasyprint),
+        ('reportlab', load_reportlab),
+    ]:
+        try:
+            render = loader()
+            if render(PROBE_HTML, 0):
+                return name, render
+        except Exception:
+            continue
+    
+    return False
+
+
+def get_pdf_backend_name():
+    """Name of the PDF backend in use, or None when PDFs fall back to HTML"""
+    backend = get_pdf_backend()
+    return backend[0] if backend else None
+
+
+def get_render_executor():
+    """Get this process's render thread pool, creating it on first use"""
+    global _executor
+    
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.PDF_RENDER_WORKERS,
+                    thread_name_prefix='pdf-render'
+                )
+    
+    return _executor
+
+
+def replace_render_executor(wedged):
+    """
+    Retire a render pool whose thread is stuck on a render
+    
+    Renders already queued on it still finish; new renders get a fresh
+    pool on the next get_render_executor call.
+    """
+    global _executor
+    
+    with _executor_lock:
+        if _executor is wedged:
+            _executor = None
+    
+    wedged.shutdown(wait=False)
+
+
+def reset_render_executor():
+    """Forget the parent's render threads in a forked child"""
+    global _executor, _executor_lock, _backend_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+    _backend_lock = threading.Lock()
+
+
+# Report worker processes are forked; the detected backend carries over
+# but the parent's threads do not
+os.register_at_fork(after_in_child=reset_render_executor)
+
+
+def load_pdfkit():
+    """Load pdfkit and wkhtmltopdf, from WKHTMLTOPDF_PATH if it is set"""
+    import pdfkit
+    
+    wkhtmltopdf_path = os.environ.get('WKHTMLTOPDF_PATH')
+    if wkhtmltopdf_path and os.path.exists(wkhtmltopdf_path):
+        config = pdfkit.configuration(wkhtmltopdf=wkhtmltopdf_path)
+    else:
+        config = pdfkit.configuration()
+    
+    def render(html_content, technician_id):
+        # Run wkhtmltopdf directly, as pdfkit.from_string would, so it is
+        # killed if it outlives the render timeout
+        command = pdfkit.PDFKit(html_content, 'string', options=PDFKIT_OPTIONS, configuration=config).command()
+        result = subprocess.run(
+            command,
+            input=html_content.encode('utf-8'),
+            capture_output=True,
+            timeout=settings.PDF_RENDER_TIMEOUT
+        )
+        return result.stdout if result.returncode == 0 else None
+    
+    return render
+
+
+def load_weasyprint():
+    """Load WeasyPrint"""
+    from weasyprint import HTML
+    
+    def render(html_content, technician_id):
+        return HTML(string=html_content).write_pdf()
+    
+    return render
+
+
+def load_reportlab():
+    """Load ReportLab, which renders a summary page instead of the HTML"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    
+    def render(html_content, technician_id):
+        buffer = BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=letter)
+        styles = getSampleStyleSheet()
+        elements = []
+        
+        # Title
+        title_style = ParagraphStyle(
+            'Title',
+            parent=styles['Heading1'],
+            fontSize=18,
+            textColor=colors.darkblue,
+            alignment=1  # Center alignment
+        )
+        elements.append(Paragraph(f"TECHNICIAN {technician_id} REPORT", title_style))
+        elements.append(Spacer(1, 0.25*inch))
+        
+        # Date
+        elements.append(Paragraph(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal']))
+        elements.append(Spacer(1, 0.25*inch))
+        
+        # Note about HTML version
+        elements.append(Spacer(1, 0.5*inch))
+        note_style = ParagraphStyle(
+            'Note',
+            parent=styles['Normal'],
+            textColor=colors.blue,
+            fontSize=10
+        )
+        elements.append(Paragraph("Note: For a complete report, please generate the HTML version.", note_style))
+        
+        # Build the PDF
+        doc.build(elements)
+        return buffer.getvalue()
+    
+    return render
@@ -0,0 +1,208 @@
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from dashboard.models import Technician, TripRecord
+
+
+# Rows per batch when reading punch records
+PUNCH_BATCH_SIZE = 50000
+
+# Trip types paired into shifts
+PUNCH_TYPES = ['punch_in', 'punch_out']
+
+
+def load_punches(data_file, technician=None):
+    """
+    Load non-duplicate punch-in and punch-out records in one ordered query
+    
+    Args:
+        data_file: DataFile model instance
+        technician: Optional Technician model instance to limit the load to
+    
+    Returns:
+        DataFrame: technician_id, trip_type and created_at (UTC) of each
+            punch, grouped by technician and in time order
+    """
+    punches = TripRecord.objects.filter(
+        technician__data_file=data_file,
+        trip_type__in=PUNCH_TYPES,
+        duplicate=False
+    )
+    
+    if technician is not None:
+        punches = punches.filter(technician=technician)
+    
+    columns = ['technician_id', 'trip_type', 'created_at']
+    rows = punches.order_by('technician_id', 'created_at', 'id').values_list(*columns)
+    
+    df = pd.DataFrame.from_records(rows.iterator(chunk_size=PUNCH_BATCH_SIZE), columns=columns)
+    df['created_at'] = pd.to_datetime(df['created_at'], utc=True)
+    
+    return df
+
+
+def pair_punches(trip_types, created_at, technician_ids=None, max_hours=None):
+    """
+    Pair punch-ins with punch-outs across the whole timeline
+    
+    A punch-out closes its technician's most recent open punch-in, so
+    shifts may run past midnight. A punch-in followed by another
+    punch-in, a punch-out with nothing open and pairs longer than
+    max_hours stay unpaired, so a missed punch only loses its own shift.
+    At equal times punch-outs come first, so a punch-out never closes a
+    punch-in made at the same moment.
+    
+    Args:
+        trip_types: Array of trip types; only punch_in and punch_out are paired
+        created_at: Array of datetime64 values, in time order within each
+            technician
+        technician_ids: Optional array of technician keys, grouped by
+            technician; all records belong to one technician without it
+        max_hours: Optional longest shift; longer pairs are dropped
+    
+    Returns:
+        tuple: Positions of the paired punch-ins and of their punch-outs
+            in the input arrays, in punch-in order
+    """
+    trip_types = np.asarray(trip_types)
+    created_at = np.asarray(created_at)
+    
+    if technician_ids is None:
+        technician_ids = np.zeros(len(created_at), dtype=np.int64)
+    technician_ids = np.asarray(technician_ids)
+    
+    positions = np.flatnonzero(np.isin(trip_types, PUNCH_TYPES))
+    
+    if len(positions) < 2:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    
+    technicians = technician_ids[positions]
+    times = created_at[positions]
+    is_in = trip_types[positions] == 'punch_in'
+    
+    # Punches sharing a technician and time, with the punch-outs first
+    new_moment = np.ones(len(positions), dtype=bool)
+    new_moment[1:] = (technicians[1:] != technicians[:-1]) | (times[1:] != times[:-1])
+    order = np.lexsort((is_in, np.cumsum(new_moment)))
+    positions, technicians, is_in = positions[order], technicians[order], is_in[order]
+    
+    # A punch-out pairs with the punch just before it when that is a
+    # punch-in of the same technician
+    closes = ~is_in[1:] & is_in[:-1] & (technicians[1:] == technicians[:-1])
+    in_positions = positions[:-1][closes]
+    out_positions = positions[1:][closes]
+    
+    if max_hours:
+        short = created_at[out_positions] - created_at[in_positions] <= np.timedelta64(int(max_hours * 3600), 's')
+        in_positions, out_positions = in_positions[short], out_positions[short]
+    
+    return in_positions, out_positions
+
+
+def get_shifts(punches):
+    """
+    Pair punches into shifts
+    
+    Args:
+        punches: DataFrame with trip_type and created_at, and technician_id
+            when it holds more than one technician, as from load_punches
+    
+    Returns:
+        DataFrame: technician_id (when given), punch_in and punch_out as
+            UTC datetime64 values, and duration_hours, in punch-in order
+            per technician
+    """
+    created_at = punches['created_at'].dt.tz_localize(None).to_numpy(dtype='datetime64[ns]')
+    technician_ids = punches['technician_id'].to_numpy() if 'technician_id' in punches else None
+    
+    in_positions, out_positions = pair_punches(
+        punches['trip_type'].to_numpy(),
+        created_at,
+        technician_ids,
+        settings.MAX_SHIFT_HOURS
+    )
+    
+    shifts = pd.DataFrame({
+        'punch_in': created_at[in_positions],
+        'punch_out': created_at[out_positions],
+    })
+    shifts['duration_hours'] = (shifts['punch_out'] - shifts['punch_in']).to_numpy() / np.timedelta64(1, 'h')
+    
+    if technician_ids is not None:
+        shifts.insert(0, 'technician_id', technician_ids[in_positions])
+    
+    return shifts
+
+
+def shift_stats(durations):
+    """
+    Summarize shift durations
+    
+    Args:
+        durations: Array of shift durations in hours
+    
+    Returns:
+        dict: Pair count and average, longest, shortest and total hours
+    """
+    durations = np.asarray(durations, dtype=float)
+    
+    return {
+        'total_pairs': len(durations),
+        'avg_duration': round(float(durations.mean()), 2) if len(durations) else 0,
+        'max_duration': round(float(durations.max()), 2) if len(durations) else 0,
+        'min_duration': round(float(durations.min()), 2) if len(durations) else 0,
+        'total_hours': round(float(durations.sum()), 2) if len(durations) else 0
+    }
+
+
+def get_worked_hours(data_file):
+    """
+    Get worked hours of every technician of a data file
+    
+    Punches of the whole file are loaded in one query and paired in one
+    vectorized pass.
+    
+    Args:
+        data_file: DataFile model instance
+    
+    Returns:
+        dict: Per technician shift counts, hours and unpaired punches, by
+            technician ID, plus fleet totals
+    """
+    punches = load_punches(data_file)
+    shifts = get_shifts(punches)
+    
+    technicians = pd.DataFrame.from_records(
+        Technician.objects.filter(data_file=data_file).order_by('technician_id').values_list('id', 'technician_id'),
+        columns=['id', 'technician_id']
+    ).set_index('id')
+    
+    hours = shifts.groupby('technician_id')['duration_hours'].agg(['count', 'sum', 'mean', 'max', 'min'])
+    punch_counts = punches.groupby(['technician_id', 'trip_type']).size().unstack(fill_value=0)
+    
+    summary = technicians.join(hours).join(punch_counts.reindex(columns=PUNCH_TYPES, fill_value=0))
+    summary[['count', 'punch_in', 'punch_out']] = summary[['count', 'punch_in', 'punch_out']].fillna(0).astype(int)
+    summary[['sum', 'mean', 'max', 'min']] = summary[['sum', 'mean', 'max', 'min']].fillna(0).round(2)
+    
+    rows = [{
+        'technician_id': technician_id,
+        'shift_count': shift_count,
+        'total_hours': total_hours,
+        'avg_hours': avg_hours,
+        'max_hours': max_hours,
+        'min_hours': min_hours,
+        'unpaired_punch_ins': punch_in - shift_count,
+        'unpaired_punch_outs': punch_out - shift_count,
+    } for technician_id, shift_count, total_hours, avg_hours, max_hours, min_hours, punch_in, punch_out in zip(
+        *(summary[column].tolist() for column in ['technician_id', 'count', 'sum', 'mean', 'max', 'min', 'punch_in', 'punch_out'])
+    )]
+    
+    return {
+        'technicians': rows,
+        'totals': {
+            'technician_count': len(rows),
+            'working_technician_count': int((summary['count'] > 0).sum()),
+            'shift_count': len(shifts),
+            'total_hours': round(float(shifts['duration_hours'].sum()), 2),
+        }
+    }
@@ -1,108 +1,267 @@
-import os
+import hashlib
 import numpy as np
 import pandas as pd
-from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Sum
 from django.template.loader import render_to_string
 from django.core.files.base import ContentFile
 from dashboard.models import Report, TripRecord, Technician, DistanceData
+from dashboard.utils.punch_pairs import PUNCH_TYPES, get_shifts, shift_stats
+from dashboard.utils.pdf_renderer import render_pdf
 from datetime import datetime
 import uuid
 
 
+# Part of every report data version; bump it when the report template or
+# analysis changes so existing reports are not reused
+REPORT_FORMAT_VERSION = 3
+
+# Cache keys of the report cache hit and miss counters
+REPORT_CACHE_HITS_KEY = 'report_cache_hits'
+REPORT_CACHE_MISSES_KEY = 'report_cache_misses'
+
+# Trip record fields a report is built from
+REPORT_TRIP_COLUMNS = ['trip_type', 'created_at', 'location', 'latitude', 'longitude']
+
+
 def generate_technician_report(technician, report_format="pdf"):
     """
     Generate a comprehensive report for a technician
     
+    A report already rendered from the same data and format is returned
+    instead of rendering it again.
+    
     Args:
         technician: Technician model instance
         report_format: Format of the report (pdf or html)
-        
+    
     Returns:
         Report: Report model instance
     """
-    # Get all trip records for this technician
-    trip_records = TripRecord.objects.filter(technician=technician, duplicate=False).order_by('created_at')
+    data_version = report_data_version(technician, report_format)
+    
+    report = find_cached_report(technician, data_version)
+    count_report_cache(report is not None)
     
-    if not trip_records.exists():
+    if report:
+        return report, f"Data unchanged since {report.created_at.strftime('%Y-%m-%d %H:%M')}; reusing report: {report.file.name}"
+    
+    content, report_type = render_technician_report(technician, report_format)
+    
+    if content is None:
         return None, "No data available for this technician"
     
+    if report_type == report_format:
+        report = save_report(technician, report_type, content, data_version)
+        return report, f"{report_type.upper()} report generated successfully: {report.file.name}"
+    
+    # Fallback to HTML if PDF generation fails. It is saved without a data
+    # version, so the next PDF request tries the renderer again
+    report = save_report(technician, report_type, content)
+    return report, f"PDF generation failed. HTML report is available: {report.file.name}"
+
+
+def render_technician_report(technician, report_format="pdf"):
+    """
+    Render a technician report without saving it
+    
+    Only reads from the database, so it can run in worker processes.
+    
+    Args:
+        technician: Technician model instance
+        report_format: Format of the report (pdf or html)
+    
+    Returns:
+        tuple: Report content as bytes and its format, which is html when
+            PDF generation fails; (None, None) without trip records
+    """
+    # Get all trip records for this technician
+    trips = load_report_trips(technician)
+    
+    if trips.empty:
+        return None, None
+    
     # Analyze trip records
-    context = analyze_technician_data(technician, trip_records)
+    context = analyze_technician_data(technician, trips)
     
     # Generate HTML content
     html_content = render_to_string('reports/technician_report.html', context)
     
-    # Create report record
+    if report_format == 'html':
+        return html_content.encode('utf-8'), 'html'
+    
+    # Render in memory on the shared PDF renderer pool
+    content = render_pdf(html_content, technician.technician_id)
+    
+    if content is None:
+        return html_content.encode('utf-8'), 'html'
+    
+    return content, 'pdf'
+
+
+def save_report(technician, report_type, content, data_version=''):
+    """
+    Store rendered report content as a Report
+    
+    Args:
+        technician: Technician model instance
+        report_type: Format of the content (pdf or html)
+        content: Report content as bytes
+        data_version: Result of report_data_version for the rendered data;
+            empty for reports that must not be reused
+    
+    Returns:
+        Report: Saved Report model instance
+    """
     report = Report(
         technician=technician,
-        report_type=report_format
+        report_type=report_type,
+        data_version=data_version
     )
     
     # Generate unique filename
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     unique_id = uuid.uuid4().hex[:8]
+    report_filename = f"Technician_{technician.technician_id}_Report_{timestamp}_{unique_id}.{report_type}"
+    report.file.save(report_filename, ContentFile(content))
     
-    if report_format == 'html':
-        # Save HTML content
-        report_filename = f"Technician_{technician.technician_id}_Report_{timestamp}_{unique_id}.html"
-        report.file.save(report_filename, ContentFile(html_content))
-        return report, f"HTML report generated successfully: {report.file.name}"
-    
-    else:  # PDF format
-        # Try multiple PDF generation methods
-        pdf_path = generate_pdf(html_content, technician.technician_id, timestamp, unique_id)
-        
-        if pdf_path:
-            # Open the generated PDF file
-            with open(pdf_path, 'rb') as pdf_file:
-                report_filename = f"Technician_{technician.technician_id}_Report_{timestamp}_{unique_id}.pdf"
-                report.file.save(report_filename, ContentFile(pdf_file.read()))
-            
-            # Remove temporary file
-            if os.path.exists(pdf_path):
-                os.remove(pdf_path)
-            
-            return report, f"PDF report generated successfully: {report.file.name}"
-        else:
-            # Fallback to HTML if PDF generation fails
-            report.report_type = 'html'
-            report_filename = f"Technician_{technician.technician_id}_Report_{timestamp}_{unique_id}.html"
-            report.file.save(report_filename, ContentFile(html_content))
-            return report, f"PDF generation failed. HTML report is available: {report.file.name}"
+    return report
+
+
+def report_data_version(technician, report_format):
+    """
+    Digest of everything a technician's report is rendered from
+    
+    Trip records are only ever inserted or re-flagged as duplicates, so
+    the count, id sum, latest id and latest time of the non-duplicate
+    records change whenever the report content would. The distance data
+    and the requested format are included too.
+    
+    Args:
+        technician: Technician model instance
+        report_format: Requested format of the report (pdf or html)
+    
+    Returns:
+        str: Hex digest
+    """
+    trips = TripRecord.objects.filter(technician=technician, duplicate=False).aggregate(
+        count=Count('id'),
+        id_sum=Sum('id'),
+        last_id=Max('id'),
+        last_at=Max('created_at')
+    )
+    distance = DistanceData.objects.filter(technician=technician).values_list('total_distance', 'trip_count').first()
+    
+    parts = [
+        REPORT_FORMAT_VERSION, technician.id, report_format,
+        trips['count'], trips['id_sum'], trips['last_id'],
+        trips['last_at'].isoformat() if trips['last_at'] else None,
+        distance,
+    ]
+    
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+def find_cached_report(technician, data_version):
+    """
+    Latest report of a technician rendered from the given data version
+    
+    Args:
+        technician: Technician model instance
+        data_version: Result of report_data_version
+    
+    Returns:
+        Report: Report model instance, or None when there is none or its
+            file is gone
+    """
+    report = Report.objects.filter(technician=technician, data_version=data_version).order_by('-created_at').first()
+    
+    if report and report.file.storage.exists(report.file.name):
+        return report
+    
+    return None
+
+
+def count_report_cache(hit):
+    """Count a report cache hit or miss"""
+    key = REPORT_CACHE_HITS_KEY if hit else REPORT_CACHE_MISSES_KEY
+    
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add and incr
+        cache.set(key, 1, timeout=None)
+
+
+def get_report_cache_stats():
+    """
+    Get report cache hit and miss counts
+    
+    Returns:
+        dict: Hits, misses and the hit rate in percent
+    """
+    hits = cache.get(REPORT_CACHE_HITS_KEY, 0)
+    misses = cache.get(REPORT_CACHE_MISSES_KEY, 0)
+    
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses) * 100, 1) if hits + misses else 0,
+    }
+
+
+def load_report_trips(technician):
+    """
+    Load a technician's non-duplicate trips for a report in one query
+    
+    Args:
+        technician: Technician model instance
+    
+    Returns:
+        DataFrame: REPORT_TRIP_COLUMNS of each trip, in time order
+    """
+    rows = TripRecord.objects.filter(
+        technician=technician,
+        duplicate=False
+    ).order_by('created_at', 'id').values_list(*REPORT_TRIP_COLUMNS)
+    
+    trips = pd.DataFrame.from_records(rows.iterator(chunk_size=50000), columns=REPORT_TRIP_COLUMNS)
+    trips['created_at'] = pd.to_datetime(trips['created_at'], utc=True)
+    
+    return trips
 
 
-def analyze_technician_data(technician, trip_records):
+def analyze_technician_data(technician, trips):
     """
     Analyze technician data for report generation
     
     Args:
         technician: Technician model instance
-        trip_records: QuerySet of TripRecord instances
-        
+        trips: DataFrame from load_report_trips
+    
     Returns:
         dict: Context data for the report template
     """
     context = {
         'technician_id': technician.technician_id,
         'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'total_records': trip_records.count(),
+        'total_records': len(trips),
     }
     
-    # Get date range
-    if trip_records.exists():
-        min_date = trip_records.first().created_at
-        max_date = trip_records.last().created_at
+    # Get date range; trips are in time order
+    if len(trips):
         context['date_range'] = {
-            'start': min_date.strftime('%Y-%m-%d'),
-            'end': max_date.strftime('%Y-%m-%d'),
+            'start': trips['created_at'].iloc[0].strftime('%Y-%m-%d'),
+            'end': trips['created_at'].iloc[-1].strftime('%Y-%m-%d'),
         }
     
     # Trip type statistics
-    trip_type_stats = get_trip_type_stats(trip_records)
+    trip_type_stats = get_trip_type_stats(trips)
     context['trip_type_stats'] = trip_type_stats
     
     # Punch-in/out analysis
-    punch_analysis = analyze_punch_records(trip_records)
+    punch_analysis = analyze_punch_records(trips)
     context['punch_analysis'] = punch_analysis
     
     # Distance analysis
@@ -117,35 +276,26 @@ def analyze_technician_data(technician, trip_records):
         context['distance_stats'] = None
     
     # Trip records formatted for display
-    context['trip_records'] = [{
-        'created_at': trip.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-        'trip_type': trip.trip_type,
-        'location': trip.location or 'N/A',
-        'coordinates': f"({trip.latitude:.6f}, {trip.longitude:.6f})" if trip.latitude and trip.longitude else 'N/A'
-    } for trip in trip_records]
+    context['trip_records'] = format_trip_records(trips)
     
     return context
 
 
-def get_trip_type_stats(trip_records):
+def get_trip_type_stats(trips):
     """
     Calculate trip type statistics
     
     Args:
-        trip_records: QuerySet of TripRecord instances
-        
+        trips: DataFrame from load_report_trips
+    
     Returns:
-        list: Trip type statistics
+        list: Trip type statistics, in order of first appearance
     """
-    trip_types = {}
-    total = trip_records.count()
+    total = len(trips)
     
     # Count trips by type
-    for trip in trip_records:
-        if trip.trip_type in trip_types:
-            trip_types[trip.trip_type] += 1
-        else:
-            trip_types[trip.trip_type] = 1
+    codes, trip_types = pd.factorize(trips['trip_type'])
+    counts = np.bincount(codes[codes >= 0], minlength=len(trip_types)).tolist()
     
     # Format for the template
     return [
@@ -154,216 +304,78 @@ def get_trip_type_stats(trip_records):
             'count': count,
             'percentage': round((count / total) * 100, 2) if total > 0 else 0
         }
-        for trip_type, count in trip_types.items()
+        for trip_type, count in zip(trip_types.tolist(), counts)
     ]
 
 
-def analyze_punch_records(trip_records):
+def analyze_punch_records(trips):
     """
     Analyze punch-in and punch-out records
     
+    Punches are paired across the whole timeline, so a shift that runs
+    past midnight shows its punch-out with the date.
+    
     Args:
-        trip_records: QuerySet of TripRecord instances
-        
+        trips: DataFrame from load_report_trips
+    
     Returns:
         dict: Punch-in/out analysis data
     """
-    punch_in_records = [trip for trip in trip_records if trip.trip_type == 'punch_in']
-    punch_out_records = [trip for trip in trip_records if trip.trip_type == 'punch_out']
+    punches = trips[trips['trip_type'].isin(PUNCH_TYPES)]
     
-    if not punch_in_records and not punch_out_records:
+    if punches.empty:
         return None
     
-    # Analyze punch-in/out pairs
-    punch_pairs = []
-    durations = []
-    
-    # Group by date
-    date_groups = {}
-    
-    for record in punch_in_records:
-        date = record.created_at.date()
-        if date not in date_groups:
-            date_groups[date] = {'punch_in': [], 'punch_out': []}
-        date_groups[date]['punch_in'].append(record)
-    
-    for record in punch_out_records:
-        date = record.created_at.date()
-        if date not in date_groups:
-            date_groups[date] = {'punch_in': [], 'punch_out': []}
-        date_groups[date]['punch_out'].append(record)
-    
-    # Process each date
-    for date, records in date_groups.items():
-        # Sort by time
-        records['punch_in'].sort(key=lambda x: x.created_at)
-        records['punch_out'].sort(key=lambda x: x.created_at)
-        
-        # Match punch-ins with punch-outs
-        for punch_in in records['punch_in']:
-            # Find the next punch-out after this punch-in
-            next_punch_out = None
-            for punch_out in records['punch_out']:
-                if punch_out.created_at > punch_in.created_at:
-                    next_punch_out = punch_out
-                    break
-            
-            if next_punch_out:
-                # Calculate duration in hours
-                duration = (next_punch_out.created_at - punch_in.created_at).total_seconds() / 3600
-                
-                punch_pairs.append({
-                    'date': date.strftime('%Y-%m-%d'),
-                    'punch_in': punch_in.created_at.strftime('%H:%M:%S'),
-                    'punch_out': next_punch_out.created_at.strftime('%H:%M:%S'),
-                    'duration_hours': round(duration, 2)
-                })
-                
-                durations.append(duration)
-                
-                # Remove this punch-out from consideration
-                records['punch_out'].remove(next_punch_out)
+    shifts = get_shifts(punches)
+    
+    # ISO text, sliced into date and time of day
+    punch_pairs = [{
+        'date': start[:10],
+        'punch_in': start[11:],
+        'punch_out': end[11:] if end[:10] == start[:10] else end.replace('T', ' '),
+        'duration_hours': round(duration, 2)
+    } for start, end, duration in zip(
+        np.datetime_as_string(shifts['punch_in'].to_numpy(), unit='s').tolist(),
+        np.datetime_as_string(shifts['punch_out'].to_numpy(), unit='s').tolist(),
+        shifts['duration_hours'].tolist()
+    )]
     
     # Compile statistics
     return {
         'pairs': punch_pairs,
-        'stats': {
-            'total_pairs': len(punch_pairs),
-            'avg_duration': round(np.mean(durations), 2) if durations else 0,
-            'max_duration': round(max(durations), 2) if durations else 0,
-            'min_duration': round(min(durations), 2) if durations else 0,
-            'total_hours': round(sum(durations), 2) if durations else 0
-        }
+        'stats': shift_stats(shifts['duration_hours'])
     }
 
 
-def generate_pdf(html_content, technician_id, timestamp, unique_id):
+def format_trip_records(trips):
     """
-    Generate PDF from HTML content using multiple methods
+    Format trips for the report's record table
     
     Args:
-        html_content: HTML content string
-        technician_id: Technician ID
-        timestamp: Timestamp string
-        unique_id: Unique ID string
-        
+        trips: DataFrame from load_report_trips
+    
     Returns:
-        str: Path to the generated PDF file, or None if generation failed
+        list: Time, type, location and coordinates of each trip
     """
-    # Create reports directory if it doesn't exist
-    reports_dir = os.path.join(settings.MEDIA_ROOT, 'reports')
-    os.makedirs(reports_dir, exist_ok=True)
-    
-    # Path for the PDF file
-    pdf_path = os.path.join(reports_dir, f"Technician_{technician_id}_Report_{timestamp}_{unique_id}.pdf")
-    
-    # Path for temporary HTML file
-    html_path = os.path.join(reports_dir, f"temp_{technician_id}_Report_{timestamp}_{unique_id}.html")
-    
-    # Write HTML content to a temporary file
-    with open(html_path, 'w', encoding='utf-8') as f:
-        f.write(html_content)
-    
-    try:
-        # Method 1: Try with pdfkit
-        generate_pdf_with_pdfkit(html_path, pdf_path)
-        if os.path.exists(pdf_path) and os.path.getsize(pdf_path) > 0:
-            return pdf_path
-    except:
-        pass
-    
-    try:
-        # Method 2: Try with weasyprint
-        generate_pdf_with_weasyprint(html_path, pdf_path)
-        if os.path.exists(pdf_path) and os.path.getsize(pdf_path) > 0:
-            return pdf_path
-    except:
-        pass
-    
-    try:
-        # Method 3: Try with reportlab
-        generate_pdf_with_reportlab(html_path, pdf_path, technician_id)
-        if os.path.exists(pdf_path) and os.path.getsize(pdf_path) > 0:
-            return pdf_path
-    except:
-        pass
-    
-    # Clean up temporary HTML file
-    if os.path.exists(html_path):
-        os.remove(html_path)
-    
-    return None
-
-
-def generate_pdf_with_pdfkit(html_path, pdf_path):
-    """Generate PDF using pdfkit"""
-    import pdfkit
-    
-    options = {
-        'page-size': 'A4',
-        'margin-top': '1cm',
-        'margin-right': '1cm',
-        'margin-bottom': '1cm',
-        'margin-left': '1cm',
-        'encoding': 'UTF-8',
-        'no-outline': None,
-        'enable-local-file-access': None
-    }
-    
-    # Try to find wkhtmltopdf in common locations
-    wkhtmltopdf_path = os.environ.get('WKHTMLTOPDF_PATH')
-    if wkhtmltopdf_path and os.path.exists(wkhtmltopdf_path):
-        config = pdfkit.configuration(wkhtmltopdf=wkhtmltopdf_path)
-        pdfkit.from_file(html_path, pdf_path, options=options, configuration=config)
-    else:
-        pdfkit.from_file(html_path, pdf_path, options=options)
-
-
-def generate_pdf_with_weasyprint(html_path, pdf_path):
-    """Generate PDF using WeasyPrint"""
-    from weasyprint import HTML
-    HTML(filename=html_path).write_pdf(pdf_path)
-
-
-def generate_pdf_with_reportlab(html_path, pdf_path, technician_id):
-    """Generate PDF using ReportLab as a fallback"""
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import letter
-    from reportlab.lib import colors
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    
-    # Create PDF with basic info
-    doc = SimpleDocTemplate(pdf_path, pagesize=letter)
-    styles = getSampleStyleSheet()
-    elements = []
-    
-    # Title
-    title_style = ParagraphStyle(
-        'Title',
-        parent=styles['Heading1'],
-        fontSize=18,
-        textColor=colors.darkblue,
-        alignment=1  # Center alignment
-    )
-    elements.append(Paragraph(f"TECHNICIAN {technician_id} REPORT", title_style))
-    elements.append(Spacer(1, 0.25*inch))
-    
-    # Date
-    elements.append(Paragraph(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal']))
-    elements.append(Spacer(1, 0.25*inch))
-    
-    # Note about HTML version
-    elements.append(Spacer(1, 0.5*inch))
-    note_style = ParagraphStyle(
-        'Note',
-        parent=styles['Normal'],
-        textColor=colors.blue,
-        fontSize=10
-    )
-    elements.append(Paragraph("Note: For a complete report, please view the HTML version:", note_style))
-    elements.append(Paragraph(html_path, styles['Code']))
-    
-    # Build the PDF
-    doc.build(elements)
\ No newline at end of file
+    latitude = trips['latitude'].to_numpy(dtype=float)
+    longitude = trips['longitude'].to_numpy(dtype=float)
+    
+    # Missing and zero coordinates are shown as N/A
+    has_coordinates = (np.nan_to_num(latitude) != 0) & (np.nan_to_num(longitude) != 0)
+    
+    # ISO text with the T swapped for a space
+    created_text = np.datetime_as_string(trips['created_at'].dt.tz_localize(None).to_numpy(dtype='datetime64[s]'))
+    
+    return [{
+        'created_at': created_at.replace('T', ' '),
+        'trip_type': trip_type,
+        'location': location or 'N/A',
+        'coordinates': f"({lat:.6f}, {lon:.6f})" if has_coordinate else 'N/A'
+    } for created_at, trip_type, location, lat, lon, has_coordinate in zip(
+        created_text.tolist(),
+        trips['trip_type'].tolist(),
+        trips['location'].fillna('').tolist(),
+        latitude.tolist(),
+        longitude.tolist(),
+        has_coordinates.tolist()
+    )]
\ No newline at end of file
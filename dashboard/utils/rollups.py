@@ -0,0 +1,215 @@
+from datetime import datetime, time, timezone as dt_timezone
+import numpy as np
+import pandas as pd
+from django.db import connection, transaction
+from django.db.models import Min
+from dashboard.models import TripRecord, TripSegment, DailyRollup
+from dashboard.utils.bulk_load import insert_rows, datetime_values
+
+
+# Technicians per IN (...) filter, below SQLite's bound parameter limit
+ROLLUP_TECHNICIAN_BATCH = 900
+
+# Rows per batch when reading records and writing rollups
+ROLLUP_BATCH_SIZE = 10000
+
+# DailyRollup columns written by build_rollup_rows, in tuple order
+DAILY_ROLLUP_COLUMNS = [
+    'technician', 'date', 'trip_count', 'duplicate_count', 'trip_type_counts',
+    'punch_in_hours', 'first_event_at', 'last_event_at', 'distance_km',
+]
+
+
+def rebuild_daily_rollups(data_file, technician_pks=None, since=None):
+    """
+    Rebuild the daily rollups of a data file from its trip records
+    
+    Dates are the UTC days of created_at. Rollups are rebuilt for whole
+    days, so with since every day from the one containing since onwards
+    is replaced and earlier days are left as they are.
+    
+    Args:
+        data_file: DataFile model instance
+        technician_pks: Optional Technician primary keys to limit the rebuild to
+        since: Optional datetime; only days from this one on are rebuilt
+    
+    Returns:
+        int: Number of rollups written
+    """
+    written = 0
+    
+    for scope in technician_scopes(technician_pks):
+        trips = TripRecord.objects.filter(technician__data_file=data_file, **scope)
+        segments = TripSegment.objects.filter(technician__data_file=data_file, **scope)
+        rollups = DailyRollup.objects.filter(technician__data_file=data_file, **scope)
+        
+        if since is not None:
+            # A segment leading into the rebuilt days counts on the day it starts
+            bridge = segments.filter(ended_at__gte=since).aggregate(start=Min('started_at'))['start']
+            first_day = start_of_day(min(since, bridge) if bridge else since)
+            
+            trips = trips.filter(created_at__gte=first_day)
+            segments = segments.filter(started_at__gte=first_day)
+            rollups = rollups.filter(date__gte=first_day.date())
+        
+        records = pd.DataFrame.from_records(
+            trips.values_list('technician_id', 'trip_type', 'created_at', 'duplicate').iterator(chunk_size=ROLLUP_BATCH_SIZE),
+            columns=['technician_id', 'trip_type', 'created_at', 'duplicate']
+        )
+        rows = build_rollup_rows(records, daily_segment_distances(segments))
+        
+        with transaction.atomic():
+            rollups.delete()
+            written += insert_rows(DailyRollup, DAILY_ROLLUP_COLUMNS, rows, ROLLUP_BATCH_SIZE)
+    
+    return written
+
+
+def build_rollup_rows(records, distances):
+    """
+    Aggregate trip records into DailyRollup insert tuples
+    
+    Args:
+        records: DataFrame with technician_id, trip_type, created_at and
+            duplicate columns
+        distances: Series of segment distance in km indexed by
+            (technician_id, day), from daily_segment_distances
+    
+    Returns:
+        iterator: Tuples ordered as DAILY_ROLLUP_COLUMNS, one per
+            technician and day
+    """
+    if records.empty:
+        return iter([])
+    
+    created = pd.to_datetime(records['created_at'], utc=True)
+    records = records.assign(
+        created_at=created,
+        day=created.dt.tz_localize(None).dt.normalize(),
+        hour=created.dt.hour,
+        duplicate=records['duplicate'].astype(bool)
+    )
+    keys = ['technician_id', 'day']
+    
+    days = records.groupby(keys).agg(
+        record_count=('duplicate', 'size'),
+        duplicate_count=('duplicate', 'sum')
+    )
+    
+    # Everything but the record and duplicate counts covers non-duplicates only
+    live = records[~records['duplicate']]
+    events = live.groupby(keys)['created_at'].agg(['min', 'max']).reindex(days.index)
+    
+    type_counts = {}
+    for (tech_pk, day, trip_type), count in live.groupby(keys + ['trip_type']).size().items():
+        type_counts.setdefault((tech_pk, day), {})[trip_type] = int(count)
+    
+    punch_ins = live[live['trip_type'] == 'punch_in'].groupby(keys + ['hour']).size()
+    hours = np.zeros((len(days), 24), dtype='int64')
+    if not punch_ins.empty:
+        rows = days.index.get_indexer(punch_ins.index.droplevel('hour'))
+        hours[rows, punch_ins.index.get_level_values('hour')] = punch_ins.to_numpy()
+    
+    technician_ids = days.index.get_level_values('technician_id')
+    day_values = days.index.get_level_values('day')
+    adapt_date = connection.ops.adapt_datefield_value
+    adapt_json = DailyRollup._meta.get_field('trip_type_counts').get_db_prep_save
+    
+    columns = [
+        technician_ids.tolist(),
+        [adapt_date(day.date()) for day in day_values],
+        (days['record_count'] - days['duplicate_count']).tolist(),
+        days['duplicate_count'].astype('int64').tolist(),
+        [adapt_json(type_counts.get(key, {}), connection) for key in days.index],
+        [adapt_json(hour_counts, connection) for hour_counts in hours.tolist()],
+        datetime_values(events['min']),
+        datetime_values(events['max']),
+        distances.reindex(days.index, fill_value=0).astype(float).tolist(),
+    ]
+    
+    return zip(*columns)
+
+
+def daily_segment_distances(segments):
+    """
+    Sum segment distances per technician and the UTC day they start
+    
+    Args:
+        segments: TripSegment queryset
+    
+    Returns:
+        Series: Distance in km indexed by (technician_id, day)
+    """
+    frame = pd.DataFrame.from_records(
+        segments.values_list('technician_id', 'started_at', 'distance_km').iterator(chunk_size=ROLLUP_BATCH_SIZE),
+        columns=['technician_id', 'started_at', 'distance_km']
+    )
+    
+    if frame.empty:
+        return pd.Series(
+            dtype='float64',
+            index=pd.MultiIndex.from_arrays([[], pd.DatetimeIndex([])], names=['technician_id', 'day'])
+        )
+    
+    frame['day'] = pd.to_datetime(frame['started_at'], utc=True).dt.tz_localize(None).dt.normalize()
+    
+    return frame.groupby(['technician_id', 'day'])['distance_km'].sum()
+
+
+def summarize_rollups(rollups):
+    """
+    Combine daily rollups into totals
+    
+    Args:
+        rollups: DailyRollup queryset
+    
+    Returns:
+        dict: Trip and duplicate counts, non-duplicate counts per trip
+            type, punch-ins per hour, first and last event times and
+            total distance
+    """
+    summary = {
+        'trip_count': 0,
+        'duplicate_count': 0,
+        'trip_types': {},
+        'punch_in_hours': [0] * 24,
+        'first_event_at': None,
+        'last_event_at': None,
+        'distance_km': 0,
+    }
+    
+    for rollup in rollups.iterator(chunk_size=ROLLUP_BATCH_SIZE):
+        summary['trip_count'] += rollup.trip_count
+        summary['duplicate_count'] += rollup.duplicate_count
+        summary['distance_km'] += rollup.distance_km
+        
+        for trip_type, count in rollup.trip_type_counts.items():
+            summary['trip_types'][trip_type] = summary['trip_types'].get(trip_type, 0) + count
+        
+        for hour, count in enumerate(rollup.punch_in_hours):
+            summary['punch_in_hours'][hour] += count
+        
+        if rollup.first_event_at and (summary['first_event_at'] is None or rollup.first_event_at < summary['first_event_at']):
+            summary['first_event_at'] = rollup.first_event_at
+        if rollup.last_event_at and (summary['last_event_at'] is None or rollup.last_event_at > summary['last_event_at']):
+            summary['last_event_at'] = rollup.last_event_at
+    
+    return summary
+
+
+def technician_scopes(technician_pks):
+    """Split a technician selection into filter kwargs of at most ROLLUP_TECHNICIAN_BATCH keys"""
+    if technician_pks is None:
+        return [{}]
+    
+    technician_pks = list(technician_pks)
+    return [
+        {'technician_id__in': technician_pks[start:start + ROLLUP_TECHNICIAN_BATCH]}
+        for start in range(0, len(technician_pks), ROLLUP_TECHNICIAN_BATCH)
+    ]
+
+
+def start_of_day(moment):
+    """Midnight UTC of the day containing an aware datetime"""
+    moment = moment.astimezone(dt_timezone.utc)
+    return datetime.combine(moment.date(), time.min, tzinfo=dt_timezone.utc)
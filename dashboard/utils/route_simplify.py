@@ -0,0 +1,135 @@
+# Route simplification for map payloads. Only NumPy is imported here,
+# like distance_kernels, so the kernels can be used without Django.
+import heapq
+import numpy as np
+
+
+# Mean Earth radius in metres
+EARTH_RADIUS_M = 6371008.8
+
+# Web Mercator ground resolution at zoom 0 on the equator, in metres per pixel
+ZOOM0_METERS_PER_PIXEL = 156543.03392
+
+
+def zoom_tolerance_m(zoom, latitude, pixels=1.0):
+    """
+    Ground distance covered by some pixels at a web map zoom level
+    
+    Args:
+        zoom: Web Mercator zoom level, 0 for the whole world
+        latitude: Latitude in degrees the route is drawn at
+        pixels: Number of pixels
+    
+    Returns:
+        float: Distance in metres
+    """
+    return pixels * ZOOM0_METERS_PER_PIXEL * np.cos(np.radians(latitude)) / 2 ** zoom
+
+
+def project_meters(latitude, longitude):
+    """
+    Project points onto a local plane in metres
+    
+    An equirectangular projection around the mean latitude, accurate
+    enough to compare distances within one route.
+    
+    Args:
+        latitude: Latitudes in degrees
+        longitude: Longitudes in degrees
+    
+    Returns:
+        tuple: Arrays of x and y in metres
+    """
+    scale = np.cos(np.radians(np.mean(latitude)))
+    x = EARTH_RADIUS_M * np.radians(longitude) * scale
+    y = EARTH_RADIUS_M * np.radians(latitude)
+    return x, y
+
+
+def simplify_route(latitude, longitude, keep, tolerance_m, max_points):
+    """
+    Simplify a route with Douglas-Peucker, always keeping some points
+    
+    Points flagged in keep, plus the first and last point, are fixed;
+    the route between each pair of them is simplified separately.
+    Spans are split in order of decreasing deviation, so when
+    max_points stops the simplification early, the points returned are
+    the most significant ones.
+    
+    Args:
+        latitude: Latitudes in degrees, in route order
+        longitude: Longitudes in degrees, in route order
+        keep: Boolean array of points that must be kept
+        tolerance_m: Points deviating less than this many metres from
+            the simplified route are dropped
+        max_points: Largest number of points returned. If the fixed
+            points alone exceed it, they are sampled evenly instead.
+    
+    Returns:
+        ndarray: Sorted indices of the points to keep
+    """
+    n = len(latitude)
+    if n <= 2:
+        return np.arange(n)
+    
+    keep = np.asarray(keep, dtype=bool).copy()
+    keep[[0, -1]] = True
+    anchors = np.flatnonzero(keep)
+    
+    if len(anchors) >= max_points:
+        picks = np.linspace(0, len(anchors) - 1, max_points).round().astype(int)
+        return anchors[np.unique(picks)]
+    
+    x, y = project_meters(np.asarray(latitude, dtype=float), np.asarray(longitude, dtype=float))
+    
+    # Max-heap of spans keyed on the deviation of their farthest point
+    spans = []
+    
+    def push(start, end):
+        if end - start < 2:
+            return
+        split, deviation = farthest_point(x, y, start, end)
+        heapq.heappush(spans, (-deviation, start, end, split))
+    
+    for start, end in zip(anchors[:-1], anchors[1:]):
+        push(start, end)
+    
+    kept = anchors.tolist()
+    budget = max_points - len(kept)
+    
+    while spans and budget > 0:
+        deviation, start, end, split = heapq.heappop(spans)
+        if -deviation < tolerance_m:
+            break
+        
+        kept.append(split)
+        budget -= 1
+        
+        push(start, split)
+        push(split, end)
+    
+    return np.sort(np.array(kept, dtype='int64'))
+
+
+def farthest_point(x, y, start, end):
+    """
+    Find the point between start and end farthest from the segment joining them
+    
+    Returns:
+        tuple: Index of the point and its distance in metres
+    """
+    dx = x[end] - x[start]
+    dy = y[end] - y[start]
+    px = x[start + 1:end] - x[start]
+    py = y[start + 1:end] - y[start]
+    
+    length2 = dx * dx + dy * dy
+    if length2 > 0:
+        t = np.clip((px * dx + py * dy) / length2, 0, 1)
+    else:
+        t = 0
+    
+    distance = np.hypot(px - t * dx, py - t * dy)
+    i = int(np.argmax(distance))
+    
+    return start + 1 + i, float(distance[i])
@@ -0,0 +1,311 @@
+import numpy as np
+import pandas as pd
+from django.db import connection, transaction
+from django.db.models import Q, Exists, OuterRef
+from dashboard.models import Technician, TripRecord
+from dashboard.utils.distance_kernels import haversine_km
+
+
+# Characters of a stored geohash; 9 characters are cells of about 5m x 5m
+GEOHASH_PRECISION = 9
+
+# Geohash base32 alphabet, in ascending ASCII order so that string order
+# matches cell order
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Most cells used to cover a query box; fewer, coarser cells are used
+# when the box would need more
+MAX_COVER_CELLS = 16
+
+# Mean Earth radius in metres
+EARTH_RADIUS_M = 6371008.8
+
+# Records read and updated per batch by backfill_geohashes
+BACKFILL_BATCH_SIZE = 50000
+
+
+def geohash_bits(precision):
+    """Longitude and latitude bits in a geohash of some length"""
+    bits = 5 * precision
+    return (bits + 1) // 2, bits // 2
+
+
+def quantize(latitude, longitude, precision):
+    """
+    Integer cell coordinates of points on the geohash grid
+    
+    Returns:
+        tuple: Arrays of longitude and latitude cell indices
+    """
+    lon_bits, lat_bits = geohash_bits(precision)
+    
+    lon_cells = np.floor((np.asarray(longitude, dtype=float) + 180) / 360 * 2 ** lon_bits)
+    lat_cells = np.floor((np.asarray(latitude, dtype=float) + 90) / 180 * 2 ** lat_bits)
+    
+    return (
+        np.clip(lon_cells, 0, 2 ** lon_bits - 1).astype('int64'),
+        np.clip(lat_cells, 0, 2 ** lat_bits - 1).astype('int64'),
+    )
+
+
+def interleave(lon_cells, lat_cells, precision):
+    """
+    Interleave cell indices into geohash codes
+    
+    Geohash bits alternate starting with longitude, most significant first.
+    
+    Returns:
+        ndarray: Codes of 5 * precision bits
+    """
+    lon_bits, lat_bits = geohash_bits(precision)
+    codes = np.zeros(len(lon_cells), dtype='int64')
+    
+    for bit in range(5 * precision):
+        # Bit position counted from the most significant end
+        source = lon_cells if bit % 2 == 0 else lat_cells
+        width = lon_bits if bit % 2 == 0 else lat_bits
+        codes = (codes << 1) | ((source >> (width - 1 - bit // 2)) & 1)
+    
+    return codes
+
+
+def code_strings(codes, precision):
+    """Format geohash codes as base32 strings"""
+    alphabet = np.frombuffer(GEOHASH_ALPHABET.encode(), dtype='S1')
+    shifts = 5 * np.arange(precision - 1, -1, -1)
+    digits = (np.asarray(codes, dtype='int64')[:, None] >> shifts) & 31
+    
+    return np.ascontiguousarray(alphabet[digits]).view(f'S{precision}').ravel().astype(str)
+
+
+def encode_geohashes(latitude, longitude, precision=GEOHASH_PRECISION):
+    """
+    Geohash of each point
+    
+    Args:
+        latitude: Latitudes in degrees
+        longitude: Longitudes in degrees
+        precision: Geohash length
+    
+    Returns:
+        list: Geohash strings, empty where a coordinate is missing
+    """
+    latitude = np.asarray(latitude, dtype=float)
+    longitude = np.asarray(longitude, dtype=float)
+    
+    if not len(latitude):
+        return []
+    
+    located = ~(np.isnan(latitude) | np.isnan(longitude))
+    hashes = code_strings(interleave(*quantize(
+        np.where(located, latitude, 0), np.where(located, longitude, 0), precision
+    ), precision), precision)
+    
+    return np.where(located, hashes, '').tolist()
+
+
+def backfill_geohashes(data_file=None, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Set the geohash of located records stored before it was kept
+    
+    Args:
+        data_file: Optional DataFile model instance to limit the backfill to
+        batch_size: Records updated per transaction
+    
+    Returns:
+        int: Number of records updated
+    """
+    records = TripRecord.objects.filter(
+        geohash='',
+        latitude__isnull=False,
+        longitude__isnull=False
+    )
+    if data_file:
+        records = records.filter(technician__data_file=data_file)
+    
+    quote = connection.ops.quote_name
+    sql = (
+        f"UPDATE {quote(TripRecord._meta.db_table)} SET {quote('geohash')} = %s "
+        f"WHERE {quote('id')} = %s"
+    )
+    
+    updated = 0
+    last_id = 0
+    
+    while True:
+        batch = list(records.filter(id__gt=last_id).order_by('id').values_list(
+            'id', 'latitude', 'longitude'
+        )[:batch_size])
+        if not batch:
+            break
+        
+        ids, latitude, longitude = zip(*batch)
+        hashes = encode_geohashes(latitude, longitude)
+        
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, list(zip(hashes, ids)))
+        
+        updated += len(batch)
+        last_id = ids[-1]
+    
+    return updated
+
+
+def geohash_ranges(west, south, east, north, max_cells=MAX_COVER_CELLS):
+    """
+    Geohash string ranges covering a bounding box
+    
+    The deepest precision whose cells cover the box with at most
+    max_cells cells is used, and cells with consecutive codes are merged
+    into one range.
+    
+    Args:
+        west, south, east, north: Bounding box in degrees, west <= east
+        max_cells: Most cells to cover the box with
+    
+    Returns:
+        list: (low, high) string bounds, low inclusive and high
+            exclusive; high is None at the end of the code space
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        (lon_min, lon_max), (lat_min, lat_max) = quantize([south, north], [west, east], precision)
+        if (lon_max - lon_min + 1) * (lat_max - lat_min + 1) <= max_cells:
+            break
+    
+    lon_cells, lat_cells = np.meshgrid(np.arange(lon_min, lon_max + 1), np.arange(lat_min, lat_max + 1))
+    codes = np.unique(interleave(lon_cells.ravel(), lat_cells.ravel(), precision))
+    
+    # Start a new range wherever the codes are not consecutive
+    breaks = np.flatnonzero(np.diff(codes) != 1) + 1
+    starts = np.concatenate([[codes[0]], codes[breaks]])
+    ends = np.concatenate([codes[breaks - 1], [codes[-1]]]) + 1
+    
+    last_code = 2 ** (5 * precision)
+    lows = code_strings(starts, precision)
+    highs = code_strings(np.minimum(ends, last_code - 1), precision)
+    
+    return [
+        (low, high if end < last_code else None)
+        for low, high, end in zip(lows.tolist(), highs.tolist(), ends.tolist())
+    ]
+
+
+def geohash_filter(west, south, east, north):
+    """Q object selecting records whose geohash may lie in a bounding box"""
+    condition = Q()
+    
+    for low, high in geohash_ranges(west, south, east, north):
+        if high is None:
+            condition |= Q(geohash__gte=low)
+        else:
+            condition |= Q(geohash__gte=low, geohash__lt=high)
+    
+    return condition
+
+
+def window_records(data_file, start=None, end=None):
+    """Non-duplicate records of a data file created within [start, end)"""
+    # A correlated EXISTS rather than a join, so the planner cannot drive
+    # the query from the technician index and leaves it to the geohash one
+    records = TripRecord.objects.filter(
+        Exists(Technician.objects.filter(id=OuterRef('technician_id'), data_file=data_file)),
+        duplicate=False
+    )
+    
+    if start:
+        records = records.filter(created_at__gte=start)
+    if end:
+        records = records.filter(created_at__lt=end)
+    
+    return records
+
+
+def records_in_bbox(data_file, west, south, east, north, start=None, end=None):
+    """
+    Trip records inside a bounding box, found through the geohash index
+    
+    Args:
+        data_file: DataFile model instance
+        west, south, east, north: Bounding box in degrees. A box crossing
+            the antimeridian has west greater than east.
+        start: Optional datetime; records created at or after it
+        end: Optional datetime; records created before it
+    
+    Returns:
+        QuerySet: Matching non-duplicate TripRecords
+    """
+    if west > east:
+        boxes = [(west, south, 180, north), (-180, south, east, north)]
+    else:
+        boxes = [(west, south, east, north)]
+    
+    condition = Q()
+    for box_west, box_south, box_east, box_north in boxes:
+        # Index ranges first, then the exact bounds within them
+        condition |= geohash_filter(box_west, box_south, box_east, box_north) & Q(
+            latitude__gte=box_south,
+            latitude__lte=box_north,
+            longitude__gte=box_west,
+            longitude__lte=box_east
+        )
+    
+    return window_records(data_file, start, end).filter(condition)
+
+
+def records_within_radius(data_file, latitude, longitude, radius_m, start=None, end=None, limit=None):
+    """
+    Trip records within a distance of a point, nearest first
+    
+    Candidates come from the bounding box of the circle and are then
+    filtered by great-circle distance.
+    
+    Args:
+        data_file: DataFile model instance
+        latitude: Latitude of the centre in degrees
+        longitude: Longitude of the centre in degrees
+        radius_m: Radius in metres
+        start: Optional datetime; records created at or after it
+        end: Optional datetime; records created before it
+        limit: Optional largest number of records returned
+    
+    Returns:
+        list: Records with their distance from the centre in metres
+    """
+    lat_delta = np.degrees(radius_m / EARTH_RADIUS_M)
+    south = max(latitude - lat_delta, -90)
+    north = min(latitude + lat_delta, 90)
+    
+    # Near the poles the circle spans every longitude
+    cos_lat = np.cos(np.radians(max(abs(south), abs(north))))
+    lon_delta = np.degrees(radius_m / (EARTH_RADIUS_M * cos_lat)) if cos_lat > 1e-9 else 180
+    if lon_delta >= 180:
+        west, east = -180, 180
+    else:
+        west = (longitude - lon_delta + 180) % 360 - 180
+        east = (longitude + lon_delta + 180) % 360 - 180
+    
+    columns = ['id', 'technician__technician_id', 'trip_type', 'latitude', 'longitude', 'created_at']
+    candidates = records_in_bbox(data_file, west, south, east, north, start, end).values_list(*columns)
+    df = pd.DataFrame.from_records(candidates.iterator(chunk_size=50000), columns=columns)
+    
+    if df.empty:
+        return []
+    
+    df['distance_m'] = 1000 * haversine_km(
+        latitude, longitude,
+        df['latitude'].to_numpy(dtype=float), df['longitude'].to_numpy(dtype=float)
+    )
+    df = df[df['distance_m'] <= radius_m].sort_values(['distance_m', 'id'])
+    
+    if limit is not None:
+        df = df.head(limit)
+    
+    return [{
+        'id': record_id,
+        'technician_id': technician_id,
+        'trip_type': trip_type,
+        'lat': lat,
+        'long': long,
+        'time': created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'distance_m': round(distance, 1),
+    } for record_id, technician_id, trip_type, lat, long, created_at, distance in df.itertuples(index=False)]
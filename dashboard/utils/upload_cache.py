@@ -0,0 +1,105 @@
+import hashlib
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from dashboard.models import DataFile
+from dashboard.utils.data_processor import HEAD_ROWS, get_file_reader, clean_data, row_hashes, head_digest
+
+
+class HashingFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Stream uploads to a temporary file, hashing the bytes on the way
+    
+    The SHA-256 hex digest is set as content_hash on the uploaded file,
+    so identical uploads are recognised without reading them again.
+    """
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+    
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+    
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.content_hash = self.hasher.hexdigest()
+        return file
+
+
+def upload_content_hash(upload):
+    """
+    Get the SHA-256 hex digest of an uploaded file
+    
+    Args:
+        upload: UploadedFile from request.FILES
+    
+    Returns:
+        str: Digest from HashingFileUploadHandler, or hashed here if the
+            upload came through another handler
+    """
+    content_hash = getattr(upload, 'content_hash', None)
+    if content_hash:
+        return content_hash
+    
+    hasher = hashlib.sha256()
+    for chunk in upload.chunks():
+        hasher.update(chunk)
+    
+    upload.seek(0)
+    return hasher.hexdigest()
+
+
+def find_processed_copy(content_hash):
+    """
+    Find a processed data file uploaded with exactly the same content
+    
+    Args:
+        content_hash: SHA-256 hex digest of the upload
+    
+    Returns:
+        DataFile: Matching data file, or None
+    """
+    return DataFile.objects.filter(
+        content_hash=content_hash,
+        processed=True
+    ).order_by('-upload_date').first()
+
+
+def find_overlapping_file(upload):
+    """
+    Find a processed data file that an upload is a re-export of
+    
+    The upload's leading rows are hashed and compared with the head_hash
+    of existing files. A file whose rows all lead the upload, or whose
+    first HEAD_ROWS rows match, is taken to be an earlier export of it.
+    
+    Args:
+        upload: UploadedFile from request.FILES, stored on disk
+    
+    Returns:
+        DataFile: Overlapping data file, or None
+    """
+    if not hasattr(upload, 'temporary_file_path'):
+        return None
+    
+    reader = get_file_reader(upload.name)
+    chunks = reader(upload.temporary_file_path(), True, HEAD_ROWS)
+    
+    try:
+        head = next(chunks, None)
+        if head is None or head.empty:
+            return None
+        
+        hashes = row_hashes(clean_data(head.head(HEAD_ROWS), copy=False))
+    except Exception:
+        # Unreadable files are reported by the ingest job instead
+        return None
+    finally:
+        chunks.close()
+    
+    # Digest every prefix, so shorter files that this one extends also match
+    digests = [head_digest(hashes[:n]) for n in range(1, len(hashes) + 1)]
+    
+    return DataFile.objects.filter(
+        head_hash__in=digests,
+        processed=True
+    ).order_by('-upload_date').first()
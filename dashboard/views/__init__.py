@@ -0,0 +1,54 @@
+from .data_views import (
+    index,
+    upload_file,
+    data_overview,
+    append_file,
+    get_ingest_progress,
+    get_dirty_status,
+    recompute_derived_data,
+    delete_file,
+    switch_file,
+)
+from .duplicate_views import (
+    duplicate_analysis,
+    get_duplicate_summary,
+    get_duplicate_records,
+)
+from .trip_views import (
+    trip_analysis,
+    get_trip_type_chart_data,
+    get_punch_in_chart_data,
+    get_trip_type_summary,
+)
+from .technician_views import (
+    technician_logs,
+    get_technician_summary,
+    get_punch_in_out_data,
+    get_worked_hours_data,
+    get_timeline_data,
+)
+from .distance_views import (
+    distance_analysis,
+    calculate_distances,
+    get_distance_data,
+    get_location_map_data,
+    get_cluster_map_data,
+    get_distance_window_data,
+    get_distance_chart_data,
+)
+from .spatial_views import (
+    get_bbox_records,
+    get_radius_records,
+    get_nearest_technicians,
+)
+from .report_views import (
+    report_generation,
+    generate_report,
+    generate_bulk_report,
+    download_bulk_report,
+    view_report,
+    download_report,
+    delete_report,
+    get_reports_list,
+    get_report_cache_status,
+)
@@ -2,9 +2,12 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
-from dashboard.models import DataFile, Technician, TripRecord
-from dashboard.forms import FileUploadForm
-from dashboard.utils.data_processor import process_excel_file
+from dashboard.models import DataFile, Technician, TripRecord, DailyRollup
+from dashboard.forms import FileUploadForm, AppendFileForm
+from dashboard.utils.ingest_jobs import enqueue_ingest, get_job_progress
+from dashboard.utils.upload_cache import upload_content_hash, find_processed_copy, find_overlapping_file
+from dashboard.utils.rollups import summarize_rollups
+from dashboard.utils.change_tracking import recompute_dirty_technicians, get_dirty_counts
 
 
 def index(request):
@@ -30,20 +33,35 @@ def upload_file(request):
     if request.method == 'POST':
         form = FileUploadForm(request.POST, request.FILES)
         if form.is_valid():
+            upload = form.cleaned_data['file']
+            content_hash = upload_content_hash(upload)
+            
+            # Send the user straight to an identical file processed earlier
+            processed_copy = find_processed_copy(content_hash)
+            if processed_copy:
+                messages.info(request, "This file was already uploaded and processed.")
+                return redirect('data_overview', file_id=processed_copy.id)
+            
+            # A re-export that grew is appended, so only its new rows are ingested
+            overlapping = find_overlapping_file(upload)
+            if overlapping:
+                enqueue_ingest(overlapping, file=upload, content_hash=content_hash)
+                messages.info(
+                    request,
+                    f"This file overlaps with {overlapping.original_filename}. Only new rows are being added in the background."
+                )
+                return redirect('data_overview', file_id=overlapping.id)
+            
             # Save the file
-            data_file = form.save()
+            data_file = form.save(commit=False)
+            data_file.content_hash = content_hash
+            data_file.save()
             
-            # Process the file
-            result = process_excel_file(data_file)
+            # Queue the file for the background ingest worker
+            enqueue_ingest(data_file)
             
-            if result['success']:
-                messages.success(request, f"File processed successfully: {result['record_count']} records, {result['technician_count']} technicians")
-                return redirect('data_overview', file_id=data_file.id)
-            else:
-                # Delete the file if processing failed
-                data_file.delete()
-                messages.error(request, f"Error processing file: {result['error']}")
-                return redirect('index')
+            messages.info(request, "File uploaded. Processing has started in the background.")
+            return redirect('data_overview', file_id=data_file.id)
     else:
         form = FileUploadForm()
     
@@ -82,54 +100,100 @@ def data_overview(request, file_id):
             'duplicate': 'Yes' if record.duplicate else 'No'
         })
     
-    # Basic summary stats
+    # Basic summary stats, from the daily rollups
+    rollups = summarize_rollups(DailyRollup.objects.filter(technician__data_file=data_file))
     stats = {
-        'record_count': TripRecord.objects.filter(technician__data_file=data_file).count(),
+        'record_count': rollups['trip_count'] + rollups['duplicate_count'],
         'technician_count': technicians.count(),
-        'duplicate_count': TripRecord.objects.filter(technician__data_file=data_file, duplicate=True).count(),
+        'duplicate_count': rollups['duplicate_count'],
     }
     
     # If we have trip_type field, add trip type counts
-    trip_counts = TripRecord.objects.filter(
-        technician__data_file=data_file, 
-        duplicate=False
-    ).values('trip_type').annotate(
-        count=Count('id')
-    ).order_by('-count')
-    
-    if trip_counts.exists():
+    if rollups['trip_types']:
         stats['trip_types'] = [
-            {'trip_type': item['trip_type'], 'count': item['count']}
-            for item in trip_counts
+            {'trip_type': trip_type, 'count': count}
+            for trip_type, count in sorted(rollups['trip_types'].items(), key=lambda item: -item[1])
         ]
     
     # Get date range
-    if sample_data.exists():
-        first_record = TripRecord.objects.filter(
-            technician__data_file=data_file
-        ).order_by('created_at').first()
-        
-        last_record = TripRecord.objects.filter(
-            technician__data_file=data_file
-        ).order_by('created_at').last()
-        
-        if first_record and last_record:
-            stats['date_range'] = {
-                'start': first_record.created_at.strftime('%Y-%m-%d'),
-                'end': last_record.created_at.strftime('%Y-%m-%d')
-            }
+    if rollups['first_event_at'] and rollups['last_event_at']:
+        stats['date_range'] = {
+            'start': rollups['first_event_at'].strftime('%Y-%m-%d'),
+            'end': rollups['last_event_at'].strftime('%Y-%m-%d')
+        }
     
     context = {
         'data_file': data_file,
         'technicians': technicians,
         'sample_data': formatted_data,
         'columns': columns,
-        'stats': stats
+        'stats': stats,
+        'ingest_job': data_file.ingest_jobs.order_by('-created_at').first(),
+        'append_form': AppendFileForm()
     }
     
     return render(request, 'dashboard/data_overview.html', context)
 
 
+@require_POST
+def append_file(request, file_id):
+    """Append a delta upload to an existing data file"""
+    data_file = get_object_or_404(DataFile, id=file_id)
+    
+    # An append needs the first load's rows and row hashes to compare against
+    if not data_file.processed:
+        messages.error(request, "This file has not finished processing. Append new rows once it has loaded.")
+        return redirect('data_overview', file_id=data_file.id)
+    
+    form = AppendFileForm(request.POST, request.FILES)
+    if form.is_valid():
+        # Rows not ingested from an earlier upload are appended by the worker
+        enqueue_ingest(data_file, file=form.cleaned_data['file'])
+        messages.info(request, "File uploaded. New rows are being appended in the background.")
+    else:
+        for error in form.errors.get('file', []):
+            messages.error(request, error)
+    
+    return redirect('data_overview', file_id=data_file.id)
+
+
+def get_ingest_progress(request, file_id):
+    """Get background processing progress for a data file as JSON"""
+    data_file = get_object_or_404(DataFile, id=file_id)
+    
+    job = data_file.ingest_jobs.order_by('-created_at').first()
+    
+    if not job:
+        return JsonResponse({'error': 'No processing job for this file'}, status=404)
+    
+    return JsonResponse(get_job_progress(job))
+
+
+def get_dirty_status(request, file_id):
+    """Get the number of technicians with stale derived data as JSON"""
+    data_file = get_object_or_404(DataFile, id=file_id)
+    
+    return JsonResponse(get_dirty_counts(data_file))
+
+
+@require_POST
+def recompute_derived_data(request, file_id):
+    """Refresh distances, segments and rollups of dirty technicians"""
+    data_file = get_object_or_404(DataFile, id=file_id)
+    
+    # Reports are only regenerated when asked for
+    reports = request.POST.get('reports') in ('1', 'true', 'on')
+    
+    summary = recompute_dirty_technicians(data_file, reports=reports)
+    
+    return JsonResponse({
+        'success': True,
+        'message': f"Recomputed derived data for {summary['technician_count']} technician(s)",
+        **summary,
+        **get_dirty_counts(data_file)
+    })
+
+
 @require_POST
 def delete_file(request, file_id):
     """Delete a data file"""
@@ -2,13 +2,30 @@ from django.shortcuts import render, get_object_or_404
 from django.http import JsonResponse
 from django.contrib import messages
 from django.views.decorators.http import require_POST
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time
 from dashboard.models import DataFile, Technician, DistanceData
 from dashboard.forms import TechnicianFilterForm
+from dashboard.utils.change_tracking import clear_dirty_marks
+from dashboard.utils.cluster_index import get_cluster_cells
 from dashboard.utils.distance_analyzer import (
     calculate_technician_distances,
     get_trip_locations,
-    get_distance_summary
+    get_trip_location_counts,
+    get_distance_summary,
+    get_window_distance,
+    get_daily_distances,
+    DISTANCE_SUMMARY_PAGE_SIZE
 )
+from dashboard.utils.ingest_jobs import enqueue_distances
+
+
+# Deepest web map zoom level accepted by get_location_map_data
+MAX_MAP_ZOOM = 22
+
+# Most technicians listed by one get_distance_data response
+MAX_SUMMARY_TECHNICIANS = 1000
 
 
 def distance_analysis(request, file_id):
@@ -40,7 +57,7 @@ def distance_analysis(request, file_id):
 
 @require_POST
 def calculate_distances(request, file_id):
-    """Calculate distances for all technicians in a data file"""
+    """Calculate distances for one technician, or queue them for the whole data file"""
     data_file = get_object_or_404(DataFile, id=file_id)
     
     # Get technician if specified
@@ -53,9 +70,24 @@ def calculate_distances(request, file_id):
         except Technician.DoesNotExist:
             return JsonResponse({'error': 'Technician not found'}, status=404)
     
+    # A whole file can take minutes, so it is calculated by the background worker
+    if technician is None:
+        job = enqueue_distances(data_file)
+        return JsonResponse({
+            'success': True,
+            'queued': True,
+            'job_id': job.id,
+            'message': "Distance calculation queued; progress is shown on the data overview"
+        }, status=202)
+    
     # Calculate distances
+    started = timezone.now()
     results = calculate_technician_distances(data_file, technician)
     
+    # Distances, segments and rollups are fresh now; map cells are kept
+    # current by the ingest itself
+    clear_dirty_marks([technician.id], started)
+    
     # Return success message with count of technicians processed
     return JsonResponse({
         'success': True,
@@ -78,19 +110,92 @@ def get_distance_data(request, file_id):
         except Technician.DoesNotExist:
             return JsonResponse({'error': 'Technician not found'}, status=404)
     
+    # Technician list: the top N by distance, or one page by technician ID
+    try:
+        top = int(request.GET['top']) if request.GET.get('top') else None
+        page = int(request.GET.get('page') or 1)
+        page_size = int(request.GET.get('page_size') or DISTANCE_SUMMARY_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'top, page and page_size must be whole numbers'}, status=400)
+    
+    if (top is not None and not 1 <= top <= MAX_SUMMARY_TECHNICIANS) or page < 1 or not 1 <= page_size <= MAX_SUMMARY_TECHNICIANS:
+        return JsonResponse({
+            'error': f"top and page_size must be between 1 and {MAX_SUMMARY_TECHNICIANS}, and page at least 1"
+        }, status=400)
+    
     # Get distance summary
-    summary = get_distance_summary(data_file, technician)
+    summary = get_distance_summary(data_file, technician, top=top, page=page, page_size=page_size)
     
     return JsonResponse(summary)
 
 
+def get_distance_window_data(request, file_id):
+    """Get distance totals within a time window and per day as JSON"""
+    data_file = get_object_or_404(DataFile, id=file_id)
+    
+    # Get technician if specified
+    technician_id = request.GET.get('technician')
+    technician = None
+    
+    if technician_id:
+        try:
+            technician = Technician.objects.get(id=technician_id, data_file=data_file)
+        except Technician.DoesNotExist:
+            return JsonResponse({'error': 'Technician not found'}, status=404)
+    
+    try:
+        start = parse_window_bound(request.GET.get('start'))
+        end = parse_window_bound(request.GET.get('end'))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid start or end; use YYYY-MM-DD or an ISO datetime'}, status=400)
+    
+    response = {
+        'success': True,
+        'daily': get_daily_distances(data_file, technician, start, end)
+    }
+    
+    if technician:
+        response['window'] = get_window_distance(technician, start, end)
+    
+    return JsonResponse(response)
+
+
+def parse_window_bound(value):
+    """Parse a date or datetime query parameter into an aware datetime"""
+    if not value:
+        return None
+    
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError(value)
+        parsed = datetime.combine(date, time.min)
+    
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    
+    return parsed
+
+
 def get_location_map_data(request, file_id, technician_id):
     """Get location data for map visualization as JSON"""
     data_file = get_object_or_404(DataFile, id=file_id)
     technician = get_object_or_404(Technician, id=technician_id, data_file=data_file)
     
+    # Map zoom level the route is simplified for
+    zoom = request.GET.get('zoom')
+    if zoom is not None:
+        try:
+            zoom = int(zoom)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid zoom level'}, status=400)
+        
+        if not 0 <= zoom <= MAX_MAP_ZOOM:
+            return JsonResponse({'error': f"Zoom level must be between 0 and {MAX_MAP_ZOOM}"}, status=400)
+    
     # Get location data
-    locations = get_trip_locations(technician)
+    locations = get_trip_locations(technician, zoom)
     
     if not locations:
         return JsonResponse({
@@ -98,22 +203,43 @@ def get_location_map_data(request, file_id, technician_id):
             'message': 'No location data available'
         })
     
-    # Count trip types for bar chart
-    trip_type_counts = {}
-    for loc in locations:
-        trip_type = loc['trip_type']
-        trip_type_counts[trip_type] = trip_type_counts.get(trip_type, 0) + 1
-    
-    # Format for frontend chart
-    trip_data = [
-        {'trip_type': trip_type, 'count': count}
-        for trip_type, count in trip_type_counts.items()
-    ]
+    # Count trip types for bar chart, over the whole route
+    trip_data = get_trip_location_counts(technician)
     
     return JsonResponse({
         'success': True,
         'locations': locations,
-        'trip_data': trip_data
+        'trip_data': trip_data,
+        'zoom': zoom,
+        'point_count': sum(item['count'] for item in trip_data)
+    })
+
+
+def get_cluster_map_data(request, file_id):
+    """Get clustered trip locations of all technicians for a map view as JSON"""
+    data_file = get_object_or_404(DataFile, id=file_id)
+    
+    # Zoom level and bounding box as west,south,east,north
+    try:
+        zoom = int(request.GET.get('zoom', 0))
+        bbox = request.GET.get('bbox')
+        west, south, east, north = [float(value) for value in bbox.split(',')] if bbox else (-180, -90, 180, 90)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid zoom level or bounding box'}, status=400)
+    
+    if not 0 <= zoom <= MAX_MAP_ZOOM:
+        return JsonResponse({'error': f"Zoom level must be between 0 and {MAX_MAP_ZOOM}"}, status=400)
+    
+    if south > north:
+        return JsonResponse({'error': 'Bounding box south is above north'}, status=400)
+    
+    clusters = get_cluster_cells(data_file, zoom, west, south, east, north)
+    
+    return JsonResponse({
+        'success': True,
+        'zoom': zoom,
+        'clusters': clusters,
+        'point_count': sum(cluster['count'] for cluster in clusters)
     })
 
 
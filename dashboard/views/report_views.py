@@ -3,10 +3,13 @@ from django.http import JsonResponse, HttpResponse, FileResponse
 from django.contrib import messages
 from django.views.decorators.http import require_POST
 from django.conf import settings
+from django.utils import timezone
 import os
-from dashboard.models import DataFile, Technician, Report
+from dashboard.models import DataFile, Technician, Report, IngestJob
 from dashboard.forms import ReportGenerationForm
-from dashboard.utils.report_generator import generate_technician_report
+from dashboard.utils.report_generator import generate_technician_report, get_report_cache_stats
+from dashboard.utils.ingest_jobs import enqueue_reports
+from dashboard.utils.pdf_renderer import get_pdf_backend_name
 
 
 def report_generation(request, file_id):
@@ -24,7 +27,10 @@ def report_generation(request, file_id):
     context = {
         'data_file': data_file,
         'form': form,
-        'recent_reports': recent_reports
+        'recent_reports': recent_reports,
+        'bulk_job': data_file.ingest_jobs.filter(task='reports').order_by('-created_at').first(),
+        'report_cache': get_report_cache_stats(),
+        'pdf_backend': get_pdf_backend_name()
     }
     
     return render(request, 'dashboard/report_generation.html', context)
@@ -60,6 +66,42 @@ def generate_report(request, file_id):
     return redirect('report_generation', file_id=file_id)
 
 
+@require_POST
+def generate_bulk_report(request, file_id):
+    """Queue reports for every technician as a ZIP archive"""
+    data_file = get_object_or_404(DataFile, id=file_id)
+    
+    report_format = request.POST.get('report_type', 'pdf')
+    if report_format not in ('pdf', 'html'):
+        messages.error(request, "Report format must be PDF or HTML")
+        return redirect('report_generation', file_id=file_id)
+    
+    # Reports render in a process pool, which only the worker runs
+    enqueue_reports(data_file, report_format)
+    messages.info(request, "Reports are being generated in the background. The ZIP can be downloaded here once they are done.")
+    
+    return redirect('report_generation', file_id=file_id)
+
+
+def download_bulk_report(request, job_id):
+    """Stream the ZIP archive of reports a worker generated"""
+    job = get_object_or_404(IngestJob, id=job_id, task='reports')
+    
+    # Check the worker has finished the archive
+    if job.status != 'completed' or not job.archive:
+        messages.error(request, "The reports have not been generated yet")
+        return redirect('report_generation', file_id=job.data_file_id)
+    
+    filename = f"Reports_{job.data_file_id}_{timezone.localtime(job.finished_at).strftime('%Y%m%d_%H%M%S')}.zip"
+    
+    return FileResponse(
+        job.archive.open('rb'),
+        content_type='application/zip',
+        as_attachment=True,
+        filename=filename
+    )
+
+
 def view_report(request, report_id):
     """View a generated report"""
     report = get_object_or_404(Report, id=report_id)
@@ -155,4 +197,9 @@ def get_reports_list(request, file_id):
     
     return JsonResponse({
         'reports': formatted_reports
-    })
\ No newline at end of file
+    })
+
+
+def get_report_cache_status(request):
+    """Get report cache hit and miss counts as JSON"""
+    return JsonResponse(get_report_cache_stats())
\ No newline at end of file
@@ -0,0 +1,129 @@
+from django.shortcuts import get_object_or_404
+from django.http import JsonResponse
+from django.utils import timezone
+from dashboard.models import DataFile
+from dashboard.utils.spatial_index import records_in_bbox, records_within_radius
+from dashboard.utils.nearest_technicians import find_nearest_technicians
+from .distance_views import parse_window_bound
+
+
+# Records returned when no limit is given, and the most allowed
+DEFAULT_RECORD_LIMIT = 1000
+MAX_RECORD_LIMIT = 10000
+
+# Largest radius accepted by get_radius_records, in metres
+MAX_RADIUS_METERS = 100000
+
+# Technicians returned by get_nearest_technicians when k is not given, and the most allowed
+DEFAULT_NEAREST_COUNT = 5
+MAX_NEAREST_COUNT = 100
+
+
+def parse_record_limit(value):
+    """Parse the limit query parameter, capped at MAX_RECORD_LIMIT"""
+    if not value:
+        return DEFAULT_RECORD_LIMIT
+    
+    limit = int(value)
+    if limit < 1:
+        raise ValueError(value)
+    
+    return min(limit, MAX_RECORD_LIMIT)
+
+
+def get_bbox_records(request, file_id):
+    """Get trip records inside a bounding box and optional time window as JSON"""
+    data_file = get_object_or_404(DataFile, id=file_id)
+    
+    try:
+        west, south, east, north = [float(value) for value in request.GET.get('bbox', '').split(',')]
+        start = parse_window_bound(request.GET.get('start'))
+        end = parse_window_bound(request.GET.get('end'))
+        limit = parse_record_limit(request.GET.get('limit'))
+    except ValueError:
+        return JsonResponse({
+            'error': 'Use bbox=west,south,east,north in degrees, ISO start and end, and a positive limit'
+        }, status=400)
+    
+    if south > north:
+        return JsonResponse({'error': 'Bounding box south is above north'}, status=400)
+    
+    # One record past the limit tells whether the result was cut
+    records = records_in_bbox(data_file, west, south, east, north, start, end).values_list(
+        'id', 'technician__technician_id', 'trip_type', 'latitude', 'longitude', 'created_at'
+    )[:limit + 1]
+    
+    records = [{
+        'id': record_id,
+        'technician_id': technician_id,
+        'trip_type': trip_type,
+        'lat': lat,
+        'long': long,
+        'time': created_at.strftime('%Y-%m-%d %H:%M:%S'),
+    } for record_id, technician_id, trip_type, lat, long, created_at in records]
+    
+    return JsonResponse({
+        'success': True,
+        'records': records[:limit],
+        'truncated': len(records) > limit
+    })
+
+
+def get_radius_records(request, file_id):
+    """Get trip records within a radius of a point and optional time window as JSON"""
+    data_file = get_object_or_404(DataFile, id=file_id)
+    
+    try:
+        latitude = float(request.GET['lat'])
+        longitude = float(request.GET['long'])
+        radius = float(request.GET['radius'])
+        start = parse_window_bound(request.GET.get('start'))
+        end = parse_window_bound(request.GET.get('end'))
+        limit = parse_record_limit(request.GET.get('limit'))
+    except (KeyError, ValueError):
+        return JsonResponse({
+            'error': 'Use lat and long in degrees, radius in metres, ISO start and end, and a positive limit'
+        }, status=400)
+    
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return JsonResponse({'error': 'Centre is outside valid coordinates'}, status=400)
+    
+    if not 0 < radius <= MAX_RADIUS_METERS:
+        return JsonResponse({'error': f"Radius must be above 0 and at most {MAX_RADIUS_METERS} metres"}, status=400)
+    
+    records = records_within_radius(data_file, latitude, longitude, radius, start, end, limit + 1)
+    
+    return JsonResponse({
+        'success': True,
+        'records': records[:limit],
+        'truncated': len(records) > limit
+    })
+
+
+def get_nearest_technicians(request, file_id):
+    """Get the technicians nearest to a site at a given time as JSON"""
+    data_file = get_object_or_404(DataFile, id=file_id)
+    
+    try:
+        latitude = float(request.GET['lat'])
+        longitude = float(request.GET['long'])
+        moment = parse_window_bound(request.GET.get('time')) or timezone.now()
+        k = int(request.GET.get('k') or DEFAULT_NEAREST_COUNT)
+        radius = float(request.GET['radius']) if request.GET.get('radius') else None
+    except (KeyError, ValueError):
+        return JsonResponse({
+            'error': 'Use lat and long in degrees, an ISO time, a positive k and a radius in metres'
+        }, status=400)
+    
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return JsonResponse({'error': 'Site is outside valid coordinates'}, status=400)
+    
+    if not 1 <= k <= MAX_NEAREST_COUNT:
+        return JsonResponse({'error': f"k must be between 1 and {MAX_NEAREST_COUNT}"}, status=400)
+    
+    if radius is not None and radius <= 0:
+        return JsonResponse({'error': 'Radius must be above 0 metres'}, status=400)
+    
+    result = find_nearest_technicians(data_file, latitude, longitude, moment, k, radius)
+    
+    return JsonResponse({'success': True, **result})
@@ -1,9 +1,11 @@
 from django.shortcuts import render, get_object_or_404
 from django.http import JsonResponse
-from django.db.models import Count
-from dashboard.models import DataFile, Technician, TripRecord
+from dashboard.models import DataFile, Technician, TripRecord, DailyRollup
 from dashboard.forms import TechnicianFilterForm
+from dashboard.utils.rollups import summarize_rollups
+from dashboard.utils.punch_pairs import load_punches, get_shifts, shift_stats, get_worked_hours
 from datetime import datetime
+import numpy as np
 
 
 def technician_logs(request, file_id):
@@ -38,42 +40,30 @@ def get_technician_summary(request, file_id, technician_id):
     data_file = get_object_or_404(DataFile, id=file_id)
     technician = get_object_or_404(Technician, id=technician_id, data_file=data_file)
     
-    # Get all trip records for this technician
-    trip_records = TripRecord.objects.filter(technician=technician, duplicate=False)
-    
-    # Get punch-in and punch-out records
-    punch_in_records = trip_records.filter(trip_type='punch_in')
-    punch_out_records = trip_records.filter(trip_type='punch_out')
-    
-    # Get trip type counts
-    trip_type_counts = trip_records.values('trip_type').annotate(
-        count=Count('id')
-    ).order_by('-count')
+    # Totals over the technician's daily rollups
+    rollups = summarize_rollups(DailyRollup.objects.filter(technician=technician))
+    trip_type_counts = rollups['trip_types']
     
     # Format trip type counts
     trip_types = [
-        {'trip_type': item['trip_type'], 'count': item['count']}
-        for item in trip_type_counts
+        {'trip_type': trip_type, 'count': count}
+        for trip_type, count in sorted(trip_type_counts.items(), key=lambda item: -item[1])
     ]
     
     summary = {
         'technician_id': technician.technician_id,
-        'total_records': trip_records.count(),
-        'punch_in_count': punch_in_records.count(),
-        'punch_out_count': punch_out_records.count(),
+        'total_records': rollups['trip_count'],
+        'punch_in_count': trip_type_counts.get('punch_in', 0),
+        'punch_out_count': trip_type_counts.get('punch_out', 0),
         'trip_types': trip_types
     }
     
     # Get date range if records exist
-    if trip_records.exists():
-        first_record = trip_records.order_by('created_at').first()
-        last_record = trip_records.order_by('created_at').last()
-        
-        if first_record and last_record:
-            summary['date_range'] = {
-                'start': first_record.created_at.strftime('%Y-%m-%d'),
-                'end': last_record.created_at.strftime('%Y-%m-%d')
-            }
+    if rollups['first_event_at'] and rollups['last_event_at']:
+        summary['date_range'] = {
+            'start': rollups['first_event_at'].strftime('%Y-%m-%d'),
+            'end': rollups['last_event_at'].strftime('%Y-%m-%d')
+        }
     
     return JsonResponse(summary)
 
@@ -83,55 +73,68 @@ def get_punch_in_out_data(request, file_id, technician_id):
     data_file = get_object_or_404(DataFile, id=file_id)
     technician = get_object_or_404(Technician, id=technician_id, data_file=data_file)
     
-    # Get punch-in and punch-out records
-    punch_in_records = TripRecord.objects.filter(
-        technician=technician, 
-        trip_type='punch_in',
-        duplicate=False
-    ).order_by('created_at')
-    
-    punch_out_records = TripRecord.objects.filter(
-        technician=technician, 
-        trip_type='punch_out',
-        duplicate=False
-    ).order_by('created_at')
+    # Get punch-in and punch-out records, paired into shifts
+    punches = load_punches(data_file, technician)
+    shifts = get_shifts(punches)
     
     # Group by date
     daily_records = {}
     
-    # Process punch-in records
-    for record in punch_in_records:
-        date_str = record.created_at.strftime('%Y-%m-%d')
-        time_str = record.created_at.strftime('%H:%M:%S')
+    for trip_type, created_at in zip(
+        punches['trip_type'].tolist(),
+        np.datetime_as_string(punches['created_at'].dt.tz_localize(None).to_numpy(dtype='datetime64[s]')).tolist()
+    ):
+        date_str = created_at[:10]
         
         if date_str not in daily_records:
             daily_records[date_str] = {
                 'date': date_str,
                 'punch_in_times': [],
-                'punch_out_times': []
+                'punch_out_times': [],
+                'worked_hours': 0
             }
         
-        daily_records[date_str]['punch_in_times'].append(time_str)
-    
-    # Process punch-out records
-    for record in punch_out_records:
-        date_str = record.created_at.strftime('%Y-%m-%d')
-        time_str = record.created_at.strftime('%H:%M:%S')
-        
-        if date_str not in daily_records:
-            daily_records[date_str] = {
-                'date': date_str,
-                'punch_in_times': [],
-                'punch_out_times': []
-            }
-        
-        daily_records[date_str]['punch_out_times'].append(time_str)
+        daily_records[date_str][f"{trip_type}_times"].append(created_at[11:])
+    
+    # Shift hours count on the day the shift starts
+    shift_list = []
+    
+    for punch_in, punch_out, duration in zip(
+        np.datetime_as_string(shifts['punch_in'].to_numpy(), unit='s').tolist(),
+        np.datetime_as_string(shifts['punch_out'].to_numpy(), unit='s').tolist(),
+        shifts['duration_hours'].tolist()
+    ):
+        daily_records[punch_in[:10]]['worked_hours'] += duration
+        shift_list.append({
+            'punch_in': punch_in.replace('T', ' '),
+            'punch_out': punch_out.replace('T', ' '),
+            'duration_hours': round(duration, 2)
+        })
     
     # Convert to list and sort by date
     result = list(daily_records.values())
     result.sort(key=lambda x: x['date'])
     
-    return JsonResponse({'daily_records': result})
+    for record in result:
+        record['worked_hours'] = round(record['worked_hours'], 2)
+    
+    return JsonResponse({
+        'daily_records': result,
+        'shifts': shift_list,
+        'stats': shift_stats(shifts['duration_hours'])
+    })
+
+
+def get_worked_hours_data(request, file_id):
+    """Get worked hours of all technicians as JSON"""
+    data_file = get_object_or_404(DataFile, id=file_id)
+    
+    worked_hours = get_worked_hours(data_file)
+    
+    return JsonResponse({
+        'success': True,
+        **worked_hours
+    })
 
 
 def get_timeline_data(request, file_id, technician_id):
@@ -89,6 +89,23 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # WAL lets readers, such as progress polling, run alongside an
+        # ingest's write transaction. It persists in the database file, so
+        # setting it on every new connection is a no-op once done
+        'OPTIONS': {
+            'init_command': 'PRAGMA journal_mode=WAL;',
+        },
+    }
+}
+
+# Cache
+# File-based so the ingest worker and web processes share job progress
+# while a bulk load holds its transaction open
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
     }
 }
 
@@ -156,6 +173,59 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Write uploads straight to a temporary file instead of buffering them in
+# memory, so workbooks larger than available RAM can be uploaded and streamed.
+# The content is hashed on the way so repeated uploads can be recognised.
+FILE_UPLOAD_HANDLERS = [
+    'dashboard.utils.upload_cache.HashingFileUploadHandler',
+]
+
+# Largest upload accepted by FileUploadForm, in bytes
+MAX_UPLOAD_SIZE = 4 * 1024 * 1024 * 1024
+
+# Trace peak memory per ingest stage with tracemalloc. This slows ingestion
+# down several times, so by default the process's peak RSS is recorded
+# instead; wall time, row and query counts are always recorded.
+INGEST_PROFILE_MEMORY = False
+
+# Near-duplicate detection: a trip record within this distance and time of an
+# earlier record of the same technician and trip type is flagged as a
+# duplicate. Set either value to 0 to turn the check off.
+NEAR_DUPLICATE_DISTANCE_METERS = 10
+NEAR_DUPLICATE_SECONDS = 30
+
+# Worker processes used by calculate_technician_distances on large files.
+# 1 keeps the computation in the request process.
+DISTANCE_WORKERS = 1
+
+# Map routes are simplified so points closer than this many pixels to the
+# drawn line are dropped, and never carry more than MAP_MAX_POINTS points.
+# Points of the event trip types are always kept.
+MAP_SIMPLIFY_PIXELS = 1.0
+MAP_MAX_POINTS = 5000
+MAP_EVENT_TRIP_TYPES = ['punch_in', 'pickup', 'delivery']
+
+# Worker processes rendering reports in bulk report generation.
+# 1 renders in the request process.
+REPORT_WORKERS = min(4, os.cpu_count() or 1)
+
+# PDF reports render on a shared pool of this many threads per process, so
+# PDF work cannot take over every request thread. A report waits at most
+# PDF_RENDER_TIMEOUT seconds for its PDF before falling back to HTML.
+PDF_RENDER_WORKERS = max(1, (os.cpu_count() or 1) // 2)
+PDF_RENDER_TIMEOUT = 120
+
+# Punch pairs longer than this many hours are treated as a missed
+# punch-out rather than a shift. 0 turns the limit off.
+MAX_SHIFT_HOURS = 24
+
+# Nearest-technician lookups cache one tree of last positions per bucket
+# of this many minutes, and apply records made within the bucket up to the
+# lookup time on top. Technicians not seen for NEAREST_MAX_AGE_HOURS are
+# left out, 0 keeps every technician.
+NEAREST_BUCKET_MINUTES = 15
+NEAREST_MAX_AGE_HOURS = 12
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 